@@ -30,6 +30,8 @@ URLS = {
     ("3.5", "32"): BASE_URL + "3.5.4/python-3.5.4.exe",
     ("3.6", "64"): BASE_URL + "3.6.2/python-3.6.2-amd64.exe",
     ("3.6", "32"): BASE_URL + "3.6.2/python-3.6.2.exe",
+    ("3.7", "64"): BASE_URL + "3.7.9/python-3.7.9-amd64.exe",
+    ("3.7", "32"): BASE_URL + "3.7.9/python-3.7.9.exe",
 }
 INSTALL_CMD = {
     # Commands are allowed to fail only if they are not the last command.  Eg: uninstall (/x) allowed to fail.
@@ -47,6 +49,7 @@ INSTALL_CMD = {
     ],
     "3.5": [["{path}", "/quiet", "TargetDir={home}"]],
     "3.6": [["{path}", "/quiet", "TargetDir={home}"]],
+    "3.7": [["{path}", "/quiet", "TargetDir={home}"]],
 }
 
 
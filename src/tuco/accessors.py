@@ -0,0 +1,300 @@
+"""Read and write state fields of different kinds of holders."""
+import copy
+import functools
+import keyword
+import operator
+import threading
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Tuple, Type  # noqa
+
+from tuco.exceptions import TucoInvalidStateHolderError
+
+__all__ = (
+    "AttributeAccessor",
+    "DictAccessor",
+    "HolderAccessor",
+    "NamedTupleAccessor",
+    "SlotsAccessor",
+    "get_accessor",
+)
+
+_MISSING = object()
+
+
+class HolderAccessor:
+    """Protocol used by state machines to reach the state, date and id fields of their holder.
+
+    Set ``FSM.holder_accessor`` to an instance to use it for every holder of a state machine, by default an accessor
+    is chosen from the holder type with `get_accessor`. Accessors whose holders are immutable return a new holder
+    from `set` and the state machine replaces its ``container_object`` with it.
+    """
+
+    def has(self, holder, field: str) -> bool:
+        """Check if a holder has a field."""
+        return self.get(holder, field, _MISSING) is not _MISSING
+
+    def get(self, holder, field: str, default: Any = _MISSING) -> Any:
+        """Return a field value, or the default when given and the field is missing."""
+        raise NotImplementedError()
+
+    def set(self, holder, field: str, value: Any):
+        """Change a field and return the holder."""
+        raise NotImplementedError()
+
+    def snapshot(self, holder):
+        """Return a copy of the holder sent to on change as the old state."""
+        return copy.copy(holder)
+
+    def command_snapshot(self, holder):
+        """Return a copy commands with a deadline can change without touching the holder.
+
+        None means the holder cannot be copied that way, commands then receive the holder itself.
+        """
+        snapshot = self.snapshot(holder)
+        return snapshot if type(snapshot) is type(holder) else None
+
+    def apply(self, holder, changed):
+        """Copy the fields a command changed on a `command_snapshot` back to the holder and return it."""
+        raise NotImplementedError()
+
+    def get_source(self, owner: str, field: str) -> str:
+        """Return a Python expression reading a field, used by `tuco.codegen`."""
+        return "ACCESSOR.get({}, {!r})".format(owner, field)
+
+    def set_source(self, owner: str, field: str, value: str) -> str:
+        """Return a Python statement writing a field and keeping ``owner`` up to date, used by `tuco.codegen`."""
+        return "{0} = self.container_object = ACCESSOR.set({0}, {1!r}, {2})".format(owner, field, value)
+
+
+class AttributeAccessor(HolderAccessor):
+    """Access fields as attributes, works for plain objects, dataclasses and ORM models."""
+
+    def __init__(self, isolated_copies: bool = True) -> None:
+        """Initialize default values.
+
+        :param isolated_copies: Shallow copies of the holders are independent objects. Set it to ``False`` for models
+            whose copies share state with the original, SQLAlchemy models are always detected.
+        """
+        self.isolated_copies = isolated_copies
+
+    def has(self, holder, field: str) -> bool:
+        """Check if a holder has an attribute."""
+        return hasattr(holder, field)
+
+    def get(self, holder, field: str, default: Any = _MISSING) -> Any:
+        """Return an attribute."""
+        if default is _MISSING:
+            return getattr(holder, field)
+        return getattr(holder, field, default)
+
+    def set(self, holder, field: str, value: Any):
+        """Change an attribute."""
+        setattr(holder, field, value)
+        return holder
+
+    def command_snapshot(self, holder):
+        """Copy the holder unless its copies are not isolated from it."""
+        if not self.isolated_copies or hasattr(holder, "_sa_instance_state"):
+            return None
+        return super().command_snapshot(holder)
+
+    def apply(self, holder, changed):
+        """Set the attributes and slots that differ, through setattr so ORMs see the changes."""
+        _check_snapshot(holder, changed)
+        fields = dict(getattr(changed, "__dict__", {}))
+        for field in _slot_descriptors(type(holder)):
+            value = getattr(changed, field, _MISSING)
+            if value is not _MISSING:
+                fields[field] = value
+        for field, value in fields.items():
+            if getattr(holder, field, _MISSING) is not value:
+                setattr(holder, field, value)
+        return holder
+
+    def get_source(self, owner: str, field: str) -> str:
+        """Read the attribute directly when its name allows it."""
+        if _is_name(field):
+            return "{}.{}".format(owner, field)
+        return "getattr({}, {!r})".format(owner, field)
+
+    def set_source(self, owner: str, field: str, value: str) -> str:
+        """Write the attribute directly when its name allows it."""
+        if _is_name(field):
+            return "{}.{} = {}".format(owner, field, value)
+        return "setattr({}, {!r}, {})".format(owner, field, value)
+
+
+class SlotsAccessor(AttributeAccessor):
+    """Access fields through the slot descriptors of a class, skipping the attribute lookup of each access."""
+
+    def __init__(self, holder_class: type) -> None:
+        """Resolve the slot descriptors of the class and its bases once."""
+        super().__init__()
+        self.holder_class = holder_class
+        self._slots = _slot_descriptors(holder_class)
+
+    def get(self, holder, field: str, default: Any = _MISSING) -> Any:
+        """Return a slot value."""
+        slot = self._slots.get(field)
+        if slot is None:
+            return super().get(holder, field, default)
+        try:
+            return slot.__get__(holder)
+        except AttributeError:
+            if default is _MISSING:
+                raise
+            return default
+
+    def set(self, holder, field: str, value: Any):
+        """Change a slot value."""
+        slot = self._slots.get(field)
+        if slot is None:
+            return super().set(holder, field, value)
+        slot.__set__(holder, value)
+        return holder
+
+    def apply(self, holder, changed):
+        """Set the slots that differ."""
+        _check_snapshot(holder, changed)
+        for field, slot in self._slots.items():
+            value = getattr(changed, field, _MISSING)
+            if value is not _MISSING and getattr(holder, field, _MISSING) is not value:
+                slot.__set__(holder, value)
+        return holder
+
+
+class DictAccessor(HolderAccessor):
+    """Access fields as keys, for dicts decoded from JSON payloads or Redis hashes."""
+
+    def __init__(self) -> None:
+        """Prepare the item getters."""
+        self._getters = {}  # type: Dict[str, operator.itemgetter]
+
+    def has(self, holder, field: str) -> bool:
+        """Check if a key exists."""
+        return field in holder
+
+    def get(self, holder, field: str, default: Any = _MISSING) -> Any:
+        """Return a key."""
+        if default is not _MISSING:
+            return holder.get(field, default)
+        getter = self._getters.get(field)
+        if getter is None:
+            getter = self._getters[field] = operator.itemgetter(field)
+        return getter(holder)
+
+    def set(self, holder, field: str, value: Any):
+        """Change a key."""
+        holder[field] = value
+        return holder
+
+    def snapshot(self, holder):
+        """Copy the mapping."""
+        return dict(holder)
+
+    def apply(self, holder, changed):
+        """Set the keys that differ."""
+        for field, value in changed.items():
+            if holder.get(field, _MISSING) is not value:
+                holder[field] = value
+        return holder
+
+    def get_source(self, owner: str, field: str) -> str:
+        """Subscript the mapping."""
+        return "{}[{!r}]".format(owner, field)
+
+    def set_source(self, owner: str, field: str, value: str) -> str:
+        """Assign the key."""
+        return "{}[{!r}] = {}".format(owner, field, value)
+
+
+class NamedTupleAccessor(HolderAccessor):
+    """Access fields of namedtuples by index, changes build a new tuple with ``_replace``."""
+
+    def __init__(self, holder_class: type) -> None:
+        """Resolve the index of each field once."""
+        self.holder_class = holder_class
+        self._fields = getattr(holder_class, "_fields")  # type: Tuple[str, ...]
+        self._getters = {name: operator.itemgetter(index) for index, name in enumerate(self._fields)}
+
+    def has(self, holder, field: str) -> bool:
+        """Check if the tuple has a field."""
+        return field in self._getters
+
+    def get(self, holder, field: str, default: Any = _MISSING) -> Any:
+        """Return a field by index."""
+        getter = self._getters.get(field)
+        if getter is not None:
+            return getter(holder)
+        if default is _MISSING:
+            raise AttributeError(field)
+        return default
+
+    def set(self, holder, field: str, value: Any):
+        """Return a copy of the tuple with the field changed."""
+        return holder._replace(**{field: value})
+
+    def snapshot(self, holder):
+        """Tuples never change, the holder itself is the snapshot."""
+        return holder
+
+    def apply(self, holder, changed):
+        """Nothing can change a tuple."""
+        return holder
+
+    def get_source(self, owner: str, field: str) -> str:
+        """Subscript the tuple."""
+        return "{}[{}]".format(owner, self._fields.index(field))
+
+
+_accessors = {}  # type: Dict[type, HolderAccessor]
+_accessors_lock = threading.Lock()
+
+
+def get_accessor(holder_class: type) -> HolderAccessor:
+    """Return the accessor used by default for holders of a class, accessors are created once per class."""
+    accessor = _accessors.get(holder_class)
+    if accessor is not None:
+        return accessor
+
+    if issubclass(holder_class, tuple) and hasattr(holder_class, "_fields"):
+        accessor = NamedTupleAccessor(holder_class)
+    elif issubclass(holder_class, MutableMapping):
+        accessor = DictAccessor()
+    elif issubclass(holder_class, Mapping):
+        raise TucoInvalidStateHolderError("Read-only mapping {!r} cannot hold states.".format(holder_class))
+    elif "__slots__" in holder_class.__dict__ and holder_class.__dictoffset__ == 0:
+        accessor = SlotsAccessor(holder_class)
+    else:
+        accessor = AttributeAccessor()
+
+    with _accessors_lock:
+        return _accessors.setdefault(holder_class, accessor)
+
+
+@functools.lru_cache(maxsize=None)
+def _slot_descriptors(holder_class: type) -> Dict[str, Any]:
+    """Return the slot descriptors of a class and all its bases by attribute name."""
+    descriptors = {}  # type: Dict[str, Any]
+    for klass in reversed(holder_class.__mro__):
+        slots = klass.__dict__.get("__slots__", ())
+        for name in (slots,) if isinstance(slots, str) else slots:
+            if name in ("__dict__", "__weakref__"):
+                continue
+            if name.startswith("__") and not name.endswith("__"):
+                # Private names are mangled with the name of the class defining them.
+                name = "_{}{}".format(klass.__name__.lstrip("_"), name)
+            if name in klass.__dict__:
+                descriptors[name] = klass.__dict__[name]
+    return descriptors
+
+
+def _check_snapshot(holder, changed) -> None:
+    """Refuse to apply a snapshot that is not a copy of the holder."""
+    if type(changed) is not type(holder):
+        raise TypeError("Cannot apply a {!r} snapshot to a {!r} holder.".format(type(changed), type(holder)))
+
+
+def _is_name(field: str) -> bool:
+    """Check if a field can be written as a plain attribute in generated code."""
+    return field.isidentifier() and not keyword.iskeyword(field)
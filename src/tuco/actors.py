@@ -0,0 +1,90 @@
+"""Serialize events per holder by routing them to dedicated worker threads."""
+import queue
+import threading
+import zlib
+from concurrent.futures import Future
+from typing import Callable, List, Optional  # noqa
+
+from tuco.exceptions import TucoDoNotLockError
+
+__all__ = ("ActorDispatcher",)
+
+
+class ActorDispatcher:
+    """Route events to one of N workers chosen by hashing the holder lock key.
+
+    All events of a holder go to the same worker and run one after another in submission order, so they never
+    contend for a lock, while different holders run in parallel. Events run without taking the state machine lock:
+    every producer touching these holders must submit through the same dispatcher.
+    """
+
+    def __init__(self, fsm_class, workers: int = 8, load_holder: Optional[Callable[[object], object]] = None) -> None:
+        """Start the workers.
+
+        :param load_holder: When given, `submit` receives holder ids and the holder is loaded by the worker right
+            before its event runs, so it always sees the changes of previous events.
+        """
+        self.fsm_class = fsm_class
+        self.load_holder = load_holder
+        self._queues = [queue.Queue() for _ in range(workers)]  # type: List[queue.Queue]
+        self._workers = [
+            threading.Thread(target=self._run, args=(work,), name="tuco-actor-{}".format(number), daemon=True)
+            for number, work in enumerate(self._queues)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, holder, event_name, *args, **kwargs) -> Future:
+        """Queue an event for a holder (or holder id when loading holders) and return a future of `FSM.trigger`."""
+        future = Future()  # type: Future
+        self._queues[self.route(holder)].put((future, holder, event_name, args, kwargs))
+        return future
+
+    def route(self, holder) -> int:
+        """Return the worker number in charge of a holder."""
+        if self.load_holder:
+            holder_id = holder
+        else:
+            accessor = self.fsm_class.get_holder_accessor(type(holder))
+            holder_id = accessor.get(holder, self.fsm_class.id_field, None)
+        try:
+            key = self.fsm_class.lock_class.build_hash_key(self.fsm_class, holder_id)
+        except TucoDoNotLockError:
+            # Unsaved holders have no id, the object itself is the only thing identifying them.
+            return id(holder) % len(self._queues)
+        return zlib.crc32(key.encode()) % len(self._queues)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers once they processed what was already submitted."""
+        for work in self._queues:
+            work.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def __enter__(self) -> "ActorDispatcher":
+        """Use the dispatcher as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Wait for submitted events and stop the workers."""
+        self.shutdown()
+
+    def _run(self, work: queue.Queue) -> None:
+        """Process events of the holders routed to this worker."""
+        while True:
+            item = work.get()
+            if item is None:
+                return
+
+            future, holder, event_name, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.load_holder is not None:
+                    holder = self.load_holder(holder)
+                result = self.fsm_class(holder).trigger(event_name, *args, **kwargs)
+            except Exception as e:  # noqa: B902
+                future.set_exception(e)
+            else:
+                future.set_result(result)
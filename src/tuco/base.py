@@ -1,25 +1,50 @@
 """Base classes to be used in FSM."""
-import copy
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError  # noqa
 from datetime import datetime
-from typing import Dict, Iterator, List, Tuple, Type  # noqa
-
-import pytz
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type  # noqa
 
+from tuco.accessors import AttributeAccessor, HolderAccessor, get_accessor  # noqa
+from tuco.clocks import BaseClock  # noqa
 from tuco.exceptions import (
     TucoAlreadyLockedError,
+    TucoCommandTimeoutError,
+    TucoEventNotAllowedError,
     TucoEventNotFoundError,
     TucoInvalidStateChangeError,
     TucoInvalidStateHolderError,
 )
+from tuco.journal import TIMEOUT_EVENT, TransitionJournal  # noqa
 from tuco.locks import MemoryLock
 from tuco.locks.base import BaseLock  # noqa
+from tuco.mailbox import Mailbox  # noqa
 from tuco.meta import FSMBase
-from tuco.properties import Event, FinalState, State, Timeout
+from tuco.outbox.base import BaseOutbox, DeferredCommand  # noqa
+from tuco.profiler import SlowTransitionProfiler  # noqa
+from tuco.properties import Deferred, Event, FinalState, State, Timeout
+from tuco.replay import TraceRecorder  # noqa
+from tuco.timeout_stores.base import BaseTimeoutStore  # noqa
+from tuco.utils import to_naive_utc
 
 __all__ = ("FSM",)
 
 mockable_utcnow = datetime.utcnow  # Easier to write tests
 
+_command_executors = {}  # type: Dict[type, Executor]
+_command_executors_lock = threading.Lock()
+
+
+def _get_command_executor(fsm_class) -> Executor:
+    """Create the thread pool running commands with a deadline of a state machine class on first use."""
+    with _command_executors_lock:
+        executor = _command_executors.get(fsm_class)
+        if executor is None:
+            executor = _command_executors[fsm_class] = ThreadPoolExecutor(
+                max_workers=fsm_class.command_workers, thread_name_prefix="tuco-{}".format(fsm_class.__name__)
+            )
+        return executor
+
 
 class FSM(metaclass=FSMBase):
     """Class that handle event transitions.
@@ -36,16 +61,63 @@ class FSM(metaclass=FSMBase):
     fatal_state = "fatal_error"
 
     lock_class = MemoryLock  # type: Type[BaseLock]
+    #: Name used in lock keys instead of the class name, state machines sharing it exclude each other on a holder
+    lock_name = None  # type: Optional[str]
+    #: How state, date and id fields are read from holders, chosen from the holder type when None
+    holder_accessor = None  # type: Optional[HolderAccessor]
+    #: Where `tuco.properties.Deferred` callbacks are recorded, they run inline when there is no outbox
+    outbox = None  # type: Optional[BaseOutbox]
+    #: Where commands of events and timeouts with a deadline run, a thread pool of the class when None
+    command_executor = None  # type: Optional[Executor]
+    #: Threads of the pool created when ``command_executor`` is None
+    command_workers = 4
+    #: Keeps the due date of holders whose current state has a timeout
+    timeout_store = None  # type: Optional[BaseTimeoutStore]
+    #: Receives every transition, see `tuco.journal.TransitionJournal`
+    journal = None  # type: Optional[TransitionJournal]
+    #: Queues contended events for the thread holding the lock instead of failing, see `tuco.mailbox.Mailbox`
+    mailbox = None  # type: Optional[Mailbox]
+    #: Writes every trigger and fired timeout to a trace, see `tuco.replay.TraceRecorder`
+    recorder = None  # type: Optional[TraceRecorder]
+    #: Keeps call profiles of slow transitions, see `tuco.profiler.SlowTransitionProfiler`
+    profiler = None  # type: Optional[SlowTransitionProfiler]
+    #: Where `current_time` comes from, `datetime.utcnow` when None, see `tuco.clocks`
+    clock = None  # type: Optional[BaseClock]
+    #: Replace the hot methods by code generated for this class, see `get_generated_source`
+    compile_fsm = False
     _states = None  # type: Dict[str, State]
+    _transitions = {}  # type: Dict[str, Dict[Any, Event]]
+    _generated_source = None  # type: Optional[str]
+    #: Holder type and accessor resolved by `get_holder_accessor`, in the class dict of each class
+    _resolved_accessor = None  # type: Optional[Tuple[type, HolderAccessor]]
+
+    #: Snapshot taken by `run_events` while on change calls are being coalesced
+    _coalesced_snapshot = None  # type: Optional[object]
+    _coalesced_changes = 0
+    #: Event or timeout being executed, so transitions can be attributed to it
+    _active_transition = None  # type: Optional[Any]
 
     def __init__(self, container_object) -> None:
         """Initialize the container object with the initial state."""
         self.container_object = container_object
+        self._deferred_commands = []  # type: List[DeferredCommand]
+        accessor = self.get_holder_accessor(type(container_object))
+        #: The resolved accessor, ``holder_accessor`` is only optional on the class
+        self._accessor = self.holder_accessor = accessor  # type: HolderAccessor
+        if self._generated_source is not None and not isinstance(accessor, AttributeAccessor):
+            if self.__class__.holder_accessor is None:
+                raise TucoInvalidStateHolderError(
+                    "Compiled {!r} needs holder_accessor to be set for {!r} holders.".format(
+                        self.__class__, type(container_object)
+                    )
+                )
         for field in (self.state_attribute, self.date_attribute, self.id_field):
-            if not hasattr(container_object, field):
+            if not accessor.has(container_object, field):
                 raise TucoInvalidStateHolderError(
                     "Required field {!r} not found inside {!r}.".format(field, container_object)
                 )
+        if self.journal is not None:
+            self.journal.check(self)
         if self.current_state is None:
             self.current_state = self.initial_state
 
@@ -53,7 +125,10 @@ class FSM(metaclass=FSMBase):
 
     def __enter__(self) -> "FSM":
         """Lock the state machine."""
-        self.lock.lock()
+        if self.mailbox is not None:
+            self.mailbox.acquire(self)
+        else:
+            self.lock.lock()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -61,7 +136,10 @@ class FSM(metaclass=FSMBase):
         if exc_type and issubclass(exc_type, TucoAlreadyLockedError):
             return
 
-        self.lock.unlock()
+        if self.mailbox is not None:
+            self.mailbox.release(self)
+        else:
+            self.lock.unlock()
 
     def __repr__(self) -> str:
         """Basic representation."""
@@ -69,46 +147,89 @@ class FSM(metaclass=FSMBase):
             self.__class__.__name__,
             self.current_state,
             self.container_object.__class__.__name__,
-            getattr(self.container_object, self.id_field),
+            self.holder_id,
         )
 
     @property
     def current_time(self) -> datetime:
-        """Return utcnow and should be extended if you care about time zone or something else."""
+        """Return the time of the class clock, or utcnow without one, extend it if you care about time zones."""
+        if self.clock is not None:
+            return self.clock.now()
         return mockable_utcnow()
 
     @property
     def current_state_date(self) -> datetime:
         """Return current date stored in object."""
-        return getattr(self.container_object, self.date_attribute)
+        return self._accessor.get(self.container_object, self.date_attribute)
+
+    @property
+    def holder_id(self) -> Any:
+        """Return the id stored in object, None when it has none."""
+        return self._accessor.get(self.container_object, self.id_field, None)
 
     @property
     def current_state(self) -> str:
         """Return the current state stored in object."""
-        return getattr(self.container_object, self.state_attribute)
+        return self._accessor.get(self.container_object, self.state_attribute)
 
     @current_state.setter
     def current_state(self, new_state) -> None:
         """Set a state on container object."""
-        call_on_change = bool(self.current_state)
-        old_state = copy.copy(self.container_object)
-        if new_state != self.fatal_state:
-            if not self.state_allowed(new_state):
-                raise TucoInvalidStateChangeError(
-                    "Old state {!r}, new state {!r}.".format(self.current_state, new_state)
-                )
-
-            setattr(self.container_object, self.state_attribute, new_state)
-            setattr(self.container_object, self.date_attribute, self.current_time)
-            for command in self.current_state_instance.on_enter:
-                command(self.container_object)
+        previous_state = self.current_state
+        if self._coalesced_snapshot is not None:
+            call_on_change = False
+            self._coalesced_changes += 1
         else:
-            setattr(self.container_object, self.state_attribute, new_state)
-            setattr(self.container_object, self.date_attribute, self.current_time)
+            call_on_change = bool(previous_state)
+        accessor = self._accessor
+        old_state = accessor.snapshot(self.container_object) if call_on_change else None
+        if self.journal is not None:
+            self.journal.prepare(self, previous_state, new_state)
+        outbox = self.outbox
+        previous_date = self.current_state_date if outbox is not None else None
+        try:
+            if new_state != self.fatal_state:
+                if not self.state_allowed(new_state):
+                    raise TucoInvalidStateChangeError(
+                        "Old state {!r}, new state {!r}.".format(self.current_state, new_state)
+                    )
+
+                self._set_state_fields(accessor, new_state)
+                for command in self.current_state_instance.on_enter:
+                    self._run_command(command, (), {})
+            else:
+                self._set_state_fields(accessor, new_state)
+
+            if outbox is not None and self._deferred_commands:
+                try:
+                    outbox.record(self.container_object, self._deferred_commands)
+                except Exception:
+                    self._restore_state_fields(accessor, previous_state, previous_date)
+                    raise
+        finally:
+            if self._deferred_commands:
+                # A new list, the outbox may keep the recorded one.
+                self._deferred_commands = []
+
+        if self.timeout_store is not None:
+            self.timeout_store.track(self)
+
+        if self.journal is not None:
+            self.journal.append(self, previous_state, new_state)
 
         if call_on_change:
             self._call_on_change(old_state, self.container_object)
 
+    def _set_state_fields(self, accessor, new_state) -> None:
+        """Store a state and its date, immutable holders are replaced by the changed copy."""
+        holder = accessor.set(self.container_object, self.state_attribute, new_state)
+        self.container_object = accessor.set(holder, self.date_attribute, self.current_time)
+
+    def _restore_state_fields(self, accessor, state, date) -> None:
+        """Put back the state and date a failed transition overwrote."""
+        holder = accessor.set(self.container_object, self.state_attribute, state)
+        self.container_object = accessor.set(holder, self.date_attribute, date)
+
     def state_allowed(self, state_name) -> bool:
         """Check if the transition to the new state is allowed."""
         if self.current_state is None and state_name == self.initial_state:
@@ -120,7 +241,8 @@ class FSM(metaclass=FSMBase):
         if self.current_state_instance.timeout and self.current_state_instance.timeout.target_state == state_name:
             return True
 
-        if any(event for event in self.possible_events if event.target_state == state_name):
+        # Guards were checked before the commands, they may not hold anymore once the commands ran.
+        if any(event.target_state == state_name for event in self.possible_events_from_state(self.current_state)):
             return True
 
         current_state = self.current_state_instance
@@ -140,8 +262,13 @@ class FSM(metaclass=FSMBase):
 
     @property
     def possible_events(self) -> List[Event]:
-        """Return all possible events for the current state."""
-        return self.possible_events_from_state(self.current_state)
+        """Return the events of the current state whose guards pass, each guard is evaluated once."""
+        memo = {}  # type: Dict[Callable, bool]
+        return [
+            event
+            for event in self.possible_events_from_state(self.current_state)
+            if not event.guards or self._guards_pass(event, memo)
+        ]
 
     @classmethod
     def possible_events_from_state(cls, state_name) -> List[Event]:
@@ -154,62 +281,214 @@ class FSM(metaclass=FSMBase):
 
     def _get_event(self, event_name) -> Event:
         """Get an event inside current state based on it's name."""
-        for event in self.possible_events:
-            if event.event_name == event_name:
-                return event
+        event = self._transitions.get(self.current_state, {}).get(event_name)
+        if event is not None:
+            return event
 
         raise TucoEventNotFoundError(
             "Event {!r} not found in {!r} on current state {!r}".format(
-                event_name, [event.event_name for event in self.possible_events], self.current_state
+                event_name,
+                [event.event_name for event in self.possible_events_from_state(self.current_state)],
+                self.current_state,
             )
         )
 
     def event_allowed(self, event_name) -> bool:
-        """Check if is possible to run an event.
+        """Check if is possible to run an event, guards included.
 
         :param event_name: Event to check.
         """
         try:
-            self._get_event(event_name)
+            event = self._get_event(event_name)
         except TucoEventNotFoundError:
             return False
 
+        return self._guards_pass(event)
+
+    def _guards_pass(self, event, memo: Optional[Dict[Callable, bool]] = None) -> bool:
+        """Evaluate the guards of an event, ``memo`` keeps the results of guards shared by several events."""
+        for guard in event.guards:
+            if memo is None:
+                passed = guard(self.container_object)
+            else:
+                passed = memo.get(guard)
+                if passed is None:
+                    passed = memo[guard] = bool(guard(self.container_object))
+            if not passed:
+                return False
         return True
 
     def _trigger_error(self, event) -> None:
-        """Search for an error handler inside event, and then inside state."""
-        if event.error:
-            error = event.error
-        else:
-            error = self._states[self.current_state].error
-            if not error:
-                return
+        """Search for an error handler inside event (or timeout), and then inside state."""
+        error = getattr(event, "error", None) or self._states[self.current_state].error
+        if not error:
+            return
 
         for command in error.commands:
-            command(self.container_object)
+            self._run_command(command, (), {})
 
         self.current_state = error.target_state
 
+    def _run_command(self, command, args, kwargs, deadline=None):
+        """Run a command, or keep it to be recorded in the outbox when the transition is committed.
+
+        :param deadline: A `time.monotonic` value, when given the command runs in the command executor and
+            `TucoCommandTimeoutError` is raised if it is still running at that time. Running commands cannot be
+            stopped and keep their thread. When the accessor can copy the holder, the command works on a copy whose
+            changes are applied only if it finishes in time, so a late command cannot change a holder that already
+            went to the error state.
+        """
+        if isinstance(command, Deferred) and self.outbox is not None:
+            self._deferred_commands.append((command.callback, args, kwargs))
+            return True
+        if deadline is None:
+            return command(self.container_object, *args, **kwargs)
+
+        executor = self.command_executor or _get_command_executor(self.__class__)
+        snapshot = self._accessor.command_snapshot(self.container_object)
+        future = executor.submit(command, self.container_object if snapshot is None else snapshot, *args, **kwargs)
+        try:
+            result = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            raise TucoCommandTimeoutError("Command {!r} did not finish before its deadline.".format(command)) from None
+        if snapshot is not None:
+            self.container_object = self._accessor.apply(self.container_object, snapshot)
+        return result
+
+    @staticmethod
+    def _get_deadline(event) -> Optional[float]:
+        """Turn the deadline of an event or timeout into a `time.monotonic` value."""
+        if event.deadline is None:
+            return None
+        return time.monotonic() + event.deadline
+
     def trigger(self, event_name, *args, **kwargs) -> bool:
         """Trigger an event and call its commands with specified arguments..
 
         :param event_name: Event to execute.
         """
-        event = self._get_event(event_name)
-        for command in event.commands:
-            try:
-                return_value = command(self.container_object, *args, **kwargs)
-            except Exception as e:
-                self._call_on_error(e, event.target_state)
-                raise
-
-            if not return_value:
-                self._trigger_error(event)
-                return False
+        if self.recorder is not None or self.profiler is not None:
+            return self._observe(
+                event_name, args, kwargs, lambda: self._execute(self._get_event(event_name), args, kwargs)
+            )
+        return self._execute(self._get_event(event_name), args, kwargs)
+
+    def _observe(self, event_name, args, kwargs, call) -> bool:
+        """Run a transition through the profiler and the recorder."""
+        recorder, profiler = self.recorder, self.profiler
+        if profiler is not None:
+            profiled = call
+            call = lambda: profiler.profile(self, event_name, profiled)  # noqa: E731
+        if recorder is None:
+            return call()
+        return recorder.record(self, event_name, args, kwargs, call)
+
+    def _execute(self, transition, args, kwargs, check_results=True) -> bool:
+        """Run the commands of an event or timeout and move to its target state.
+
+        :param check_results: Route to errors when a command returns a falsy value, timeouts ignore return values.
+        """
+        if getattr(transition, "guards", None) and not self._guards_pass(transition):
+            raise TucoEventNotAllowedError(
+                "Event {!r} refused by its guards on current state {!r}".format(
+                    transition.event_name, self.current_state
+                )
+            )
 
-        self.current_state = event.target_state
+        self._active_transition = transition
+        try:
+            deadline = self._get_deadline(transition)
+            for command in transition.commands:
+                try:
+                    return_value = self._run_command(command, args, kwargs, deadline)
+                except TucoCommandTimeoutError as e:
+                    del self._deferred_commands[:]
+                    self._call_on_error(e, transition.target_state)
+                    self._trigger_error(transition)
+                    return False
+                except Exception as e:
+                    del self._deferred_commands[:]
+                    self._call_on_error(e, transition.target_state)
+                    raise
+
+                if check_results and not return_value:
+                    del self._deferred_commands[:]
+                    self._trigger_error(transition)
+                    return False
+
+            if self.lock.lease_lost is not None:
+                del self._deferred_commands[:]
+                self._call_on_error(self.lock.lease_lost, transition.target_state)
+                raise self.lock.lease_lost
+
+            self.current_state = transition.target_state
+            return True
+        finally:
+            self._active_transition = None
 
-        return True
+    def submit(self, event_name, *args, **kwargs) -> Future:
+        """Trigger an event, or queue it in the mailbox if another thread holds the lock of this holder.
+
+        :return: A future with the result of `trigger`.
+        """
+        if self.mailbox is None:
+            raise RuntimeError("{!r} has no mailbox configured.".format(self.__class__))
+        return self.mailbox.submit(self, event_name, *args, **kwargs)
+
+    def run_events(self, events, on_change_per_step=False) -> bool:
+        """Trigger a sequence of events, stopping at the first one that fails.
+
+        The whole path is validated before any command runs, so an impossible sequence raises
+        `TucoEventNotFoundError` without touching the container object. Failures are routed to errors exactly as in
+        `trigger`. Use it inside ``with fsm:`` to hold the lock once for the whole sequence.
+
+        :param events: Event names, or ``(event_name, args)`` and ``(event_name, args, kwargs)`` tuples.
+        :param on_change_per_step: Call on change after every step instead of once for the whole sequence.
+        """
+        steps = [self._parse_step(step) for step in events]
+        self._validate_path([event_name for event_name, _, _ in steps])
+
+        if on_change_per_step:
+            for event_name, args, kwargs in steps:
+                if not self.trigger(event_name, *args, **kwargs):
+                    return False
+            return True
+
+        self._coalesced_snapshot = self._accessor.snapshot(self.container_object)
+        self._coalesced_changes = 0
+        try:
+            for event_name, args, kwargs in steps:
+                if not self.trigger(event_name, *args, **kwargs):
+                    return False
+            return True
+        finally:
+            old_state, changes = self._coalesced_snapshot, self._coalesced_changes
+            self._coalesced_snapshot, self._coalesced_changes = None, 0
+            if changes:
+                self._call_on_change(old_state, self.container_object)
+
+    @staticmethod
+    def _parse_step(step) -> Tuple[Any, tuple, dict]:
+        """Normalize a `run_events` step into event name, args and kwargs."""
+        if not isinstance(step, tuple):
+            return step, (), {}
+        event_name, args, kwargs = (step + ((), {}))[:3]
+        return event_name, tuple(args), dict(kwargs)
+
+    def _validate_path(self, event_names) -> str:
+        """Walk the compiled transitions from the current state and return the state the path ends in."""
+        state_name = self.current_state
+        for position, event_name in enumerate(event_names):
+            event = self._transitions.get(state_name, {}).get(event_name)
+            if event is None:
+                raise TucoEventNotFoundError(
+                    "Event {!r} (step {}) not found on state {!r} when starting from {!r}".format(
+                        event_name, position, state_name, self.current_state
+                    )
+                )
+            state_name = event.target_state
+        return state_name
 
     def trigger_timeout(self) -> bool:
         """Trigger timeout if it's possible."""
@@ -218,24 +497,38 @@ class FSM(metaclass=FSMBase):
         if not timeout:
             return False
 
-        if datetime.utcnow().replace(tzinfo=pytz.UTC) < (self.current_state_date + timeout.timedelta):
+        if to_naive_utc(self.current_time) < to_naive_utc(self.current_state_date + timeout.timedelta):
             return False
 
-        for command in timeout.commands:
-            try:
-                command(self.container_object)
-            except Exception as e:
-                self._call_on_error(e, timeout.target_state)
-                raise
-
-        self.current_state = timeout.target_state
-        return True
+        if self.recorder is not None or self.profiler is not None:
+            return self._observe(TIMEOUT_EVENT, (), {}, lambda: self._execute(timeout, (), {}, check_results=False))
+        return self._execute(timeout, (), {}, check_results=False)
 
     @classmethod
     def get_all_states(cls) -> Dict[str, State]:
         """List all states for this state machine."""
         return cls._states
 
+    @classmethod
+    def get_holder_accessor(cls, holder_class: type) -> HolderAccessor:
+        """Return ``holder_accessor``, or the accessor of a holder type resolved once per class.
+
+        Classes driving holders of several types resolve the accessor again when the type changes.
+        """
+        if cls.holder_accessor is not None:
+            return cls.holder_accessor
+        resolved = cls.__dict__.get("_resolved_accessor")
+        if resolved is not None and resolved[0] is holder_class:
+            return resolved[1]
+        accessor = get_accessor(holder_class)
+        cls._resolved_accessor = (holder_class, accessor)
+        return accessor
+
+    @classmethod
+    def get_generated_source(cls) -> Optional[str]:
+        """Return the code generated for this state machine, None when ``compile_fsm`` is not set."""
+        return cls._generated_source
+
     @classmethod
     def get_all_timeouts(cls) -> Iterator[Tuple[str, Timeout]]:
         """List all configured timeouts for this state machine."""
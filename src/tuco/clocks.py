@@ -0,0 +1,85 @@
+"""Sources of the current time for state machines."""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, Optional, Union  # noqa
+
+__all__ = ("BaseClock", "SystemClock", "VirtualClock")
+
+
+class BaseClock:
+    """Give the current time as a naive UTC datetime, like `datetime.utcnow`.
+
+    Assign an instance to ``FSM.clock`` to date transitions and decide which timeouts are due.
+    """
+
+    def __init__(self) -> None:
+        """Start without frozen time."""
+        self._frozen = threading.local()
+
+    def now(self) -> datetime:
+        """Return the current time, or the frozen one inside `frozen`."""
+        frozen = getattr(self._frozen, "now", None)
+        return self._now() if frozen is None else frozen
+
+    @contextmanager
+    def frozen(self) -> Iterator[datetime]:
+        """Give the same time to the current thread until the block exits, to stamp a batch of transitions at once."""
+        previous = getattr(self._frozen, "now", None)
+        self._frozen.now = self.now()
+        try:
+            yield self._frozen.now
+        finally:
+            self._frozen.now = previous
+
+    def _now(self) -> datetime:
+        """Read the time from the underlying source."""
+        raise NotImplementedError()
+
+
+class SystemClock(BaseClock):
+    """Wall clock time.
+
+    :param resolution: Seconds for which a read time is reused, avoids a system call per transition in tight loops.
+    """
+
+    def __init__(self, resolution: float = 0.0) -> None:
+        """Set how coarse the clock is."""
+        super().__init__()
+        self.resolution = resolution
+        self._cached = None  # type: Optional[datetime]
+        self._expires = 0.0
+
+    def _now(self) -> datetime:
+        """Read the system time, or the cached one while it is fresh enough."""
+        if not self.resolution:
+            return datetime.utcnow()
+        monotonic = time.monotonic()
+        if self._cached is None or monotonic >= self._expires:
+            self._cached, self._expires = datetime.utcnow(), monotonic + self.resolution
+        return self._cached
+
+
+class VirtualClock(BaseClock):
+    """Time which only moves when told to, for tests going through days of timeouts in an instant."""
+
+    def __init__(self, start: Optional[datetime] = None) -> None:
+        """Start at the given naive UTC date, now by default."""
+        super().__init__()
+        self.current = start or datetime.utcnow()
+
+    def advance(self, delta: Union[timedelta, float]) -> datetime:
+        """Move forward by a timedelta or a number of seconds and return the new time."""
+        if not isinstance(delta, timedelta):
+            delta = timedelta(seconds=delta)
+        self.current += delta
+        return self.current
+
+    def set(self, date: datetime) -> None:
+        """Jump to a date."""
+        self.current = date
+
+    def _now(self) -> datetime:
+        """Return the virtual time."""
+        return self.current
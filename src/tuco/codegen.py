@@ -0,0 +1,241 @@
+"""Generate specialized transition code for state machine classes.
+
+Classes setting ``compile_fsm = True`` get ``trigger``, ``state_allowed``, ``_get_event``, the ``current_state``
+property and the on change/on error dispatchers replaced at class creation by versions with attribute names baked in
+as literals, transition tables precomputed and branches for missing hooks removed. Methods overridden by the class
+are left alone. Use ``FSM.get_generated_source()`` to read the generated code.
+"""
+import copy
+import inspect
+import linecache
+from typing import Any, Dict, FrozenSet, List  # noqa
+
+from tuco.accessors import AttributeAccessor
+from tuco.exceptions import TucoInvalidStateChangeError
+from tuco.properties import FinalState
+
+__all__ = ("compile_fsm_class", "specialize")
+
+GENERATED_METHODS = ("current_state", "state_allowed", "_get_event", "trigger", "_call_on_change", "_call_on_error")
+#: Class attributes the generated code depends on, besides states and hooks
+INPUTS = frozenset(
+    GENERATED_METHODS
+    + ("compile_fsm", "holder_accessor", "initial_state", "fatal_state", "state_attribute", "date_attribute")
+)
+
+
+def _is_generated(value) -> bool:
+    """Check if a class attribute was installed by `compile_fsm_class`."""
+    function = value.fget if isinstance(value, property) else value
+    return getattr(function, "_tuco_generated", False)
+
+
+def _is_stock(fsm_class, name: str) -> bool:
+    """Check that a method still is the one from `FSM` or a generated one, so it can be replaced."""
+    from tuco.base import FSM
+
+    value = inspect.getattr_static(fsm_class, name)
+    return value is FSM.__dict__[name] or _is_generated(value)
+
+
+def _allowed_targets(state) -> FrozenSet[str]:
+    """Return every state reachable from a state, mirroring `FSM.state_allowed`."""
+    if isinstance(state, FinalState):
+        return frozenset()
+
+    targets = {event.target_state for event in state.events}
+    targets.update(event.error.target_state for event in state.events if event.error)
+    if state.timeout:
+        targets.add(state.timeout.target_state)
+    if state.error:
+        targets.add(state.error.target_state)
+    return frozenset(targets)
+
+
+def generate_source(fsm_class) -> str:
+    """Return the source of the specialized methods of a state machine class."""
+    states = fsm_class._states or {}
+    stock = {name: _is_stock(fsm_class, name) for name in GENERATED_METHODS}
+    accessor = fsm_class.holder_accessor or AttributeAccessor()
+    if stock["current_state"]:
+        state = accessor.get_source("holder", fsm_class.state_attribute)
+    else:
+        state = "self.current_state"
+    date = accessor.get_source("holder", fsm_class.date_attribute)
+    set_state = accessor.set_source("holder", fsm_class.state_attribute, "new_state")
+    set_date = accessor.set_source("holder", fsm_class.date_attribute, "self.current_time")
+    snapshot = "copy(holder)" if isinstance(accessor, AttributeAccessor) else "ACCESSOR.snapshot(holder)"
+    has_on_change = getattr(fsm_class, "_on_change_event", None) is not None
+    has_on_error = getattr(fsm_class, "_on_error_event", None) is not None
+    # An overridden _call_on_change may act without a hook, the setter must snapshot and call it like FSM does.
+    calls_on_change = has_on_change or not stock["_call_on_change"]
+
+    lines = []  # type: List[str]
+    if stock["current_state"]:
+        lines += [
+            "def current_state(self):",
+            "    holder = self.container_object",
+            "    return {}".format(state),
+            "",
+            "def set_current_state(self, new_state):",
+            "    holder = self.container_object",
+            "    previous_state = {}".format(state),
+        ]
+        if calls_on_change:
+            lines += [
+                "    if self._coalesced_snapshot is not None:",
+                "        call_on_change = False",
+                "        self._coalesced_changes += 1",
+                "    else:",
+                "        call_on_change = bool(previous_state)",
+                "    old_state = {} if call_on_change else None".format(snapshot),
+            ]
+        else:
+            lines += ["    if self._coalesced_snapshot is not None:", "        self._coalesced_changes += 1"]
+        lines += [
+            "    if self.journal is not None:",
+            "        self.journal.prepare(self, previous_state, new_state)",
+            "    previous_date = {} if self.outbox is not None else None".format(date),
+            "    try:",
+            "        if new_state != {!r}:".format(fsm_class.fatal_state),
+            "            if not self.state_allowed(new_state):",
+            "                raise TucoInvalidStateChangeError(",
+            "                    'Old state {!r}, new state {!r}.'.format(previous_state, new_state)",
+            "                )",
+            "            " + set_state,
+            "            " + set_date,
+            "            on_enter = ON_ENTER.get(new_state)",
+            "            if on_enter:",
+            "                for command in on_enter:",
+            "                    self._run_command(command, (), {})",
+            "        else:",
+            "            " + set_state,
+            "            " + set_date,
+            "        if self._deferred_commands:",
+            "            try:",
+            "                self.outbox.record(holder, self._deferred_commands)",
+            "            except Exception:",
+            "                self._restore_state_fields(self.holder_accessor, previous_state, previous_date)",
+            "                raise",
+            "    finally:",
+            "        if self._deferred_commands:",
+            "            self._deferred_commands = []",
+            "    if self.timeout_store is not None:",
+            "        self.timeout_store.track(self)",
+            "    if self.journal is not None:",
+            "        self.journal.append(self, previous_state, new_state)",
+        ]
+        if calls_on_change:
+            on_change = "_on_change_event" if stock["_call_on_change"] else "_call_on_change"
+            lines += ["    if call_on_change:", "        self.{}(old_state, holder)".format(on_change)]
+        lines.append("")
+
+    if stock["state_allowed"]:
+        lines += [
+            "def state_allowed(self, state_name):",
+            "    holder = self.container_object",
+            "    current_state = {}".format(state),
+            "    if current_state is None and state_name == {!r}:".format(fsm_class.initial_state),
+            "        return True",
+            "    return state_name in ALLOWED[current_state]",
+            "",
+        ]
+
+    if stock["_get_event"]:
+        lines += [
+            "def _get_event(self, event_name):",
+            "    holder = self.container_object",
+            "    try:",
+            "        return TRANSITIONS[{}][event_name]".format(state),
+            "    except (KeyError, TypeError):",
+            "        return FSM._get_event(self, event_name)",
+            "",
+        ]
+
+    if stock["trigger"]:
+        lines += [
+            "def trigger(self, event_name, *args, **kwargs):",
+            "    if self.recorder is not None or self.profiler is not None:",
+            "        return FSM.trigger(self, event_name, *args, **kwargs)",
+            "    event = self._get_event(event_name)",
+            "    if event in PLAIN_EVENTS:",
+            "        self._active_transition = event",
+            "        try:",
+            "            lease_lost = self.lock.lease_lost",
+            "            if lease_lost is not None:",
+            "                self._call_on_error(lease_lost, event.target_state)",
+            "                raise lease_lost",
+            "            self.current_state = event.target_state",
+            "        finally:",
+            "            self._active_transition = None",
+            "        return True",
+            "    return self._execute(event, args, kwargs)",
+            "",
+        ]
+
+    if stock["_call_on_change"]:
+        body = "self._on_change_event(old_state, new_state)" if has_on_change else "pass"
+        lines += ["def _call_on_change(self, old_state, new_state):", "    " + body, ""]
+
+    if stock["_call_on_error"]:
+        body = "self._on_error_event(self.current_state, new_state, exception)" if has_on_error else "pass"
+        lines += ["def _call_on_error(self, exception, new_state):", "    " + body, ""]
+
+    header = "# Generated by tuco for {}.{} ({} states)".format(
+        fsm_class.__module__, fsm_class.__qualname__, len(states)
+    )
+    return "\n".join([header, ""] + lines)
+
+
+def compile_fsm_class(fsm_class) -> None:
+    """Generate, compile and install the specialized methods of a state machine class."""
+    from tuco.base import FSM
+
+    states = fsm_class._states or {}
+    source = generate_source(fsm_class)
+    namespace = {
+        "ALLOWED": {name: _allowed_targets(state) for name, state in states.items()},
+        "ON_ENTER": {name: tuple(state.on_enter) for name, state in states.items() if state.on_enter},
+        "PLAIN_EVENTS": frozenset(
+            event
+            for state_events in fsm_class._transitions.values()
+            for event in state_events.values()
+            if not event.commands and not event.guards and event.deadline is None
+        ),
+        "TRANSITIONS": fsm_class._transitions,
+        "ACCESSOR": fsm_class.holder_accessor,
+        "FSM": FSM,
+        "TucoInvalidStateChangeError": TucoInvalidStateChangeError,
+        "copy": copy.copy,
+    }  # type: Dict[str, Any]
+
+    filename = "<tuco generated {}.{}>".format(fsm_class.__module__, fsm_class.__qualname__)
+    exec(compile(source, filename, "exec"), namespace)  # noqa: S102
+    # Let tracebacks and debuggers show the generated lines.
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+
+    for name in GENERATED_METHODS:
+        function = namespace.get(name)
+        if function is None:
+            continue
+        function._tuco_generated = True
+        if name == "current_state":
+            setattr(fsm_class, name, property(function, namespace["set_current_state"]))
+        else:
+            setattr(fsm_class, name, function)
+    fsm_class._generated_source = source
+
+
+def specialize(fsm_class) -> None:
+    """Compile classes asking for it and give the generic methods back to subclasses opting out."""
+    if getattr(fsm_class, "compile_fsm", False):
+        compile_fsm_class(fsm_class)
+        return
+
+    inherited = [name for name in GENERATED_METHODS if _is_generated(inspect.getattr_static(fsm_class, name, None))]
+    if inherited:
+        from tuco.base import FSM
+
+        for name in inherited:
+            setattr(fsm_class, name, FSM.__dict__[name])
+        fsm_class._generated_source = None
@@ -0,0 +1,173 @@
+"""Drive several state machines living on the same holder as parallel regions."""
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type  # noqa
+
+from tuco.accessors import HolderAccessor, get_accessor  # noqa
+from tuco.base import FSM
+from tuco.exceptions import TucoAlreadyLockedError, TucoEventNotFoundError
+from tuco.locks import MemoryLock
+from tuco.locks.base import BaseLock  # noqa
+
+__all__ = ("CompositeFSM",)
+
+#: Stands for the snapshot when nobody listens to changes, regions only need a non None value to coalesce
+_NO_SNAPSHOT = object()
+
+
+class CompositeFSM:
+    """Group state machines sharing a holder, each one keeping its own state attribute.
+
+    Events are routed to every region defining them in its current state. The holder is locked once, by a lock keyed
+    on its id that every region uses, and a single snapshot is taken per call: on change hooks of the regions that
+    changed receive it, then the composite on change hook (declared with `tuco.decorators.on_change`) is called once.
+    The lock key is named after the composite, unless the regions share a ``lock_name``: the composite then uses it
+    and excludes the regions used on their own.
+
+    Regions run one after another and are not rolled back: when a region raises, the regions before it keep their new
+    state and the following ones are not called.
+
+    .. code-block:: python
+
+        class OrderFSM(CompositeFSM):
+            regions = (PaymentFSM, FulfilmentFSM, RefundFSM)
+    """
+
+    regions = ()  # type: Tuple[Type[FSM], ...]
+    #: Lock of the holder, the lock class of the first region unless set
+    lock_class = MemoryLock  # type: Type[BaseLock]
+    #: Id field used for locking, the one of the first region unless set
+    id_field = "id"
+    #: Name used in the lock key, the ``lock_name`` shared by the regions or the class name when None
+    lock_name = None  # type: Optional[str]
+    _on_change_event = None  # type: Optional[Callable]
+    _listens_to_changes = False
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """Validate regions and pick up hooks."""
+        super().__init_subclass__(**kwargs)
+        attributes = [region.state_attribute for region in cls.regions]
+        if len(set(attributes)) != len(attributes):
+            raise RuntimeError("Regions of {!r} must use different state attributes {!r}.".format(cls, attributes))
+        for region in cls.regions:
+            if not (isinstance(region, type) and issubclass(region, FSM)):
+                raise RuntimeError("Invalid region {!r} in {!r}.".format(region, cls))
+        if cls.regions:
+            for name in ("lock_class", "id_field"):
+                if name not in cls.__dict__:
+                    setattr(cls, name, getattr(cls.regions[0], name))
+        lock_names = {region.lock_name for region in cls.regions}
+        if len(lock_names) > 1:
+            raise RuntimeError("Regions of {!r} must share their lock name {!r}.".format(cls, lock_names))
+        shared_lock_name = lock_names.pop() if lock_names else None
+        if shared_lock_name is not None and "lock_name" not in cls.__dict__:
+            cls.lock_name = shared_lock_name
+
+        for value in list(cls.__dict__.values()):
+            if getattr(value, "_on_change_event", False):
+                cls._on_change_event = value
+        cls._listens_to_changes = cls._on_change_event is not None or any(
+            getattr(region, "_on_change_event", None) is not None for region in cls.regions
+        )
+
+    def __init__(self, container_object) -> None:
+        """Build every region over the holder."""
+        self.container_object = container_object
+        self.holder_accessor = get_accessor(type(container_object))  # type: HolderAccessor
+        self.region_instances = []  # type: List[FSM]
+        for region_class in self.regions:
+            region = region_class(self.container_object)
+            self.region_instances.append(region)
+            self.container_object = region.container_object
+        self._share_holder()
+        self.lock = self.lock_class(self, self.id_field)
+        for region in self.region_instances:
+            # Regions locking themselves inside the composite only count one more acquisition.
+            region.lock = self.lock
+
+    def __enter__(self) -> "CompositeFSM":
+        """Lock the holder."""
+        self.lock.lock()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """If TucoAlreadyLockedError did not throw, unlock the holder."""
+        if exc_type and issubclass(exc_type, TucoAlreadyLockedError):
+            return
+        self.lock.unlock()
+
+    def __getitem__(self, region_class: Type[FSM]) -> FSM:
+        """Return the state machine of a region."""
+        return self.region_instances[self.regions.index(region_class)]
+
+    def __repr__(self) -> str:
+        """Basic representation."""
+        return "<{} - states {!r} with holder {}>".format(
+            self.__class__.__name__, self.current_states, self.container_object.__class__.__name__
+        )
+
+    @property
+    def current_states(self) -> Dict[str, Any]:
+        """Return the current state of each region by region class name."""
+        return {region.__class__.__name__: region.current_state for region in self.region_instances}
+
+    @property
+    def possible_events(self) -> List[Any]:
+        """Return the names of events accepted by at least one region."""
+        names = []  # type: List[Any]
+        for region in self.region_instances:
+            names.extend(event.event_name for event in region.possible_events if event.event_name not in names)
+        return names
+
+    def event_allowed(self, event_name) -> bool:
+        """Check if at least one region accepts an event."""
+        return any(region.event_allowed(event_name) for region in self.region_instances)
+
+    def trigger(self, event_name, *args, **kwargs) -> bool:
+        """Trigger an event in every region accepting it, returns True when all of them succeeded."""
+        targets = [
+            region
+            for region in self.region_instances
+            if event_name in region._transitions.get(region.current_state, ())
+        ]
+        if not targets:
+            raise TucoEventNotFoundError(
+                "Event {!r} not found in {!r} on current states {!r}".format(
+                    event_name, self.possible_events, self.current_states
+                )
+            )
+        return all(self._run(targets, lambda region: region.trigger(event_name, *args, **kwargs)))
+
+    def trigger_timeout(self) -> bool:
+        """Trigger due timeouts of all regions, returns True when at least one fired."""
+        return any(self._run(self.region_instances, lambda region: region.trigger_timeout()))
+
+    def _run(self, targets: List[FSM], call: Callable[[FSM], bool]) -> List[bool]:
+        """Call regions one after another with a shared snapshot and hand changes to hooks once."""
+        regions = self.region_instances
+        snapshot = self.holder_accessor.snapshot(self.container_object) if self._listens_to_changes else _NO_SNAPSHOT
+        for region in regions:
+            region._coalesced_snapshot, region._coalesced_changes = snapshot, 0
+
+        results = []
+        try:
+            for region in targets:
+                region.container_object = self.container_object
+                try:
+                    results.append(call(region))
+                finally:
+                    self.container_object = region.container_object
+            return results
+        finally:
+            changed = [region for region in regions if region._coalesced_changes]
+            for region in regions:
+                region._coalesced_snapshot, region._coalesced_changes = None, 0
+            self._share_holder()
+            if changed and snapshot is not _NO_SNAPSHOT:
+                for region in changed:
+                    region._call_on_change(snapshot, self.container_object)
+                if self._on_change_event is not None:
+                    self._on_change_event(snapshot, self.container_object)
+
+    def _share_holder(self) -> None:
+        """Point every region to the latest holder, immutable holders are replaced on each change."""
+        for region in self.region_instances:
+            region.container_object = self.container_object
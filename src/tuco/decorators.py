@@ -2,25 +2,46 @@
 from functools import wraps
 
 
-def on_change(original_function):
-    """Register on change event on the state machine."""
+def _register_hook(original_function, event_name, dispatcher):
+    """Flag a function as a hook, queueing its return value when a dispatcher is given."""
 
-    @wraps(original_function)
-    def decorated(*args, **kwargs):
-        """Just run the event."""
-        return original_function(*args, **kwargs)
+    if dispatcher is None:
 
-    setattr(decorated, "_on_change_event", True)
+        @wraps(original_function)
+        def decorated(*args, **kwargs):
+            """Just run the event."""
+            return original_function(*args, **kwargs)
+
+    else:
+
+        @wraps(original_function)
+        def decorated(*args, **kwargs):
+            """Build a record synchronously and let the dispatcher handle it later."""
+            record = original_function(*args, **kwargs)
+            if record is not None:
+                dispatcher.put(record)
+            return record
+
+    setattr(decorated, event_name, True)
     return decorated
 
 
-def on_error(original_function):
-    """Register on error event on the state machine."""
+def on_change(original_function=None, dispatcher=None):
+    """Register on change event on the state machine.
 
-    @wraps(original_function)
-    def decorated(*args, **kwargs):
-        """Just run the event."""
-        return original_function(*args, **kwargs)
+    When a `tuco.dispatch.BatchDispatcher` is given, the decorated function should build and return a record (for
+    example an unsaved log row) which is buffered and handed to the dispatcher's batch handler later.
+    """
+    if original_function is None:
+        return lambda function: _register_hook(function, "_on_change_event", dispatcher)
+    return _register_hook(original_function, "_on_change_event", dispatcher)
 
-    setattr(decorated, "_on_error_event", True)
-    return decorated
+
+def on_error(original_function=None, dispatcher=None):
+    """Register on error event on the state machine.
+
+    Accepts a dispatcher the same way as `on_change`.
+    """
+    if original_function is None:
+        return lambda function: _register_hook(function, "_on_error_event", dispatcher)
+    return _register_hook(original_function, "_on_error_event", dispatcher)
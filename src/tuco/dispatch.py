@@ -0,0 +1,135 @@
+"""Buffered dispatch of hook records to batch handlers."""
+import atexit
+import logging
+import queue
+import threading
+from typing import Callable, List, Optional  # noqa
+
+from tuco.exceptions import TucoBufferFullError, TucoDispatcherClosedError
+
+__all__ = ("BatchDispatcher",)
+
+logger = logging.getLogger(__name__)
+
+
+class BatchDispatcher:
+    """Queue records in a bounded buffer and hand them to a batch handler from a background thread.
+
+    Records are flushed when ``batch_size`` of them are waiting and at least every ``flush_interval`` seconds. When
+    the buffer is full, `put` blocks for up to ``put_timeout`` seconds (forever if it is None) before raising
+    `TucoBufferFullError`, so slow handlers slow producers down instead of eating memory. Whatever is still buffered
+    is flushed when the interpreter exits. Batches reach the handler one at a time and in the order records were put.
+    """
+
+    def __init__(
+        self,
+        handle_batch: Callable[[List[object]], None],
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_buffer: int = 10000,
+        put_timeout: Optional[float] = None,
+    ) -> None:
+        """Store the handler and buffer settings, the worker thread starts on the first record."""
+        self.handle_batch = handle_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._buffer = queue.Queue(max_buffer)  # type: queue.Queue
+        self._handler_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._shutdown = threading.Event()
+        #: Guards the shutdown check of `put` and counts the puts that passed it
+        self._puts = threading.Condition()
+        self._active_puts = 0
+        self._wakeup = threading.Event()
+        self._worker = None  # type: Optional[threading.Thread]
+
+    def put(self, record) -> None:
+        """Buffer a record, waiting for room if the buffer is full."""
+        with self._puts:
+            if self._shutdown.is_set():
+                raise TucoDispatcherClosedError("Dispatcher is closed, the record would never be handled.")
+            self._active_puts += 1
+        try:
+            if self._worker is None:
+                self._start()
+            try:
+                self._buffer.put(record, timeout=self.put_timeout)
+            except queue.Full:
+                raise TucoBufferFullError("Buffer full after waiting {} seconds.".format(self.put_timeout)) from None
+            if self._buffer.qsize() >= self.batch_size:
+                self._wakeup.set()
+        finally:
+            with self._puts:
+                self._active_puts -= 1
+                self._puts.notify_all()
+
+    def flush(self) -> None:
+        """Hand every buffered record to the batch handler and wait for batches the worker is still handling."""
+        self._handle_buffered()
+        self._buffer.join()
+
+    def close(self) -> None:
+        """Stop the worker thread and flush what is left, including records of puts racing with it."""
+        with self._puts:
+            self._shutdown.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join()
+            atexit.unregister(self.close)
+        while True:
+            with self._puts:
+                if not self._active_puts:
+                    break
+            # Make room for puts waiting on a full buffer.
+            self._handle_buffered()
+            with self._puts:
+                if self._active_puts:
+                    self._puts.wait(0.01)
+        self.flush()
+
+    def _start(self) -> None:
+        """Start the worker thread once."""
+        with self._start_lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._run, name="tuco-batch-dispatcher", daemon=True)
+            self._worker.start()
+            atexit.register(self.close)
+
+    def _run(self) -> None:
+        """Hand batches over every interval, or sooner when a full batch is waiting, until shutdown."""
+        while not self._shutdown.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._handle_buffered()
+
+    def _handle_buffered(self) -> None:
+        """Hand everything buffered so far to the batch handler."""
+        # Draining under the handler lock keeps a flush from overtaking a batch the worker already took.
+        with self._handler_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    return
+                self._handle(batch)
+
+    def _drain(self, limit: int) -> List[object]:
+        """Take up to limit records without waiting."""
+        batch = []  # type: List[object]
+        while len(batch) < limit:
+            try:
+                batch.append(self._buffer.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _handle(self, batch: List[object]) -> None:
+        """Call the batch handler, never letting it kill the worker thread."""
+        try:
+            self.handle_batch(batch)
+        except Exception:  # noqa: B902
+            logger.exception("Batch handler failed, %d records were dropped.", len(batch))
+        finally:
+            for _ in batch:
+                self._buffer.task_done()
@@ -13,6 +13,12 @@ class TucoEventNotFoundError(TucoException):
     pass
 
 
+class TucoEventNotAllowedError(TucoException):
+    """A guard of the event refused the transition."""
+
+    pass
+
+
 class TucoInvalidStateChangeError(TucoException):
     """In case someone try to change to an invalid state."""
 
@@ -41,3 +47,39 @@ class TucoEmptyFSMError(TucoException):
     """FSM has no state defined."""
 
     pass
+
+
+class TucoBufferFullError(TucoException):
+    """A dispatch buffer stayed full for longer than allowed."""
+
+    pass
+
+
+class TucoDispatcherClosedError(TucoException):
+    """A record was given to a dispatcher that was already closed."""
+
+    pass
+
+
+class TucoCommandTimeoutError(TucoException):
+    """A command did not finish before the deadline of its event or timeout."""
+
+    pass
+
+
+class TucoJournalError(TucoException):
+    """A transition could not be written to or read from the journal."""
+
+    pass
+
+
+class TucoMigrationError(TucoException):
+    """A state migration does not match the state machine definition."""
+
+    pass
+
+
+class TucoLockLostError(TucoException):
+    """The lease of a held lock expired or could not be extended."""
+
+    pass
@@ -0,0 +1,268 @@
+"""Append-only binary journal of state transitions."""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple  # noqa
+
+from tuco.exceptions import TucoJournalError
+from tuco.properties import Timeout
+from tuco.utils import fully_qualified_name, reopen_after_fork, to_timestamp
+
+__all__ = ("JournalReader", "JournalRecord", "TransitionJournal")
+
+logger = logging.getLogger(__name__)
+
+#: fsm class code, holder id, from state code, to state code, event code, timestamp
+RECORD = struct.Struct("<IqIIId")
+#: Largest class, state or event code a record can carry
+MAX_CODE = 2**32 - 1
+#: Range of holder ids a record can carry
+MIN_HOLDER_ID, MAX_HOLDER_ID = -(2**63), 2**63 - 1
+CATALOG_FILE = "catalog.json"
+SEGMENT_SUFFIX = ".seg"
+#: Event name recorded when a timeout triggers the transition
+TIMEOUT_EVENT = "<timeout>"
+
+JournalRecord = namedtuple("JournalRecord", "fsm_class holder_id from_state to_state event timestamp")
+
+
+def _segment_name(number: int) -> str:
+    """Segment files sort by name in the order they were written."""
+    return "{:08d}{}".format(number, SEGMENT_SUFFIX)
+
+
+def _recordable_id(holder_id) -> bool:
+    """Tell whether a holder id fits in a record."""
+    return isinstance(holder_id, int) and MIN_HOLDER_ID <= holder_id <= MAX_HOLDER_ID
+
+
+def _event_name(fsm) -> Optional[str]:
+    """Return the name recorded for the transition a state machine is running."""
+    transition = fsm._active_transition
+    if transition is None:
+        return None
+    if isinstance(transition, Timeout):
+        return TIMEOUT_EVENT
+    return str(transition.event_name)
+
+
+def _load_catalog(directory: str) -> Dict[str, List[Optional[str]]]:
+    """Load names for codes, code 0 of every kind means none."""
+    try:
+        with open(os.path.join(directory, CATALOG_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"classes": [None], "states": [None], "events": [None]}
+
+
+class TransitionJournal:
+    """Write fixed-width transition records to segment files.
+
+    Assign an instance to ``FSM.journal`` and the ``current_state`` setter appends every transition. Class, state and
+    event names are stored once in a catalog and records only carry their codes, so holder ids must be integers.
+    State machines check it when they are created, holders whose id changes to something else later are skipped.
+    A directory has a single writer: forked processes write to a subdirectory named after their process id.
+    """
+
+    def __init__(self, directory: str, segment_records: int = 1000000) -> None:
+        """Open the last segment of the directory for appending."""
+        self.segment_records = segment_records
+        self._lock = threading.Lock()
+        self._open(directory)
+        reopen_after_fork(self)
+
+    def reopen(self) -> None:
+        """Continue in a subdirectory named after the process id, used by forked processes."""
+        self._lock = threading.Lock()
+        if self._file.closed:
+            return
+        # The parent flushed the inherited file before forking, closing it writes nothing.
+        self._file.close()
+        self._open(os.path.join(self.directory, str(os.getpid())))
+
+    def _open(self, directory: str) -> None:
+        """Load the catalog of a directory and open its last segment."""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._catalog = _load_catalog(directory)
+        self._codes = {kind: {name: code for code, name in enumerate(names)} for kind, names in self._catalog.items()}
+
+        segments = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+        self._segment_number = int(segments[-1][: -len(SEGMENT_SUFFIX)]) if segments else 0
+        self._file = open(os.path.join(directory, _segment_name(self._segment_number)), "ab")
+        self._segment_size = self._file.tell() // RECORD.size
+        # Drop a record that was only partially written before a crash.
+        self._file.truncate(self._segment_size * RECORD.size)
+
+    def check(self, fsm) -> None:
+        """Fail before a state machine changes its holder if the journal cannot record it."""
+        holder_id = fsm.holder_id
+        if holder_id is not None and not _recordable_id(holder_id):
+            raise TucoJournalError("Journal only supports 64 bit integer holder ids, got {!r}.".format(holder_id))
+
+    def prepare(self, fsm, from_state: Optional[str], to_state: str) -> None:
+        """Allocate the codes of a transition before the holder changes, failing if the catalog is full."""
+        if not _recordable_id(fsm.holder_id):
+            return
+        with self._lock:
+            self._code("classes", fully_qualified_name(fsm))
+            self._code("states", from_state)
+            self._code("states", to_state)
+            self._code("events", _event_name(fsm))
+
+    def append(self, fsm, from_state: Optional[str], to_state: str) -> None:
+        """Write a transition of the given state machine, its codes were allocated by `prepare`."""
+        holder_id = fsm.holder_id
+        if holder_id is None:
+            return
+        if not _recordable_id(holder_id):
+            # The holder already changed, failing now would only lose the transition from the caller.
+            logger.error("Journal only supports 64 bit integer holder ids, skipped a transition of %r.", holder_id)
+            return
+
+        with self._lock:
+            record = RECORD.pack(
+                self._code("classes", fully_qualified_name(fsm)),
+                holder_id,
+                self._code("states", from_state),
+                self._code("states", to_state),
+                self._code("events", _event_name(fsm)),
+                to_timestamp(fsm.current_state_date),
+            )
+            if self._segment_size >= self.segment_records:
+                self._rotate()
+            self._file.write(record)
+            self._segment_size += 1
+
+    def flush(self) -> None:
+        """Push buffered records to the operating system."""
+        with self._lock:
+            self._file.flush()
+
+    def _before_fork(self) -> None:
+        """Do not let forked processes inherit buffered records."""
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self) -> None:
+        """Flush and close the current segment."""
+        with self._lock:
+            self._file.close()
+
+    def _code(self, kind: str, name: Optional[str]) -> int:
+        """Return the code of a name, saving it to the catalog the first time it is seen."""
+        codes = self._codes[kind]
+        try:
+            return codes[name]
+        except KeyError:
+            pass
+
+        names = self._catalog[kind]
+        if len(names) > MAX_CODE:
+            raise TucoJournalError("Journal catalog has no codes left for {} {!r}.".format(kind, name))
+        codes[name] = len(names)
+        names.append(name)
+        temporary_path = os.path.join(self.directory, CATALOG_FILE + ".tmp")
+        with open(temporary_path, "w") as f:
+            json.dump(self._catalog, f)
+        os.replace(temporary_path, os.path.join(self.directory, CATALOG_FILE))
+        return codes[name]
+
+    def _rotate(self) -> None:
+        """Start a new segment file."""
+        self._file.close()
+        self._segment_number += 1
+        self._file = open(os.path.join(self.directory, _segment_name(self._segment_number)), "ab")
+        self._segment_size = 0
+
+
+class JournalReader:
+    """Scan journal segments through memory maps without copying them."""
+
+    def __init__(self, directory: str) -> None:
+        """Load the catalog of the journal."""
+        self.directory = directory
+        self.catalog = _load_catalog(directory)
+        self._codes = {kind: {name: code for code, name in enumerate(names)} for kind, names in self.catalog.items()}
+
+    def segments(self) -> List[str]:
+        """Return segment paths in the order they were written."""
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(os.listdir(self.directory))
+            if name.endswith(SEGMENT_SUFFIX)
+        ]
+
+    def raw_records(self) -> Iterator[Tuple[int, int, int, int, int, float]]:
+        """Yield records as tuples of codes, a partially written trailing record is ignored."""
+        for path in self.segments():
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                size -= size % RECORD.size
+                if not size:
+                    continue
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(mapped)[:size]
+                try:
+                    for record in RECORD.iter_unpack(view):
+                        yield record
+                finally:
+                    view.release()
+                    mapped.close()
+
+    def records(self) -> Iterator[JournalRecord]:
+        """Yield records with names and dates."""
+        classes, states, events = self.catalog["classes"], self.catalog["states"], self.catalog["events"]
+        for fsm_class, holder_id, from_state, to_state, event, timestamp in self.raw_records():
+            yield JournalRecord(
+                classes[fsm_class],
+                holder_id,
+                states[from_state],
+                states[to_state],
+                events[event],
+                datetime.fromtimestamp(timestamp, timezone.utc),
+            )
+
+    def replay(self, fsm_class=None) -> Dict[Tuple[Optional[str], int], Optional[str]]:
+        """Rebuild the current state of every holder.
+
+        :param fsm_class: Only replay transitions of this state machine class.
+        :return: Current state name by ``(fsm class path, holder id)``.
+        """
+        class_code = self._class_code(fsm_class)
+        classes, states = self.catalog["classes"], self.catalog["states"]
+        current = {}  # type: Dict[Tuple[int, int], int]
+        for record_class, holder_id, _, to_state, _, _ in self.raw_records():
+            if class_code is None or record_class == class_code:
+                current[(record_class, holder_id)] = to_state
+        return {
+            (classes[record_class], holder_id): states[state] for (record_class, holder_id), state in current.items()
+        }
+
+    def history(self, fsm_class, holder_id: int) -> List[JournalRecord]:
+        """Return every transition of a single holder in the order they happened."""
+        class_code = self._class_code(fsm_class)
+        classes, states, events = self.catalog["classes"], self.catalog["states"], self.catalog["events"]
+        return [
+            JournalRecord(
+                classes[record_class],
+                record_holder,
+                states[from_state],
+                states[to_state],
+                events[event],
+                datetime.fromtimestamp(timestamp, timezone.utc),
+            )
+            for record_class, record_holder, from_state, to_state, event, timestamp in self.raw_records()
+            if record_holder == holder_id and record_class == class_code
+        ]
+
+    def _class_code(self, fsm_class) -> Optional[int]:
+        """Return the code of a state machine class, -1 if it never appears in the journal."""
+        if fsm_class is None:
+            return None
+        return self._codes["classes"].get(fully_qualified_name(fsm_class), -1)
@@ -1,28 +1,130 @@
 """Basic lock interface."""
-from tuco.exceptions import TucoDoNotLockError
+import asyncio
+import threading
+from typing import Dict, List, Optional  # noqa
+
+from tuco.exceptions import TucoAlreadyLockedError, TucoDoNotLockError
+
+#: Keys held by this process: hash key -> [owner, nested acquisitions, lock that reached the backend]
+_held = {}  # type: Dict[str, List]
+_held_lock = threading.Lock()
+
+
+def current_owner() -> tuple:
+    """Identify who is locking: the running asyncio task, or the thread outside of event loops."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return threading.get_ident(), task
 
 
 class BaseLock:
-    """Common lock functions."""
+    """Common lock functions.
+
+    Locks are reentrant: acquiring a key already held by the same thread (or asyncio task) only bumps a counter and
+    the backend is released by the outermost `unlock`. Keys held by another owner of this process fail right away
+    without reaching the backend, unless the backend `waits_for_release`. Backends implement `_acquire` and
+    `_release`.
+    """
+
+    _lease_lost = None  # type: Optional[Exception]
+    #: The lock that reached the backend when this one is a nested acquisition
+    _outer = None  # type: Optional[BaseLock]
 
     def __init__(self, fsm, id_field):
         """Hold the fsm and it's id field."""
         self.fsm = fsm
         self.id_field = id_field
 
+    @property
+    def lease_lost(self) -> Optional[Exception]:
+        """Set by backends with leases when the lock was lost while held, transitions fail instead of changing state.
+
+        Nested acquisitions read it from the lock that reached the backend.
+        """
+        return (self._outer or self)._lease_lost
+
+    @lease_lost.setter
+    def lease_lost(self, error: Optional[Exception]) -> None:
+        self._lease_lost = error
+
     @property
     def hash_key(self) -> str:
         """Generate a hash key to be used when locking an object."""
-        primary_key = getattr(self.fsm.container_object, self.id_field, None)
+        primary_key = self.fsm.holder_accessor.get(self.fsm.container_object, self.id_field, None)
+        return self.build_hash_key(self.fsm.__class__, primary_key)
+
+    @staticmethod
+    def build_hash_key(fsm_class, primary_key) -> str:
+        """Generate the hash key of a holder without building a state machine for it."""
         if primary_key:
-            return "fsm_{}_pk_{}".format(self.fsm.__class__.__name__, primary_key)
+            return "fsm_{}_pk_{}".format(getattr(fsm_class, "lock_name", None) or fsm_class.__name__, primary_key)
 
         raise TucoDoNotLockError()
 
     def lock(self) -> bool:
-        """Implement lock."""
-        raise NotImplementedError()
+        """Lock an object, or count one more acquisition when the current owner already holds it."""
+        try:
+            hash_key = self.hash_key
+        except TucoDoNotLockError:
+            return True
+
+        owner = current_owner()
+        with _held_lock:
+            held = _held.get(hash_key)
+            if held is not None:
+                if held[0] == owner:
+                    held[1] += 1
+                    if held[2] is not self:
+                        self._outer = held[2]
+                    return True
+                if not self.waits_for_release:
+                    raise TucoAlreadyLockedError()
+
+        self._acquire(hash_key)
+        with _held_lock:
+            _held[hash_key] = [owner, 1, self]
+        return True
 
     def unlock(self) -> bool:
-        """Implement unlock."""
+        """Release one acquisition, the backend is only released by the outermost one."""
+        try:
+            hash_key = self.hash_key
+        except TucoDoNotLockError:
+            return True
+
+        with _held_lock:
+            held = _held.get(hash_key)
+            if held is None or held[0] != current_owner():
+                return True
+            held[1] -= 1
+            if held[1]:
+                self._outer = None
+                return True
+            del _held[hash_key]
+        held[2]._release(hash_key)
+        return True
+
+    @property
+    def owned(self) -> bool:
+        """Check if the current thread or task holds the lock."""
+        try:
+            hash_key = self.hash_key
+        except TucoDoNotLockError:
+            return False
+        held = _held.get(hash_key)
+        return held is not None and held[0] == current_owner()
+
+    @property
+    def waits_for_release(self) -> bool:
+        """Check if a contended lock waits for the backend instead of failing right away."""
+        return False
+
+    def _acquire(self, hash_key: str) -> None:
+        """Take the lock in the backend, raising `TucoAlreadyLockedError` when somebody else has it."""
+        raise NotImplementedError()
+
+    def _release(self, hash_key: str) -> None:
+        """Release the lock in the backend."""
         raise NotImplementedError()
@@ -2,7 +2,7 @@
 from threading import RLock
 from typing import Dict  # noqa
 
-from tuco.exceptions import TucoAlreadyLockedError, TucoDoNotLockError
+from tuco.exceptions import TucoAlreadyLockedError
 
 from .base import BaseLock
 
@@ -13,29 +13,14 @@ class MemoryLock(BaseLock):
     global_lock = RLock()
     locks = {}  # type: Dict[str, str]
 
-    def lock(self) -> bool:
+    def _acquire(self, hash_key: str) -> None:
         """Lock an object."""
-        try:
-            hash_key = self.hash_key
-        except TucoDoNotLockError:
-            return True
-
         with self.global_lock:
             if hash_key in self.locks:
                 raise TucoAlreadyLockedError()
             self.locks[hash_key] = "locked"
-            return True
 
-    def unlock(self) -> bool:
+    def _release(self, hash_key: str) -> None:
         """Unlock an object."""
-        try:
-            hash_key = self.hash_key
-        except TucoDoNotLockError:
-            return True
-
         with self.global_lock:
-            try:
-                del self.locks[hash_key]
-            except KeyError:
-                pass
-            return True
+            self.locks.pop(hash_key, None)
@@ -1,8 +1,88 @@
-from typing import Optional  # noqa
+import time
+import uuid
+import weakref
+from typing import Any, Dict, Optional  # noqa
 
-from tuco.exceptions import TucoAlreadyLockedError, TucoDoNotLockError
+from tuco.exceptions import TucoAlreadyLockedError
 
 from .base import BaseLock
+from .watchdog import LeaseWatchdog, get_default_watchdog  # noqa
+
+#: Take a free lock unless live waiters are queued before us, queue ourselves when waiting is allowed.
+#: KEYS: lock, queue. ARGV: token, lease in ms, wait in ms (0 to not wait).
+ACQUIRE_SCRIPT = """
+local waiter = KEYS[1] .. ':waiter:' .. ARGV[1]
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('del', waiter)
+    return 1
+end
+if redis.call('exists', KEYS[1]) == 0 then
+    local head = redis.call('lindex', KEYS[2], 0)
+    while head and head ~= ARGV[1] and redis.call('exists', KEYS[1] .. ':waiter:' .. head) == 0 do
+        redis.call('lpop', KEYS[2])
+        head = redis.call('lindex', KEYS[2], 0)
+    end
+    if not head or head == ARGV[1] then
+        if head then
+            redis.call('lpop', KEYS[2])
+        end
+        redis.call('del', waiter)
+        redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+        return 1
+    end
+end
+if tonumber(ARGV[3]) > 0 and redis.call('exists', waiter) == 0 then
+    redis.call('set', waiter, 1, 'PX', ARGV[3])
+    redis.call('rpush', KEYS[2], ARGV[1])
+end
+return 0
+"""
+
+#: Hand the lock to the first live waiter and wake it up, or delete it when nobody waits.
+#: KEYS: lock, queue. ARGV: token, lease in ms.
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+local head = redis.call('lpop', KEYS[2])
+while head do
+    if redis.call('del', KEYS[1] .. ':waiter:' .. head) == 1 then
+        local wake = KEYS[1] .. ':wake:' .. head
+        redis.call('set', KEYS[1], head, 'PX', ARGV[2])
+        redis.call('rpush', wake, 1)
+        redis.call('pexpire', wake, ARGV[2])
+        return 1
+    end
+    head = redis.call('lpop', KEYS[2])
+end
+redis.call('del', KEYS[1])
+return 1
+"""
+
+#: Leave the queue once the wait deadline passed, returns 1 when the lock was handed over meanwhile.
+#: KEYS: lock, queue. ARGV: token.
+CANCEL_SCRIPT = """
+redis.call('del', KEYS[1] .. ':waiter:' .. ARGV[1], KEYS[1] .. ':wake:' .. ARGV[1])
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return 1
+end
+redis.call('lrem', KEYS[2], 0, ARGV[1])
+return 0
+"""
+
+_scripts = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+
+def _get_scripts(connection) -> Dict[str, Any]:
+    """Register the lock scripts once per connection."""
+    scripts = _scripts.get(connection)
+    if scripts is None:
+        scripts = _scripts[connection] = {
+            "acquire": connection.register_script(ACQUIRE_SCRIPT),
+            "release": connection.register_script(RELEASE_SCRIPT),
+            "cancel": connection.register_script(CANCEL_SCRIPT),
+        }
+    return scripts
 
 
 class RedisLock(BaseLock):
@@ -10,39 +90,75 @@ class RedisLock(BaseLock):
 
     This class should be extended and provided with timeout and a redis connection pool as there is no way to know
     where the user stores this data, it can be inside some config or a flask app for example.
+
+    With ``auto_renew`` the lease is extended by a `LeaseWatchdog` for as long as the lock is held, so
+    ``lock_timeout`` only needs to cover a few renewal passes instead of the slowest transition.
+
+    With ``wait_timeout`` a contended lock queues up and sleeps on a list of its own until the holder hands the lock
+    over, from the script deleting it, or until the wait timeout passes. Waiters are served in arrival order and new
+    comers do not jump ahead of them.
     """
 
+    #: Keep extending the lease while the lock is held
+    auto_renew = False
+    #: Watchdog renewing leases, the one shared by all locks when None
+    watchdog = None  # type: Optional[LeaseWatchdog]
+    #: Seconds to wait for a contended lock, fail right away when None
+    wait_timeout = None  # type: Optional[float]
+
     def __init__(self, lock_timeout, redis_connection, *args, **kwargs) -> None:
         """Start the lock with default timeout."""
         super().__init__(*args, **kwargs)
-        from redis.lock import Lock  # noqa
-
-        self._lock = None  # type: Optional[Lock]
         self.lock_timeout = lock_timeout
         self.redis_connection = redis_connection
+        self.lease_key = None  # type: Optional[str]
+        self.lease_token = None  # type: Optional[str]
 
-    def lock(self) -> bool:
-        """Lock an object."""
-        try:
-            hash_key = self.hash_key
-        except TucoDoNotLockError:
-            return True
+    @property
+    def waits_for_release(self) -> bool:
+        """Check if a contended lock waits for the holder."""
+        return self.wait_timeout is not None
 
-        self._lock = self.redis_connection.lock(hash_key, timeout=self.lock_timeout)
+    def on_lease_lost(self, error: Exception) -> None:
+        """Called from the watchdog thread when the lease could not be extended."""
+        pass
 
-        if not self._lock.acquire(False):
-            raise TucoAlreadyLockedError()
-        return True
+    def _acquire(self, hash_key: str) -> None:
+        """Lock an object, waiting for it to be handed over when ``wait_timeout`` is set."""
+        scripts = _get_scripts(self.redis_connection)
+        keys = [hash_key, hash_key + ":queue"]
+        token = uuid.uuid4().hex
+        lease = int(self.lock_timeout * 1000)
 
-    def unlock(self) -> bool:
-        """Unlock an object."""
-        from redis.exceptions import LockError
+        if self.wait_timeout is None:
+            if not scripts["acquire"](keys=keys, args=[token, lease, 0]):
+                raise TucoAlreadyLockedError()
+        else:
+            deadline = time.monotonic() + self.wait_timeout
+            # Queued waiters expire with their deadline, so a crashed waiter does not stall the queue
+            wait = int(self.wait_timeout * 1000) + lease
+            while not scripts["acquire"](keys=keys, args=[token, lease, wait]):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if scripts["cancel"](keys=keys, args=[token]):
+                        break
+                    raise TucoAlreadyLockedError()
+                # Wake up at least once per lease to take over locks of holders that crashed
+                self.redis_connection.blpop(["{}:wake:{}".format(hash_key, token)], min(remaining, self.lock_timeout))
 
-        if self._lock is None:
-            return True
-        try:
-            self._lock.release()
-        except LockError:
-            pass
+        self.lease_key, self.lease_token = hash_key, token
+        self.lease_lost = None
+        if self.auto_renew:
+            (self.watchdog or get_default_watchdog()).register(self)
 
-        return True
+    def _release(self, hash_key: str) -> None:
+        """Unlock an object, handing it over to the first waiter."""
+        lease_key, lease_token = self.lease_key, self.lease_token
+        if lease_key is None or lease_token is None:
+            return
+        if self.auto_renew:
+            (self.watchdog or get_default_watchdog()).unregister(self)
+        _get_scripts(self.redis_connection)["release"](
+            keys=[lease_key, lease_key + ":queue"], args=[lease_token, int(self.lock_timeout * 1000)]
+        )
+        self.lease_key = self.lease_token = None
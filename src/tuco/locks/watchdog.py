@@ -0,0 +1,148 @@
+"""Keep the leases of held Redis locks alive from a single background thread."""
+import logging
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Set  # noqa
+
+from tuco.exceptions import TucoLockLostError
+
+__all__ = ("LeaseWatchdog", "get_default_watchdog")
+
+logger = logging.getLogger(__name__)
+
+#: Reset the expiration of a key when it still holds our token, replacing its TTL like a fresh acquisition
+EXTEND_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+return redis.call('pexpire', KEYS[1], ARGV[2])
+"""
+
+_default_watchdog = None  # type: Optional[LeaseWatchdog]
+_default_watchdog_lock = threading.Lock()
+
+
+def get_default_watchdog() -> "LeaseWatchdog":
+    """Create the watchdog shared by all Redis locks on first use."""
+    global _default_watchdog
+    with _default_watchdog_lock:
+        if _default_watchdog is None:
+            _default_watchdog = LeaseWatchdog()
+        return _default_watchdog
+
+
+class LeaseWatchdog:
+    """Extend the leases of every registered lock, one pipeline per Redis connection and pass.
+
+    Passes run every third of the shortest registered ``lock_timeout`` (or every ``interval`` seconds), so leases can
+    be a few seconds long and the locks of a crashed process expire quickly. A lease is lost when its key no longer
+    holds the lock token, or when Redis could not be reached until the lease expired: the lock is then unregistered,
+    its ``lease_lost`` is set, which makes the running transition fail before changing state, and its
+    ``on_lease_lost`` hook is called from the watchdog thread.
+    """
+
+    def __init__(self, interval: Optional[float] = None) -> None:
+        """Start without locks, the thread is started with the first registration."""
+        self.interval = interval
+        self._locks = set()  # type: Set
+        self._scripts = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+        self._condition = threading.Condition()
+        self._thread = None  # type: Optional[threading.Thread]
+        self._wait = None  # type: Optional[float]
+        self._stopped = False
+
+    def register(self, lock) -> None:
+        """Start renewing the lease of a lock that was just acquired."""
+        lock._lease_expires = time.monotonic() + lock.lock_timeout
+        with self._condition:
+            self._locks.add(lock)
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name="tuco-lease-watchdog", daemon=True)
+                self._thread.start()
+            elif self._wait is None or self._get_interval() < self._wait:
+                self._condition.notify()
+
+    def unregister(self, lock) -> None:
+        """Stop renewing the lease of a lock, before it is released."""
+        with self._condition:
+            self._locks.discard(lock)
+
+    def stop(self) -> None:
+        """Stop the thread, registered leases are no longer renewed."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def renew(self) -> List:
+        """Extend all registered leases once, returns the locks whose lease was lost."""
+        from redis.exceptions import RedisError
+
+        with self._condition:
+            groups = {}  # type: Dict[int, List]
+            for lock in self._locks:
+                groups.setdefault(id(lock.redis_connection), []).append((lock, lock.lease_key, lock.lease_token))
+
+        lost = []
+        for leases in groups.values():
+            connection = leases[0][0].redis_connection
+            script = self._scripts.get(connection)
+            if script is None:
+                script = self._scripts[connection] = connection.register_script(EXTEND_SCRIPT)
+            started = time.monotonic()
+            try:
+                pipeline = connection.pipeline(transaction=False)
+                for lock, key, token in leases:
+                    script(keys=[key], args=[token, int(lock.lock_timeout * 1000)], client=pipeline)
+                results = pipeline.execute(raise_on_error=False)
+            except RedisError as e:
+                results = [e] * len(leases)
+
+            for (lock, _, _), result in zip(leases, results):
+                if result == 1:
+                    lock._lease_expires = started + lock.lock_timeout
+                elif not isinstance(result, Exception) or started >= lock._lease_expires:
+                    lost.append(lock)
+
+        for lock in lost:
+            self._lose(lock)
+        return lost
+
+    def _lose(self, lock) -> None:
+        """Unregister a lock whose lease is gone and notify whoever holds it."""
+        with self._condition:
+            if lock not in self._locks:
+                return  # Released meanwhile
+            self._locks.discard(lock)
+        lock.lease_lost = TucoLockLostError("Lease of {!r} could not be extended.".format(lock.lease_key))
+        try:
+            lock.on_lease_lost(lock.lease_lost)
+        except Exception:
+            logger.exception("Lease lost hook of %r failed.", lock.lease_key)
+
+    def _get_interval(self) -> float:
+        """Seconds between passes, a third of the shortest lease by default."""
+        if self.interval is not None:
+            return self.interval
+        return min(lock.lock_timeout for lock in self._locks) / 3
+
+    def _run(self) -> None:
+        """Renew leases until stopped, sleeping while no lock is held."""
+        while True:
+            with self._condition:
+                while not self._locks and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                self._wait = self._get_interval()
+                self._condition.wait(self._wait)
+                self._wait = None
+                if self._stopped:
+                    return
+            try:
+                self.renew()
+            except Exception:
+                logger.exception("Lease renewal failed.")
@@ -0,0 +1,161 @@
+"""Hand contended events over to the thread already holding a holder's lock."""
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, Optional, Tuple  # noqa
+
+from tuco.exceptions import TucoAlreadyLockedError, TucoDoNotLockError
+from tuco.locks.base import current_owner
+
+__all__ = ("Mailbox",)
+
+QueuedEvent = Tuple[Future, object, tuple, dict]
+
+
+class Mailbox:
+    """Per holder queues of events waiting for the current lock holder.
+
+    Assign an instance to ``FSM.mailbox``. While a thread of this process holds the lock of a holder (with
+    ``with fsm:`` or `submit`), events submitted for the same holder are queued instead of failing with
+    `TucoAlreadyLockedError`, and the lock holder runs them back to back before releasing the lock. When the lock is
+    held by code not using the mailbox, or by another process, `submit` still raises `TucoAlreadyLockedError`.
+    """
+
+    def __init__(self) -> None:
+        """Start without any holder locked."""
+        self._mutex = threading.Lock()
+        self._queues = {}  # type: Dict[str, Deque[QueuedEvent]]
+        #: Who locks each holder through the mailbox, set before the backend lock is taken
+        self._owners = {}  # type: Dict[str, tuple]
+        #: Nested acquisitions by the lock owner, the queue is drained by the outermost release
+        self._depths = {}  # type: Dict[str, int]
+
+    def submit(self, fsm, event_name, *args, **kwargs) -> Future:
+        """Trigger an event now if the holder is free, otherwise queue it for the thread holding its lock.
+
+        :return: A future with the result of `FSM.trigger`, resolved once the event ran.
+        """
+        future = Future()  # type: Future
+        key = self._key(fsm)
+        if not self._claim(fsm, key, (future, event_name, args, kwargs)):
+            return future
+
+        try:
+            self._run(fsm, future, event_name, args, kwargs)
+        finally:
+            self.release(fsm)
+        return future
+
+    def acquire(self, fsm) -> None:
+        """Lock a holder and start queueing events submitted for it."""
+        key = self._key(fsm)
+        while not self._claim(fsm, key):
+            if not fsm.lock.waits_for_release:
+                raise TucoAlreadyLockedError()
+            # Another thread of this process holds it, wait for the hand-over through the backend and claim again.
+            fsm.lock.lock()
+            fsm.lock.unlock()
+
+    def release(self, fsm) -> None:
+        """Run queued events and unlock the holder once its queue is empty."""
+        key = self._key(fsm)
+        if key is None:
+            fsm.lock.unlock()
+            return
+        with self._mutex:
+            depth = self._depths.get(key, 0)
+            if depth > 1:
+                self._depths[key] = depth - 1
+        if depth > 1:
+            fsm.lock.unlock()
+            return
+
+        while True:
+            self._drain(fsm, key)
+            fsm.lock.unlock()
+            with self._mutex:
+                if not self._queues.get(key):
+                    self._forget(key)
+                    return
+            # Events were queued while the lock was being released, take it again to run them.
+            try:
+                fsm.lock.lock()
+            except Exception as e:  # noqa: B902
+                self._fail(key, e)
+                return
+
+    def _claim(self, fsm, key: Optional[str], item: Optional[QueuedEvent] = None) -> bool:
+        """Become the owner of a holder and take its lock, or queue the item when another thread owns it.
+
+        Ownership is decided under the mutex, the backend lock is taken after releasing it, so a slow or contended
+        backend only delays the holder being locked.
+
+        :return: False when another thread of this process owns the holder.
+        """
+        if key is not None:
+            owner = current_owner()
+            with self._mutex:
+                current = self._owners.get(key)
+                if current is not None and current != owner:
+                    if item is not None:
+                        self._queues[key].append(item)
+                    return False
+                if current is None:
+                    self._owners[key] = owner
+                    self._queues[key] = deque()
+                self._depths[key] = self._depths.get(key, 0) + 1
+
+        try:
+            fsm.lock.lock()
+        except Exception as e:  # noqa: B902
+            if key is not None:
+                with self._mutex:
+                    self._depths[key] -= 1
+                    outermost = not self._depths[key]
+                if outermost:
+                    self._fail(key, e)
+            raise
+        return True
+
+    def _drain(self, fsm, key: str) -> None:
+        """Run queued events until the queue of a holder is empty."""
+        while True:
+            with self._mutex:
+                pending = self._queues.get(key)
+                if not pending:
+                    return
+                item = pending.popleft()
+            self._run(fsm, *item)
+
+    def _fail(self, key: str, error: Exception) -> None:
+        """Give up the ownership of a holder that could not be locked, failing the events queued for it."""
+        with self._mutex:
+            pending = self._queues.get(key) or ()
+            self._forget(key)
+        for future, _, _, _ in pending:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+    def _forget(self, key: str) -> None:
+        """Drop the ownership of a holder, must be called holding the mutex."""
+        self._queues.pop(key, None)
+        self._owners.pop(key, None)
+        self._depths.pop(key, None)
+
+    @staticmethod
+    def _key(fsm) -> Optional[str]:
+        """Return the lock key of a holder, None when it cannot be locked."""
+        try:
+            return fsm.lock.hash_key
+        except TucoDoNotLockError:
+            return None
+
+    @staticmethod
+    def _run(fsm, future: Future, event_name, args: tuple, kwargs: dict) -> None:
+        """Trigger an event and store its outcome in the future."""
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fsm.trigger(event_name, *args, **kwargs))
+        except Exception as e:  # noqa: B902
+            future.set_exception(e)
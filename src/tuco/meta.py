@@ -1,7 +1,31 @@
 """Meta class to validate FSM implementations on parsing time."""
 import collections
+import copyreg
+import weakref
+from typing import Any, Dict, Set  # noqa
 
-from tuco.properties import BaseState, Event, FinalState
+from tuco import codegen
+from tuco.properties import BaseState, CompositeState, Event, FinalState, State
+from tuco.utils import fully_qualified_name, import_by_name
+
+#: State machine classes by fully qualified name, so classes that cannot be imported still pickle by reference
+registry = weakref.WeakValueDictionary()  # type: weakref.WeakValueDictionary
+
+
+def load_fsm_class(name: str):
+    """Find a state machine class by fully qualified name, in the registry or by importing it."""
+    fsm_class = registry.get(name)
+    if fsm_class is None:
+        fsm_class = import_by_name(name)
+    return fsm_class
+
+
+def _reduce_fsm_class(fsm_class):
+    """Pickle state machine classes by name."""
+    name = fully_qualified_name(fsm_class)
+    if registry.get(name) is fsm_class:
+        return load_fsm_class, (name,)
+    return fsm_class.__qualname__
 
 
 class FSMBase(type):
@@ -19,40 +43,119 @@ class FSMBase(type):
             new_namespace["__classcell__"] = attributes["__classcell__"]
 
         new_class = super_new(mcs, name, bases, new_namespace)
+        own_states = {}  # type: Dict[str, BaseState]
+        new_hooks = False
         for name, value in attributes.items():
+            if isinstance(value, CompositeState):
+                continue
             if isinstance(value, BaseState):
-                mcs._create_state(new_class, name, value)
+                own_states[name] = mcs._flatten(value, new_class)
             else:
                 setattr(new_class, name, value)
                 if callable(value):
                     for event_name in ("_on_change_event", "_on_error_event"):
                         if getattr(value, event_name, False):
                             setattr(new_class, event_name, value)
-
-        mcs._validate_timeouts(new_class)
-        mcs._validate_errors(new_class)
-        mcs._validate_events(new_class)
+                            new_hooks = True
+
+        # Inherited states were validated along with their class, only check what this class adds or overrides.
+        changed = mcs._inherit_states(new_class, bases, own_states)
+        mcs._validate_timeouts(new_class, changed)
+        mcs._validate_errors(new_class, changed)
+        mcs._validate_events(new_class, changed)
+        mcs._compile_transitions(new_class, bases, own_states)
+        if own_states or new_hooks or len(bases) > 1 or not codegen.INPUTS.isdisjoint(attributes):
+            codegen.specialize(new_class)
+        registry[fully_qualified_name(new_class)] = new_class
         return new_class
 
     @staticmethod
-    def _create_state(new_class, name, value) -> None:
-        """Create a state hidden in new class."""
-        if new_class._states is None:
-            new_class._states = {}
+    def _flatten(state, new_class) -> BaseState:
+        """Merge what a state inherits from its composite parents into a plain state."""
+        parents = []
+        parent = getattr(state, "parent", None)
+        while parent is not None:
+            parents.append(parent)
+            parent = parent.parent
+        if not parents:
+            return state
+
+        events = list(state.events)
+        names = {event.event_name for event in events}
+        error, timeout = state.error, state.timeout
+        on_enter = []
+        for parent in parents:
+            inherited = set()
+            for event in parent.events:
+                if event.event_name in inherited:
+                    raise RuntimeError(
+                        "Duplicated event {!r} in composite state {!r} of {!r}".format(
+                            event.event_name, parent, new_class
+                        )
+                    )
+                inherited.add(event.event_name)
+                if event.event_name not in names:
+                    events.append(event)
+            names |= inherited
+            error = error or parent.error
+            timeout = timeout or parent.timeout
+        for parent in reversed(parents):
+            on_enter.extend(parent.on_enter)
+        on_enter.extend(state.on_enter)
+        return State(events=events, error=error, timeout=timeout, on_enter=on_enter, parent=state.parent)
 
-        states = new_class._states
-        if name in states:
-            raise RuntimeError("Duplicated states are not allowed {!r} {!r}".format(new_class, name))
+    @staticmethod
+    def _inherit_states(new_class, bases, own_states) -> Set[str]:
+        """Give the class its own state table, sharing the parent one until states are added or overridden.
+
+        :return: Names of the states that must be validated.
+        """
+        tables = [base._states for base in reversed(bases) if getattr(base, "_states", None)]
+        if own_states or len(tables) > 1:
+            states = {}  # type: Dict[str, BaseState]
+            for table in tables:
+                states.update(table)
+            states.update(own_states)
+            new_class._states = states
+        elif tables:
+            new_class._states = tables[0]
+
+        changed = set(own_states)
+        if new_class._states and new_class.initial_state in new_class._states:
+            # The initial state may come from a parent but be chosen here, its rules depend on the class.
+            changed.add(new_class.initial_state)
+        return changed
 
-        states[name] = value
+    @staticmethod
+    def _compile_transitions(new_class, bases, own_states) -> None:
+        """Index events by state and event name so triggering does not walk event lists.
+
+        Indexes of inherited states are shared with the parent, only added or overridden states are indexed again.
+        """
+        tables = [base._transitions for base in reversed(bases) if getattr(base, "_transitions", None)]
+        if not own_states and len(tables) <= 1:
+            new_class._transitions = tables[0] if tables else {}
+            return
+
+        transitions = {}  # type: Dict[str, Dict[Any, Event]]
+        for table in tables:
+            transitions.update(table)
+        for state_name, state in own_states.items():
+            transitions[state_name] = {event.event_name: event for event in getattr(state, "events", [])}
+            for event in getattr(state, "events", []):
+                if event._owner is None:
+                    # Lets events pickle as a reference to the class and state declaring them.
+                    event._owner = (new_class, state_name)
+        new_class._transitions = transitions
 
     @staticmethod
-    def _validate_timeouts(new_class) -> None:
-        """Validate all timeouts."""
+    def _validate_timeouts(new_class, names) -> None:
+        """Validate timeouts of the given states."""
         states = new_class._states
         if states is None:
             return
-        for name, state in states.items():
+        for name in names:
+            state = states[name]
             if isinstance(state, FinalState):
                 continue
             if state.timeout and state.timeout.target_state not in states:
@@ -65,12 +168,13 @@ class FSMBase(type):
                 raise RuntimeError("Initial state cannot have a timeout {!r} {!r}.".format(new_class, state))
 
     @staticmethod
-    def _validate_events(new_class) -> None:
-        """Make a pre-validation on events to fail fast."""
+    def _validate_events(new_class, names) -> None:
+        """Make a pre-validation on events of the given states to fail fast."""
         states = new_class._states
         if states is None:
             return
-        for parent_state_name, parent_state in states.items():
+        for parent_state_name in names:
+            parent_state = states[parent_state_name]
             if isinstance(parent_state, FinalState):
                 continue
 
@@ -98,12 +202,13 @@ class FSMBase(type):
             )
 
     @staticmethod
-    def _validate_errors(new_class) -> None:
-        """Walk through states and events to check if events are not going to dead ends."""
+    def _validate_errors(new_class, names) -> None:
+        """Walk through the given states and their events to check if events are not going to dead ends."""
         states = new_class._states
         if states is None:
             return
-        for _, state in states.items():
+        for name in names:
+            state = states[name]
             if isinstance(state, FinalState):
                 continue
 
@@ -120,3 +225,6 @@ class FSMBase(type):
         states = new_class._states
         if not states or error.target_state not in states:
             raise RuntimeError("Could not find target state {} inside {!r}".format(error.target_state, new_class))
+
+
+copyreg.pickle(FSMBase, _reduce_fsm_class)
@@ -0,0 +1,239 @@
+"""Move stored holders out of renamed, merged or removed states."""
+import hashlib
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Iterable, Iterator, List, Mapping, Optional  # noqa
+from uuid import UUID
+
+from tuco.exceptions import TucoMigrationError
+from tuco.utils import fully_qualified_name
+
+__all__ = ("MigrationProgress", "StateMigration")
+
+PLACEHOLDERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+#: Id types a checkpoint can store, by the tag written in front of the id
+ID_TYPES = {"int": int, "str": str, "uuid": UUID, "decimal": Decimal}
+
+
+def _dump_id(value: Any) -> Optional[str]:
+    """Serialize an id with its type, so a resumed migration binds the same value it stopped at."""
+    if value is None:
+        return None
+    for tag, id_type in ID_TYPES.items():
+        if type(value) is id_type:
+            return "{}:{}".format(tag, value)
+    raise TucoMigrationError("Checkpoints cannot store ids of type {!r}.".format(type(value)))
+
+
+def _load_id(value: Optional[str]) -> Any:
+    """Restore an id serialized by `_dump_id`."""
+    if value is None:
+        return None
+    tag, _, text = value.partition(":")
+    return ID_TYPES[tag](text)
+
+
+class MigrationProgress:
+    """How far a migration went."""
+
+    def __init__(self, migrated: int = 0, last_id: Any = None, finished: bool = False) -> None:
+        """Start from a checkpoint."""
+        self.migrated = migrated
+        self.last_id = last_id
+        self.finished = finished
+        self.started = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """Holders migrated per second since this run started."""
+        elapsed = time.monotonic() - self.started
+        return self.migrated / elapsed if elapsed else 0.0
+
+    def __repr__(self) -> str:
+        """Basic representation."""
+        return "<MigrationProgress {} migrated, last id {!r}{}>".format(
+            self.migrated, self.last_id, ", finished" if self.finished else ""
+        )
+
+
+class StateMigration:
+    """Map states that no longer exist, or are being merged, to states of the current definition.
+
+    The mapping is validated against ``fsm_class`` when the migration is created: targets must exist and cannot be
+    migrated themselves, so every holder is moved at most once whatever the order rows are visited in.
+
+    :param mapping: ``{old_state: new_state}``.
+    :param reset_date: Set the state date of migrated holders to the migration time.
+    :param name: Key of the checkpoint, derived from the class and the mapping by default.
+    """
+
+    def __init__(
+        self, fsm_class, mapping: Mapping[str, str], reset_date: bool = False, name: Optional[str] = None
+    ) -> None:
+        """Validate the mapping."""
+        states = fsm_class.get_all_states() or {}
+        for old_state, new_state in mapping.items():
+            if new_state not in states and new_state != fsm_class.fatal_state:
+                raise TucoMigrationError("Target state {!r} not found in {!r}.".format(new_state, fsm_class))
+            if new_state in mapping:
+                raise TucoMigrationError(
+                    "State {!r} is both migrated and a migration target in {!r}.".format(new_state, fsm_class)
+                )
+
+        self.fsm_class = fsm_class
+        self.mapping = dict(mapping)
+        self.reset_date = reset_date
+        if name is None:
+            digest = hashlib.sha1(repr(sorted(self.mapping.items())).encode()).hexdigest()[:12]
+            name = "{}:{}".format(fully_qualified_name(fsm_class), digest)
+        self.name = name
+
+    def migrate_holder(self, holder, now: Optional[datetime] = None):
+        """Move a holder to its new state, returns the holder (or its changed copy when it is immutable)."""
+        accessor = self.fsm_class.get_holder_accessor(type(holder))
+        new_state = self.mapping.get(accessor.get(holder, self.fsm_class.state_attribute))
+        if new_state is None:
+            return holder
+        holder = accessor.set(holder, self.fsm_class.state_attribute, new_state)
+        if self.reset_date:
+            holder = accessor.set(holder, self.fsm_class.date_attribute, now or datetime.utcnow())
+        return holder
+
+    def migrate_holders(
+        self,
+        holders: Iterable[Any],
+        chunk_size: int = 10000,
+        progress: Optional[Callable[[MigrationProgress], None]] = None,
+    ) -> Iterator[Any]:
+        """Stream holders through the migration, yielding each of them so they can be saved.
+
+        :param progress: Called every ``chunk_size`` holders and at the end.
+        """
+        state = MigrationProgress()
+        now = datetime.utcnow()
+        for seen, holder in enumerate(holders, 1):
+            if self._state_of(holder) in self.mapping:
+                state.migrated += 1
+            yield self.migrate_holder(holder, now)
+            if progress is not None and seen % chunk_size == 0:
+                progress(state)
+        state.finished = True
+        if progress is not None:
+            progress(state)
+
+    def migrate_table(
+        self,
+        connection,
+        table: str,
+        id_column: Optional[str] = None,
+        state_column: Optional[str] = None,
+        date_column: Optional[str] = None,
+        chunk_size: int = 10000,
+        checkpoint_table: str = "tuco_migrations",
+        paramstyle: str = "qmark",
+        progress: Optional[Callable[[MigrationProgress], None]] = None,
+    ) -> MigrationProgress:
+        """Migrate rows of a table with one set based ``UPDATE`` per chunk of matching rows.
+
+        Chunks are id ranges holding ``chunk_size`` rows to migrate, each one is committed along with a checkpoint in
+        ``checkpoint_table``, so an interrupted migration resumes after the last committed chunk. The last id is saved
+        with its type, ``int``, ``str``, ``UUID`` and ``Decimal`` ids are supported. Columns default to the state
+        machine's field names.
+
+        :param connection: A DB-API connection.
+        :param paramstyle: ``qmark`` for ``?`` placeholders, ``format`` or ``pyformat`` for ``%s``.
+        """
+        placeholder = PLACEHOLDERS[paramstyle]
+        id_column = id_column or self.fsm_class.id_field
+        state_column = state_column or self.fsm_class.state_attribute
+        date_column = date_column or self.fsm_class.date_attribute
+        old_states = sorted(self.mapping)
+        if not old_states:
+            return MigrationProgress(finished=True)
+
+        cursor = connection.cursor()
+        state = self._load_checkpoint(cursor, checkpoint_table, placeholder)
+        connection.commit()
+        if state.finished:
+            return state
+
+        in_states = "{} IN ({})".format(state_column, ", ".join([placeholder] * len(old_states)))
+        after_last = "" if state.last_id is None else " AND {} > {}".format(id_column, placeholder)
+        boundary_query = "SELECT {0} FROM {1} WHERE {2}{{}} ORDER BY {0} LIMIT 1 OFFSET {3}".format(
+            id_column, table, in_states, placeholder
+        )
+        case = "CASE {} {} END".format(
+            state_column, " ".join("WHEN {0} THEN {0}".format(placeholder) for _ in old_states)
+        )
+        assignments = "{} = {}".format(state_column, case)
+        if self.reset_date:
+            assignments += ", {} = {}".format(date_column, placeholder)
+
+        while True:
+            after = [] if state.last_id is None else [state.last_id]
+            cursor.execute(boundary_query.format(after_last), old_states + after + [chunk_size - 1])
+            row = cursor.fetchone()
+            boundary = row[0] if row else None
+            # Fail before the chunk is updated if its checkpoint cannot be stored.
+            checkpoint = _dump_id(boundary)
+
+            conditions = in_states + after_last
+            parameters = [
+                value for old_state in old_states for value in (old_state, self.mapping[old_state])
+            ]  # type: List[Any]
+            if self.reset_date:
+                parameters.append(datetime.utcnow())
+            parameters += old_states + after
+            if boundary is not None:
+                conditions += " AND {} <= {}".format(id_column, placeholder)
+                parameters.append(boundary)
+            cursor.execute("UPDATE {} SET {} WHERE {}".format(table, assignments, conditions), parameters)
+
+            state.migrated += max(cursor.rowcount, 0)
+            state.last_id = boundary
+            state.finished = boundary is None
+            self._save_checkpoint(cursor, checkpoint_table, placeholder, state, checkpoint)
+            connection.commit()
+            if progress is not None:
+                progress(state)
+            if state.finished:
+                return state
+            after_last = " AND {} > {}".format(id_column, placeholder)
+
+    def _state_of(self, holder):
+        """Read the state of a holder."""
+        accessor = self.fsm_class.get_holder_accessor(type(holder))
+        return accessor.get(holder, self.fsm_class.state_attribute)
+
+    def _load_checkpoint(self, cursor, checkpoint_table: str, placeholder: str) -> MigrationProgress:
+        """Create the checkpoint table if needed and return where a previous run stopped."""
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS {} (name VARCHAR(255) PRIMARY KEY, last_id VARCHAR(255), "
+            "migrated INTEGER NOT NULL, finished INTEGER NOT NULL)".format(checkpoint_table)
+        )
+        cursor.execute(
+            "SELECT last_id, migrated, finished FROM {} WHERE name = {}".format(checkpoint_table, placeholder),
+            [self.name],
+        )
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(
+                "INSERT INTO {} (name, last_id, migrated, finished) VALUES ({p}, NULL, 0, 0)".format(
+                    checkpoint_table, p=placeholder
+                ),
+                [self.name],
+            )
+            return MigrationProgress()
+        return MigrationProgress(row[1], _load_id(row[0]), bool(row[2]))
+
+    def _save_checkpoint(
+        self, cursor, checkpoint_table: str, placeholder: str, state: MigrationProgress, last_id: Optional[str]
+    ) -> None:
+        """Store where the migration is, in the transaction of the chunk it follows, with the serialized last id."""
+        cursor.execute(
+            "UPDATE {} SET last_id = {p}, migrated = {p}, finished = {p} WHERE name = {p}".format(
+                checkpoint_table, p=placeholder
+            ),
+            [last_id, state.migrated, int(state.finished), self.name],
+        )
@@ -0,0 +1,6 @@
+"""Outbox implementation."""
+__all__ = ("MemoryOutbox", "OutboxWorker", "SQLiteOutbox")
+
+from .base import OutboxWorker
+from .memory import MemoryOutbox
+from .sqlite import SQLiteOutbox
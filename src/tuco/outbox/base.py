@@ -0,0 +1,137 @@
+"""Basic outbox interface."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple  # noqa
+
+DeferredCommand = Tuple[Callable, tuple, dict]
+
+
+class OutboxEntry:
+    """A deferred callback waiting to be executed."""
+
+    __slots__ = ("entry_id", "callback", "holder", "args", "kwargs", "attempts")
+
+    def __init__(self, entry_id, callback, holder, args, kwargs, attempts=0) -> None:
+        """Initialize default values."""
+        self.entry_id = entry_id
+        self.callback = callback
+        self.holder = holder
+        self.args = args
+        self.kwargs = kwargs
+        self.attempts = attempts
+
+    def __repr__(self) -> str:
+        """Basic representation."""
+        return "<Outbox entry {!r} {!r} attempts {}>".format(self.entry_id, self.callback, self.attempts)
+
+
+class BaseOutbox:
+    """Common outbox functions.
+
+    Entries are acknowledged only after their callback returned, so a callback may run more than once if a worker
+    dies in between: callbacks must be idempotent. Entries failing ``max_attempts`` times are kept aside as failed.
+    """
+
+    def __init__(self, max_attempts: int = 5, retry_delay: float = 1.0) -> None:
+        """Store retry settings."""
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def record(self, holder, commands: List[DeferredCommand]) -> None:
+        """Store deferred commands of a committed transition."""
+        raise NotImplementedError()
+
+    def claim(self, limit: int) -> List[OutboxEntry]:
+        """Take up to limit entries which are ready to be executed."""
+        raise NotImplementedError()
+
+    def ack(self, entry: OutboxEntry) -> None:
+        """Forget an entry that was executed."""
+        raise NotImplementedError()
+
+    def nack(self, entry: OutboxEntry) -> None:
+        """Give an entry back to be retried later, or mark it as failed after too many attempts."""
+        raise NotImplementedError()
+
+    def execute(self, entry: OutboxEntry) -> bool:
+        """Run an entry's callback and acknowledge it."""
+        try:
+            entry.callback(entry.holder, *entry.args, **entry.kwargs)
+        except Exception:  # noqa: B902
+            entry.attempts += 1
+            self.nack(entry)
+            return False
+
+        self.ack(entry)
+        return True
+
+    def run_pending(self, limit: Optional[int] = None) -> int:
+        """Execute ready entries in the calling thread, useful for tests and cron jobs.
+
+        :param limit: Maximum number of entries to execute, all ready entries when None.
+        :return: Number of entries executed successfully.
+        """
+        executed = 0
+        while limit is None or limit > 0:
+            entries = self.claim(100 if limit is None else min(limit, 100))
+            if not entries:
+                break
+            for entry in entries:
+                executed += self.execute(entry)
+            if limit is not None:
+                limit -= len(entries)
+        return executed
+
+    def _retry_at(self, entry: OutboxEntry) -> float:
+        """Back off linearly with the number of attempts."""
+        return time.time() + self.retry_delay * entry.attempts
+
+
+class OutboxWorker:
+    """Poll an outbox and execute its entries in a thread pool."""
+
+    def __init__(self, outbox: BaseOutbox, workers: int = 4, poll_interval: float = 0.5) -> None:
+        """Store the outbox and pool settings."""
+        self.outbox = outbox
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._shutdown = threading.Event()
+        self._poller = None  # type: Optional[threading.Thread]
+        self._executor = None  # type: Optional[ThreadPoolExecutor]
+
+    def start(self) -> "OutboxWorker":
+        """Start polling."""
+        self._shutdown.clear()
+        self._executor = ThreadPoolExecutor(self.workers)
+        self._poller = threading.Thread(
+            target=self._run, args=(self._executor,), name="tuco-outbox-worker", daemon=True
+        )
+        self._poller.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop polling and wait for running callbacks."""
+        self._shutdown.set()
+        if self._poller is not None:
+            self._poller.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "OutboxWorker":
+        """Start the worker."""
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Stop the worker."""
+        self.stop()
+
+    def _run(self, executor: ThreadPoolExecutor) -> None:
+        """Claim batches as long as there is work, otherwise sleep."""
+        while not self._shutdown.is_set():
+            entries = self.outbox.claim(self.workers * 2)
+            if not entries:
+                self._shutdown.wait(self.poll_interval)
+                continue
+            for future in [executor.submit(self.outbox.execute, entry) for entry in entries]:
+                future.result()
@@ -0,0 +1,57 @@
+"""Memory outbox module."""
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Tuple  # noqa
+
+from .base import BaseOutbox, OutboxEntry
+
+
+class MemoryOutbox(BaseOutbox):
+    """Simple in-process outbox, entries are lost if the process dies."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Start with an empty queue."""
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._ready = deque()  # type: Deque[OutboxEntry]
+        self._delayed = {}  # type: Dict[int, Tuple[float, OutboxEntry]]
+        self.failed = []  # type: List[OutboxEntry]
+
+    def __len__(self) -> int:
+        """Number of entries still to be executed."""
+        with self._lock:
+            return len(self._ready) + len(self._delayed)
+
+    def record(self, holder, commands) -> None:
+        """Queue deferred commands."""
+        with self._lock:
+            for callback, args, kwargs in commands:
+                self._ready.append(OutboxEntry(next(self._ids), callback, holder, args, kwargs))
+
+    def claim(self, limit):
+        """Take ready entries, moving retries whose delay is over back to the queue first."""
+        with self._lock:
+            now = time.time()
+            for entry_id, (available_at, entry) in list(self._delayed.items()):
+                if available_at <= now:
+                    del self._delayed[entry_id]
+                    self._ready.append(entry)
+
+            entries = []
+            while self._ready and len(entries) < limit:
+                entries.append(self._ready.popleft())
+            return entries
+
+    def ack(self, entry) -> None:
+        """Nothing to do, claimed entries are not kept."""
+
+    def nack(self, entry) -> None:
+        """Delay the entry or keep it aside as failed."""
+        with self._lock:
+            if entry.attempts >= self.max_attempts:
+                self.failed.append(entry)
+            else:
+                self._delayed[entry.entry_id] = (self._retry_at(entry), entry)
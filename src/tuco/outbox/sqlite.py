@@ -0,0 +1,100 @@
+"""SQLite outbox module."""
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from tuco.utils import reopen_after_fork
+
+from .base import BaseOutbox, OutboxEntry
+
+
+class SQLiteOutbox(BaseOutbox):
+    """Durable outbox stored in a SQLite table.
+
+    Callbacks are pickled by reference so they must be importable functions, holders and arguments are pickled by
+    value when the transition is recorded. Claimed entries are leased for ``lease_time`` seconds, if a worker dies
+    before acknowledging them they become available again once the lease expires.
+    """
+
+    def __init__(self, path: str, table: str = "tuco_outbox", lease_time: float = 60.0, *args, **kwargs) -> None:
+        """Open the database and create the outbox table if needed."""
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.table = table
+        self.lease_time = lease_time
+        self.reopen()
+        reopen_after_fork(self)
+        with self._lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} (id INTEGER PRIMARY KEY AUTOINCREMENT, payload BLOB NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL, failed INTEGER NOT NULL DEFAULT 0)"
+                "".format(table)
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS {0}_available ON {0} (failed, available_at)".format(table)
+            )
+
+    def reopen(self) -> None:
+        """Open a new connection, forked processes must not share the connection of their parent."""
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of entries still to be executed."""
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM {} WHERE failed = 0".format(self.table)).fetchone()[0]
+
+    @contextmanager
+    def _transaction(self):
+        """Run statements in a write transaction, serialized with other threads using this outbox."""
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def record(self, holder, commands) -> None:
+        """Insert one row per deferred command."""
+        now = time.time()
+        rows = [(pickle.dumps((callback, holder, args, kwargs)), now) for callback, args, kwargs in commands]
+        with self._transaction():
+            self.connection.executemany("INSERT INTO {} (payload, available_at) VALUES (?, ?)".format(self.table), rows)
+
+    def claim(self, limit):
+        """Lease ready rows by pushing their availability past the lease time."""
+        now = time.time()
+        with self._transaction():
+            rows = self.connection.execute(
+                "SELECT id, payload, attempts FROM {} WHERE failed = 0 AND available_at <= ? ORDER BY available_at "
+                "LIMIT ?".format(self.table),
+                (now, limit),
+            ).fetchall()
+            self.connection.executemany(
+                "UPDATE {} SET available_at = ? WHERE id = ?".format(self.table),
+                [(now + self.lease_time, row[0]) for row in rows],
+            )
+
+        entries = []
+        for entry_id, payload, attempts in rows:
+            callback, holder, args, kwargs = pickle.loads(payload)
+            entries.append(OutboxEntry(entry_id, callback, holder, args, kwargs, attempts))
+        return entries
+
+    def ack(self, entry) -> None:
+        """Delete the executed row."""
+        with self._transaction():
+            self.connection.execute("DELETE FROM {} WHERE id = ?".format(self.table), (entry.entry_id,))
+
+    def nack(self, entry) -> None:
+        """Schedule a retry or flag the row as failed."""
+        failed = int(entry.attempts >= self.max_attempts)
+        with self._transaction():
+            self.connection.execute(
+                "UPDATE {} SET attempts = ?, available_at = ?, failed = ? WHERE id = ?".format(self.table),
+                (entry.attempts, self._retry_at(entry), failed, entry.entry_id),
+            )
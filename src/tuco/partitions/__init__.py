@@ -0,0 +1,6 @@
+"""Partitioned timeout processing."""
+__all__ = ("PartitionCoordinator", "RedisLeaseStore", "SQLiteLeaseStore")
+
+from .base import PartitionCoordinator
+from .redis import RedisLeaseStore
+from .sqlite import SQLiteLeaseStore
@@ -0,0 +1,138 @@
+"""Basic lease store interface and partition coordinator."""
+import hashlib
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set  # noqa
+
+from tuco.utils import fully_qualified_name, holder_hash
+
+
+class BaseLeaseStore:
+    """Keep live workers and partition leases of worker groups.
+
+    Leases and heartbeats expire ``ttl`` seconds after they were last written.
+    """
+
+    def heartbeat(self, group: str, worker: str, ttl: float) -> None:
+        """Mark a worker as alive."""
+        raise NotImplementedError()
+
+    def workers(self, group: str) -> List[str]:
+        """List live workers of a group, sorted."""
+        raise NotImplementedError()
+
+    def claim(self, group: str, partitions: Iterable[int], worker: str, ttl: float) -> Set[int]:
+        """Take or renew leases which are free, expired or already held by the worker, returns the ones it holds."""
+        raise NotImplementedError()
+
+    def release(self, group: str, partitions: Iterable[int], worker: str) -> None:
+        """Give back leases held by the worker."""
+        raise NotImplementedError()
+
+    def leave(self, group: str, worker: str, partitions: int) -> None:
+        """Remove a worker and release all its leases."""
+        self.release(group, range(partitions), worker)
+
+    def owners(self, group: str, partitions: int) -> Dict[int, str]:
+        """Return the worker holding each leased partition."""
+        raise NotImplementedError()
+
+
+class PartitionCoordinator:
+    """Split holders of a state machine into partitions and share them between live workers.
+
+    Holder ids are hashed into a fixed number of partitions and each partition goes to the live worker with the
+    highest rendezvous hash, so a worker joining or leaving only moves the partitions it gains or loses. Workers
+    heartbeat and lease their partitions in ``store`` every third of ``lease_timeout``; a partition is only
+    processed once its lease is held, so a worker leaving without `leave` hands its partitions over after at most
+    ``lease_timeout`` seconds.
+
+    .. code-block:: python
+
+        coordinator = PartitionCoordinator(OrderFSM, SQLiteLeaseStore('/var/lib/shop/leases.db'))
+        while True:
+            coordinator.process_due(OrderFSM.timeout_store, load_orders)
+            time.sleep(1)
+    """
+
+    def __init__(
+        self,
+        fsm_class,
+        store: BaseLeaseStore,
+        partitions: int = 64,
+        worker_id: Optional[str] = None,
+        lease_timeout: float = 10.0,
+        group: Optional[str] = None,
+    ) -> None:
+        """Join the group of workers processing ``fsm_class``."""
+        self.fsm_class = fsm_class
+        self.store = store
+        self.partitions = partitions
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.lease_timeout = lease_timeout
+        self.group = group or fully_qualified_name(fsm_class)
+        self.owned = frozenset()  # type: frozenset
+        self._next_rebalance = 0.0
+
+    def partition_of(self, holder_id) -> int:
+        """Return the partition of a holder id."""
+        return holder_hash(holder_id) % self.partitions
+
+    def assignment(self, workers: List[str]) -> Dict[int, str]:
+        """Return the worker each partition belongs to among ``workers``."""
+        return {
+            partition: max(workers, key=lambda worker: self._weight(worker, partition))
+            for partition in range(self.partitions)
+        }
+
+    def rebalance(self) -> frozenset:
+        """Heartbeat, release partitions now belonging to other workers and lease the ones belonging to this one."""
+        self._next_rebalance = time.monotonic() + self.lease_timeout / 3
+        self.store.heartbeat(self.group, self.worker_id, self.lease_timeout)
+        workers = self.store.workers(self.group)
+        if self.worker_id not in workers:
+            workers.append(self.worker_id)
+        wanted = {partition for partition, worker in self.assignment(workers).items() if worker == self.worker_id}
+
+        lost = self.owned - wanted
+        if lost:
+            self.store.release(self.group, lost, self.worker_id)
+        self.owned = frozenset(self.store.claim(self.group, wanted, self.worker_id, self.lease_timeout))
+        return self.owned
+
+    def owns(self, holder_id) -> bool:
+        """Check if a holder belongs to a partition leased by this worker, renewing leases when they are due."""
+        self._rebalance_when_due()
+        return self.partition_of(holder_id) in self.owned
+
+    def process_due(
+        self,
+        timeout_store,
+        load_holders: Callable[[List[object]], Iterable[object]],
+        now: Optional[datetime] = None,
+        chunk_size: int = 500,
+    ) -> int:
+        """Trigger due timeouts of the holders owned by this worker, see `BaseTimeoutStore.process_due`.
+
+        Stores supporting it only read the rows of owned partitions, leases are still checked for each chunk.
+        """
+        self._rebalance_when_due()
+        return timeout_store.process_due(
+            self.fsm_class, load_holders, now, chunk_size, only=self.owns, partitions=(self.partitions, self.owned)
+        )
+
+    def leave(self) -> None:
+        """Release all partitions and stop being a live worker, others take over at their next rebalance."""
+        self.store.leave(self.group, self.worker_id, self.partitions)
+        self.owned = frozenset()
+        self._next_rebalance = 0.0
+
+    def _rebalance_when_due(self) -> None:
+        """Renew leases every third of the lease timeout."""
+        if time.monotonic() >= self._next_rebalance:
+            self.rebalance()
+
+    def _weight(self, worker: str, partition: int) -> bytes:
+        """Rendezvous hash of a worker for a partition."""
+        return hashlib.blake2b("{}:{}".format(worker, partition).encode(), digest_size=8).digest()
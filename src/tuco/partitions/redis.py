@@ -0,0 +1,91 @@
+"""Redis lease store module."""
+import time
+
+from .base import BaseLeaseStore
+
+#: Take or renew leases which are free or already held by the worker. KEYS: leases. ARGV: worker, lease in ms.
+CLAIM_SCRIPT = """
+local claimed = {}
+for index, key in ipairs(KEYS) do
+    local owner = redis.call('get', key)
+    if not owner or owner == ARGV[1] then
+        redis.call('set', key, ARGV[1], 'PX', ARGV[2])
+        claimed[#claimed + 1] = index
+    end
+end
+return claimed
+"""
+
+#: Delete leases held by the worker. KEYS: leases. ARGV: worker.
+RELEASE_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('get', key) == ARGV[1] then
+        redis.call('del', key)
+    end
+end
+return 1
+"""
+
+
+class RedisLeaseStore(BaseLeaseStore):
+    """Lease store kept in Redis: one expiring key per partition lease and a sorted set of worker heartbeats.
+
+    Heartbeats are scored with the clock of each worker, which should be roughly in sync.
+    """
+
+    def __init__(self, redis_connection, prefix: str = "tuco_leases") -> None:
+        """Register the lease scripts."""
+        self.redis_connection = redis_connection
+        self.prefix = prefix
+        self._claim = redis_connection.register_script(CLAIM_SCRIPT)
+        self._release = redis_connection.register_script(RELEASE_SCRIPT)
+
+    def heartbeat(self, group, worker, ttl) -> None:
+        """Mark a worker as alive."""
+        self.redis_connection.zadd(self._workers_key(group), {worker: time.time() + ttl})
+
+    def workers(self, group):
+        """List live workers of a group, sorted, forgetting the dead ones."""
+        key = self._workers_key(group)
+        pipeline = self.redis_connection.pipeline()
+        pipeline.zremrangebyscore(key, "-inf", time.time())
+        pipeline.zrange(key, 0, -1)
+        workers = pipeline.execute()[1]
+        return sorted(worker.decode() if isinstance(worker, bytes) else worker for worker in workers)
+
+    def claim(self, group, partitions, worker, ttl):
+        """Claim all leases in a single script call."""
+        partitions = list(partitions)
+        if not partitions:
+            return set()
+        keys = [self._lease_key(group, partition) for partition in partitions]
+        claimed = self._claim(keys=keys, args=[worker, int(ttl * 1000)])
+        return {partitions[index - 1] for index in claimed}
+
+    def release(self, group, partitions, worker) -> None:
+        """Give back leases held by the worker."""
+        keys = [self._lease_key(group, partition) for partition in partitions]
+        if keys:
+            self._release(keys=keys, args=[worker])
+
+    def leave(self, group, worker, partitions) -> None:
+        """Remove a worker and release all its leases."""
+        self.release(group, range(partitions), worker)
+        self.redis_connection.zrem(self._workers_key(group), worker)
+
+    def owners(self, group, partitions):
+        """Return the worker holding each leased partition."""
+        values = self.redis_connection.mget([self._lease_key(group, partition) for partition in range(partitions)])
+        return {
+            partition: value.decode() if isinstance(value, bytes) else value
+            for partition, value in enumerate(values)
+            if value is not None
+        }
+
+    def _workers_key(self, group: str) -> str:
+        """Sorted set of worker heartbeats."""
+        return "{}:{}:workers".format(self.prefix, group)
+
+    def _lease_key(self, group: str, partition: int) -> str:
+        """Key of a partition lease."""
+        return "{}:{}:{}".format(self.prefix, group, partition)
@@ -0,0 +1,98 @@
+"""SQLite lease store module."""
+import sqlite3
+import threading
+import time
+
+from tuco.utils import reopen_after_fork
+
+from .base import BaseLeaseStore
+
+
+class SQLiteLeaseStore(BaseLeaseStore):
+    """Lease store kept in SQLite tables, for workers sharing a host or a network file system."""
+
+    def __init__(self, path: str, table: str = "tuco_leases") -> None:
+        """Open the database and create the tables if needed."""
+        self.path = path
+        self.table = table
+        self.reopen()
+        reopen_after_fork(self)
+        with self._lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} (grp TEXT NOT NULL, partition INTEGER NOT NULL, worker TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (grp, partition))".format(table)
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS {}_workers (grp TEXT NOT NULL, worker TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (grp, worker))".format(table)
+            )
+
+    def reopen(self) -> None:
+        """Open a new connection, forked processes must not share the connection of their parent."""
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+
+    def heartbeat(self, group, worker, ttl) -> None:
+        """Mark a worker as alive."""
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO {}_workers (grp, worker, expires_at) VALUES (?, ?, ?)".format(self.table),
+                (group, worker, time.time() + ttl),
+            )
+
+    def workers(self, group):
+        """List live workers of a group, sorted."""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT worker FROM {}_workers WHERE grp = ? AND expires_at > ? ORDER BY worker".format(self.table),
+                (group, time.time()),
+            ).fetchall()
+        return [worker for worker, in rows]
+
+    def claim(self, group, partitions, worker, ttl):
+        """Upsert leases in one transaction, overwriting only expired leases or the worker's own."""
+        now = time.time()
+        claimed = set()
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                for partition in partitions:
+                    cursor = self.connection.execute(
+                        "INSERT INTO {0} (grp, partition, worker, expires_at) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (grp, partition) DO UPDATE SET worker = excluded.worker, "
+                        "expires_at = excluded.expires_at WHERE {0}.worker = excluded.worker "
+                        "OR {0}.expires_at <= ?".format(self.table),
+                        (group, partition, worker, now + ttl, now),
+                    )
+                    if cursor.rowcount:
+                        claimed.add(partition)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def release(self, group, partitions, worker) -> None:
+        """Give back leases held by the worker."""
+        with self._lock:
+            self.connection.executemany(
+                "DELETE FROM {} WHERE grp = ? AND partition = ? AND worker = ?".format(self.table),
+                [(group, partition, worker) for partition in partitions],
+            )
+
+    def leave(self, group, worker, partitions) -> None:
+        """Remove a worker and release all its leases."""
+        with self._lock:
+            self.connection.execute("DELETE FROM {} WHERE grp = ? AND worker = ?".format(self.table), (group, worker))
+            self.connection.execute(
+                "DELETE FROM {}_workers WHERE grp = ? AND worker = ?".format(self.table), (group, worker)
+            )
+
+    def owners(self, group, partitions):
+        """Return the worker holding each leased partition."""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT partition, worker FROM {} WHERE grp = ? AND expires_at > ?".format(self.table),
+                (group, time.time()),
+            ).fetchall()
+        return dict(rows)
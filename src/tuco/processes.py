@@ -0,0 +1,122 @@
+"""Run transitions of many holders in worker processes."""
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Tuple  # noqa
+
+__all__ = ("ProcessOutcome", "ProcessRunner")
+
+
+class ProcessOutcome:
+    """What a transition run in a worker process ended with."""
+
+    __slots__ = ("holder", "result", "error", "state", "date")
+
+    def __init__(self, holder, result: bool, error: Optional[Exception], state, date) -> None:
+        """Initialize default values."""
+        self.holder = holder
+        self.result = result
+        self.error = error
+        self.state = state
+        self.date = date
+
+    def __repr__(self) -> str:
+        """Basic representation."""
+        return "<ProcessOutcome {!r} state {!r}{}>".format(
+            self.result, self.state, "" if self.error is None else " error {!r}".format(self.error)
+        )
+
+
+class ProcessRunner:
+    """Trigger an event over many holders in a process pool, so CPU bound commands are not serialized by the GIL.
+
+    Holders (or holder ids with ``load_holder``) are sent to the workers in chunks, each worker triggers the event
+    under the state machine lock and sends back the state, state date and result. The runner applies them to the
+    holders it was given, other changes made by commands stay in the worker. State machine classes and events are
+    pickled by reference, commands and ``load_holder`` must be importable functions. Locks only exclude other
+    processes when ``lock_class`` works across processes, like `tuco.locks.RedisLock`.
+
+    Workers are forked where the platform can fork, whatever the default start method is. Elsewhere they are spawned
+    and state machine classes must be importable, classes defined in functions cannot be unpickled there. Forked
+    workers open their own connections and files for the SQLite stores, journal and recorder they inherited.
+    """
+
+    def __init__(
+        self,
+        fsm_class,
+        workers: Optional[int] = None,
+        chunk_size: int = 64,
+        load_holder: Optional[Callable[[object], object]] = None,
+        lock: bool = True,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        """Start the worker processes.
+
+        :param load_holder: When given, `run` receives holder ids and the holder is loaded by the worker.
+        :param lock: Trigger events inside ``with fsm:``.
+        """
+        self.fsm_class = fsm_class
+        self.chunk_size = chunk_size
+        self.load_holder = load_holder
+        self.lock = lock
+        if executor is None:
+            fork = "fork" in multiprocessing.get_all_start_methods()
+            executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("fork" if fork else None)
+            )
+        self.executor = executor
+
+    def run(self, holders: Iterable[Any], event_name, *args, **kwargs) -> List[ProcessOutcome]:
+        """Trigger an event for every holder and return outcomes in the same order."""
+        holders = list(holders)
+        chunks = [holders[start : start + self.chunk_size] for start in range(0, len(holders), self.chunk_size)]
+        futures = [
+            self.executor.submit(
+                _run_chunk, self.fsm_class, chunk, event_name, args, kwargs, self.load_holder, self.lock
+            )
+            for chunk in chunks
+        ]
+
+        outcomes = []
+        for chunk, future in zip(chunks, futures):
+            for holder, (result, error, state, date) in zip(chunk, future.result()):
+                if self.load_holder is None and state is not None:
+                    accessor = self.fsm_class.get_holder_accessor(type(holder))
+                    holder = accessor.set(holder, self.fsm_class.state_attribute, state)
+                    holder = accessor.set(holder, self.fsm_class.date_attribute, date)
+                outcomes.append(ProcessOutcome(holder, result, error, state, date))
+        return outcomes
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the worker processes."""
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self) -> "ProcessRunner":
+        """Use the runner as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Stop the worker processes."""
+        self.shutdown()
+
+
+def _run_chunk(fsm_class, holders, event_name, args, kwargs, load_holder, lock) -> List[Tuple]:
+    """Trigger an event for a chunk of holders inside a worker process."""
+    outcomes = []
+    for holder in holders:
+        fsm = None
+        try:
+            if load_holder is not None:
+                holder = load_holder(holder)
+            fsm = fsm_class(holder)
+            if lock:
+                with fsm:
+                    result, error = fsm.trigger(event_name, *args, **kwargs), None
+            else:
+                result, error = fsm.trigger(event_name, *args, **kwargs), None
+        except Exception as e:  # noqa: B902
+            result, error = False, e
+        if fsm is None:
+            outcomes.append((result, error, None, None))
+        else:
+            outcomes.append((result, error, fsm.current_state, fsm.current_state_date))
+    return outcomes
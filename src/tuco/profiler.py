@@ -0,0 +1,138 @@
+"""Keep call profiles of slow transitions."""
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional  # noqa
+
+from tuco.journal import TIMEOUT_EVENT
+from tuco.properties import Deferred
+from tuco.utils import fully_qualified_name
+
+__all__ = ("SlowTransitionProfiler",)
+
+
+class SlowTransitionProfiler:
+    """Profile a sample of transitions and keep the captures of those slower than a threshold.
+
+    Assign an instance to ``FSM.profiler``. Sampled calls run under `cProfile`; when one takes more than
+    ``threshold`` seconds, its profile (loadable with `pstats`) and a JSON summary with the class, event, holder id,
+    duration and time spent in commands, on enter callbacks and the on change hook are written to ``directory``.
+    Only the last ``max_captures`` captures are kept. Calls which are not sampled are only timed, to count slow ones.
+
+    :param sample_rate: Fraction of calls profiled, profiling slows them down noticeably.
+    """
+
+    def __init__(
+        self, directory: str, threshold: float = 1.0, sample_rate: float = 0.01, max_captures: int = 100
+    ) -> None:
+        """Create the capture directory and continue after the captures it holds."""
+        self.directory = directory
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.max_captures = max_captures
+        #: Calls slower than the threshold, sampled or not
+        self.slow_calls = 0
+        self._random = random.Random()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sequence = max((capture["sequence"] for capture in self.captures()), default=-1) + 1
+
+    def profile(self, fsm, event_name, call: Callable[[], bool]) -> bool:
+        """Run a transition, profiling it when it is sampled."""
+        if getattr(self._local, "active", False) or self._random.random() >= self.sample_rate:
+            started = time.perf_counter()
+            try:
+                return call()
+            finally:
+                if time.perf_counter() - started > self.threshold:
+                    with self._lock:
+                        self.slow_calls += 1
+
+        from_state = fsm.current_state
+        profile = cProfile.Profile()
+        self._local.active = True
+        started = time.perf_counter()
+        try:
+            profile.enable()
+        except ValueError:  # Another profiler is running
+            self._local.active = False
+            return call()
+        try:
+            return call()
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - started
+            self._local.active = False
+            if duration > self.threshold:
+                with self._lock:
+                    self.slow_calls += 1
+                self._save(profile, fsm, event_name, from_state, duration)
+
+    def captures(self) -> List[Dict[str, Any]]:
+        """Return the summaries of the kept captures, oldest first, with the path of their ``profile``."""
+        captures = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.directory, name)) as summary:
+                captures.append(json.load(summary))
+        return sorted(captures, key=lambda capture: capture["sequence"])
+
+    def _save(self, profile: cProfile.Profile, fsm, event_name, from_state, duration: float) -> None:
+        """Write a capture over the oldest one of the ring."""
+        with self._lock:
+            sequence = self._sequence
+            self._sequence += 1
+        slot = os.path.join(self.directory, "capture-{:04d}".format(sequence % self.max_captures))
+        # Dumping creates the stats read by the phases below.
+        profile.dump_stats(slot + ".prof")
+
+        summary = {
+            "sequence": sequence,
+            "fsm": fully_qualified_name(fsm),
+            "event": event_name,
+            "holder": fsm.holder_id,
+            "from": from_state,
+            "to": fsm.current_state,
+            "duration": duration,
+            "phases": self._phases(profile.stats, fsm, event_name, from_state),
+            "profile": slot + ".prof",
+            "at": time.time(),
+        }
+        with open(slot + ".json.tmp", "w") as output:
+            json.dump(summary, output, default=repr)
+        os.replace(slot + ".json.tmp", slot + ".json")
+
+    @staticmethod
+    def _phases(stats: Dict, fsm, event_name, from_state) -> Dict[str, float]:
+        """Time spent in the commands of the transition, in on enter callbacks and in the on change hook."""
+        state = fsm._states.get(from_state)
+        if event_name == TIMEOUT_EVENT:
+            transition = getattr(state, "timeout", None)
+        else:
+            transition = fsm._transitions.get(from_state, {}).get(event_name)
+        target = fsm._states.get(getattr(transition, "target_state", None))
+        return {
+            "commands": _cumulative_time(stats, getattr(transition, "commands", [])),
+            "on_enter": _cumulative_time(stats, getattr(target, "on_enter", [])),
+            "on_change": _cumulative_time(stats, [getattr(fsm, "_on_change_event", None)]),
+        }
+
+
+def _cumulative_time(stats: Dict, functions: Iterable[Any]) -> float:
+    """Sum the cumulative time of functions found in profile stats."""
+    total = 0.0
+    for function in functions:
+        if isinstance(function, Deferred):
+            function = function.callback
+        code = getattr(getattr(function, "__func__", function), "__code__", None)
+        if code is None:
+            continue
+        entry = stats.get((code.co_filename, code.co_firstlineno, code.co_name))
+        if entry is not None:
+            total += entry[3]
+    return total
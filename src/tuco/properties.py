@@ -1,5 +1,5 @@
 """FSM Descriptors."""
-from typing import Callable, List, Optional
+from typing import Callable, List, Optional, Tuple  # noqa
 
 TucoCallback = Callable[[object], bool]
 
@@ -19,12 +19,28 @@ class State(BaseState):
         error: Optional["Error"] = None,
         timeout: Optional["Timeout"] = None,
         on_enter: Optional[List[TucoCallback]] = None,
+        parent: Optional["CompositeState"] = None,
     ) -> None:
-        """Initialize default values."""
+        """Initialize default values.
+
+        :param parent: Composite state whose events, error, timeout and on enter callbacks this state inherits.
+        """
         self.events = events or []  # type: List[Event]
         self.error = error
         self.timeout = timeout
         self.on_enter = on_enter or []  # type: List[TucoCallback]
+        self.parent = parent
+
+
+class CompositeState(State):
+    """Group states sharing events, error, timeout and on enter callbacks.
+
+    A composite state is never current, it is merged into its children when the state machine class is created:
+    children keep their own events, error and timeout over the inherited ones, and on enter callbacks of parents run
+    before theirs every time a child is entered. Composite states can be nested.
+    """
+
+    pass
 
 
 class FinalState(BaseState):
@@ -39,17 +55,60 @@ class FinalState(BaseState):
 class Event:
     """Describe an event."""
 
-    def __init__(self, event_name, target_state, commands=None, error=None) -> None:
-        """Initialize default values."""
+    #: Class and state first declaring the event, set by the metaclass so the event pickles by reference
+    _owner = None  # type: Optional[Tuple[type, str]]
+
+    def __init__(self, event_name, target_state, commands=None, error=None, deadline=None, guards=None) -> None:
+        """Initialize default values.
+
+        :param deadline: Seconds the commands have to finish, after that the event is routed to its error.
+        :param guards: Side effect free predicates receiving the holder, all of them must pass before any command runs.
+        """
         self.event_name = event_name
         self.target_state = target_state
         self.commands = commands or []
         self.error = error
+        self.deadline = deadline  # type: Optional[float]
+        self.guards = guards or []  # type: List[Callable[[object], bool]]
 
     def __repr__(self) -> str:
         """Basic representation."""
         return "<FSM Event {!r} with target state {!r}>".format(self.event_name, self.target_state)
 
+    def __reduce_ex__(self, protocol):
+        """Pickle events of state machine classes by reference to their class and state."""
+        owner = self._owner
+        if owner is None:
+            return super().__reduce_ex__(protocol)
+        return _load_event, owner + (self.event_name,)
+
+    def __copy__(self) -> "Event":
+        """Copy the event itself, unlike pickling."""
+        event = Event.__new__(Event)
+        event.__dict__.update(self.__dict__)
+        event._owner = None
+        return event
+
+
+class Deferred:
+    """Mark a command or on enter callback to run from the FSM outbox after the transition.
+
+    Deferred callbacks cannot veto a transition, their return value is ignored. When the FSM has no outbox they run
+    inline like any other callback.
+    """
+
+    def __init__(self, callback: TucoCallback) -> None:
+        """Wrap the callback."""
+        self.callback = callback
+
+    def __call__(self, *args, **kwargs):
+        """Run the callback inline."""
+        return self.callback(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        """Basic representation."""
+        return "<FSM Deferred {!r}>".format(self.callback)
+
 
 class Error:
     """Error handling."""
@@ -63,8 +122,17 @@ class Error:
 class Timeout:
     """Timeout class."""
 
-    def __init__(self, timedelta, target_state, commands=None) -> None:
-        """Initialize default values."""
+    def __init__(self, timedelta, target_state, commands=None, deadline=None) -> None:
+        """Initialize default values.
+
+        :param deadline: Seconds the commands have to finish, after that the state error is triggered.
+        """
         self.timedelta = timedelta
         self.target_state = target_state
         self.commands = commands or []
+        self.deadline = deadline  # type: Optional[float]
+
+
+def _load_event(fsm_class, state_name, event_name) -> Event:
+    """Find an event of a state machine class."""
+    return fsm_class._transitions[state_name][event_name]
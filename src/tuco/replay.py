@@ -0,0 +1,316 @@
+"""Record transitions of production traffic and replay them against fresh holders."""
+import atexit
+import copy
+import enum
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional  # noqa
+
+from tuco.accessors import AttributeAccessor
+from tuco.journal import TIMEOUT_EVENT
+from tuco.locks import MemoryLock
+from tuco.properties import FinalState
+from tuco.utils import fully_qualified_name, import_by_name, reopen_after_fork
+
+__all__ = ("ReplayReport", "TraceRecorder", "TraceReplayer")
+
+OK, FAILED, ERROR = "ok", "failed", "error"
+#: Holder attribute telling stubbed commands how the recorded call ended
+OUTCOME_ATTRIBUTE = "_tuco_replay_outcome"
+#: Replayed holders are due for any timeout
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class TraceRecorder:
+    """Append every `FSM.trigger` and fired `FSM.trigger_timeout` call to a gzipped JSON lines file.
+
+    Assign an instance to ``FSM.recorder``. Arguments are only stored as a fingerprint, so traces do not leak
+    payloads. Call `close` (or use it as a context manager) to finish the gzip stream, it is also closed at exit.
+    Forked processes write their own trace, named after the trace of the parent and their process id.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open the trace for appending."""
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        atexit.register(self.close)
+        reopen_after_fork(self)
+
+    def reopen(self) -> None:
+        """Continue in a trace named after the process id, used by forked processes."""
+        self._lock = threading.Lock()
+        if self._file.closed:
+            return
+        # Closing the inherited stream would end the gzip member the parent is still writing.
+        inherited = self._file.buffer  # type: Any
+        inherited.fileobj = None
+        root, extension = os.path.splitext(self.path)
+        self.path = "{}-{}{}".format(root, os.getpid(), extension)
+        self._file = gzip.open(self.path, "at", encoding="utf-8")
+
+    def record(self, fsm, event_name, args: tuple, kwargs: dict, call: Callable[[], bool]) -> bool:
+        """Run a transition and write how it went."""
+        from_state = fsm.current_state
+        started = time.perf_counter()
+        exception = None
+        try:
+            result = call()
+        except Exception as e:  # noqa: B902
+            exception = e
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self._write(
+                {
+                    "fsm": fully_qualified_name(fsm),
+                    "holder": fsm.holder_id,
+                    "from": from_state,
+                    "event": _encode_event(event_name),
+                    "args": _fingerprint(args, kwargs),
+                    "outcome": ERROR if exception is not None else OK if result else FAILED,
+                    "exception": exception.__class__.__name__ if exception is not None else None,
+                    "to": fsm.current_state,
+                    "duration": duration,
+                    "at": time.time(),
+                }
+            )
+        return result
+
+    def flush(self) -> None:
+        """Write buffered records."""
+        with self._lock:
+            self._file.flush()
+
+    def _before_fork(self) -> None:
+        """Do not let forked processes inherit buffered records."""
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self) -> None:
+        """Finish the trace file."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        atexit.unregister(self.close)
+
+    def __enter__(self) -> "TraceRecorder":
+        """Use the recorder as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Close the trace."""
+        self.close()
+
+    def _write(self, record: dict) -> None:
+        """Append a record as a JSON line."""
+        line = json.dumps(record, default=repr) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+
+class ReplayReport:
+    """Outcome of `TraceReplayer.replay`."""
+
+    def __init__(self) -> None:
+        """Start empty."""
+        self.calls = 0
+        #: Wall clock seconds spent replaying
+        self.elapsed = 0.0
+        self.latencies = []  # type: List[float]
+        self.recorded_latencies = []  # type: List[float]
+        #: Recorded calls ending with another outcome or state, with ``replayed_outcome`` and ``replayed_to`` added
+        self.divergences = []  # type: List[Dict[str, Any]]
+
+    @property
+    def throughput(self) -> float:
+        """Calls replayed per second."""
+        return self.calls / self.elapsed if self.elapsed else 0.0
+
+    def latency(self, quantile: float) -> Optional[float]:
+        """Return the replayed latency, in seconds, below which the given fraction of calls finished."""
+        return _quantile(self.latencies, quantile)
+
+    def recorded_latency(self, quantile: float) -> Optional[float]:
+        """Return the same quantile for the recorded calls."""
+        return _quantile(self.recorded_latencies, quantile)
+
+    def __repr__(self) -> str:
+        """Basic representation."""
+        return "<ReplayReport of {} calls at {:.0f}/s with {} divergences>".format(
+            self.calls, self.throughput, len(self.divergences)
+        )
+
+
+class TraceReplayer:
+    """Drive recorded calls against in-memory holders with every command stubbed.
+
+    Stubbed commands end each call the way the recorded one ended (returning True, returning False or raising), so
+    a divergence means the state machine definition or tuco itself changed behavior. Hooks, locks, outboxes and other
+    extensions are disabled.
+
+    :param fsm_classes: Classes to replay with, by fully qualified name of the recorded class, others are imported.
+    """
+
+    def __init__(self, path: str, fsm_classes: Optional[Mapping[str, Any]] = None) -> None:
+        """Point to a trace."""
+        self.path = path
+        self.fsm_classes = dict(fsm_classes or {})
+        self._stubbed = {}  # type: Dict[str, Any]
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over recorded calls."""
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def replay(self, speed: Optional[float] = None) -> ReplayReport:
+        """Replay every recorded call.
+
+        :param speed: None replays as fast as possible, otherwise calls are spaced like the recorded ones, 2.0 being
+            twice as fast.
+        """
+        report = ReplayReport()
+        first_at = None
+        started = time.perf_counter()
+        for record in self.records():
+            if speed is not None:
+                first_at = record["at"] if first_at is None else first_at
+                delay = (record["at"] - first_at) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+            fsm = self._build_fsm(record)
+            call_started = time.perf_counter()
+            outcome = self._call(fsm, record)
+            report.latencies.append(time.perf_counter() - call_started)
+            report.recorded_latencies.append(record["duration"])
+            report.calls += 1
+            if outcome != record["outcome"] or fsm.current_state != record["to"]:
+                report.divergences.append(dict(record, replayed_outcome=outcome, replayed_to=fsm.current_state))
+
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def _build_fsm(self, record: Dict[str, Any]):
+        """Return a state machine around a fresh holder sitting in the recorded state."""
+        fsm_class = self._stubbed_class(record["fsm"])
+        holder = SimpleNamespace(
+            **{
+                fsm_class.id_field: record["holder"],
+                fsm_class.state_attribute: record["from"],
+                fsm_class.date_attribute: EPOCH,
+                OUTCOME_ATTRIBUTE: record["outcome"],
+            }
+        )
+        return fsm_class(holder)
+
+    @staticmethod
+    def _call(fsm, record: Dict[str, Any]) -> str:
+        """Replay a call and return its outcome."""
+        event_name = _decode_event(record["event"])
+        try:
+            if event_name == TIMEOUT_EVENT:
+                result = fsm.trigger_timeout()
+            else:
+                result = fsm.trigger(event_name)
+        except Exception:  # noqa: B902
+            return ERROR
+        return OK if result else FAILED
+
+    def _stubbed_class(self, name: str) -> Any:
+        """Return a subclass of the recorded class whose commands are stubs."""
+        stubbed = self._stubbed.get(name)
+        if stubbed is None:
+            fsm_class = self.fsm_classes.get(name) or import_by_name(name)
+            attributes = {name: _stub_state(state) for name, state in (fsm_class.get_all_states() or {}).items()}
+            attributes.update(
+                {
+                    "__module__": fsm_class.__module__,
+                    "holder_accessor": AttributeAccessor(),
+                    "lock_class": MemoryLock,
+                    "_on_change_event": None,
+                    "_on_error_event": None,
+                    "outbox": None,
+                    "timeout_store": None,
+                    "journal": None,
+                    "mailbox": None,
+                    "recorder": None,
+                    "profiler": None,
+                }
+            )
+            stubbed = self._stubbed[name] = type(fsm_class)("Replayed" + fsm_class.__name__, (fsm_class,), attributes)
+        return stubbed
+
+
+def _replayed_command(holder, *args, **kwargs) -> bool:
+    """Stand in for a command, ending like the recorded call did."""
+    outcome = getattr(holder, OUTCOME_ATTRIBUTE, OK)
+    if outcome == ERROR:
+        raise RuntimeError("Replayed command failure.")
+    return outcome == OK
+
+
+def _replayed_guard(holder) -> bool:
+    """Stand in for the guards of an event, refusing the calls recorded as errors."""
+    return getattr(holder, OUTCOME_ATTRIBUTE, OK) != ERROR
+
+
+def _stub(item):
+    """Return a copy of an event, error or timeout with stubbed commands."""
+    if item is None:
+        return None
+    item = copy.copy(item)
+    item.commands = [_replayed_command for _ in item.commands]
+    if getattr(item, "guards", None):
+        item.guards = [_replayed_guard]
+    if getattr(item, "error", None) is not None:
+        item.error = _stub(item.error)
+    return item
+
+
+def _stub_state(state):
+    """Return a copy of a state with every callback stubbed."""
+    state = copy.copy(state)
+    state.on_enter = [_replayed_command for _ in state.on_enter]
+    if not isinstance(state, FinalState):
+        state.events = [_stub(event) for event in state.events]
+        state.timeout = _stub(state.timeout)
+        state.error = _stub(state.error)
+    return state
+
+
+def _fingerprint(args: tuple, kwargs: dict) -> Optional[str]:
+    """Summarize arguments without storing them."""
+    if not args and not kwargs:
+        return None
+    return hashlib.sha1(repr((args, sorted(kwargs.items()))).encode()).hexdigest()[:16]
+
+
+def _encode_event(event_name):
+    """Make an event name JSON friendly, enum members are stored by reference."""
+    if isinstance(event_name, enum.Enum):
+        return {"enum": fully_qualified_name(event_name), "name": event_name.name}
+    return event_name
+
+
+def _decode_event(value):
+    """Reverse `_encode_event`."""
+    if isinstance(value, dict):
+        return import_by_name(value["enum"])[value["name"]]
+    return value
+
+
+def _quantile(values: List[float], quantile: float) -> Optional[float]:
+    """Return the nearest rank quantile of some values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(quantile * len(ordered))) - 1))]
@@ -0,0 +1,293 @@
+"""Simulate large populations of holders to plan capacity before launching a state machine."""
+import math
+import random
+from collections import Counter, defaultdict
+from datetime import timedelta
+from typing import Any, Dict, List, Mapping, Optional, Tuple  # noqa
+
+from tuco.exceptions import TucoEventNotFoundError
+from tuco.journal import TIMEOUT_EVENT
+
+__all__ = ("MarkovSimulator", "SimulationReport")
+
+#: Event, target state and probability of the event given that no previous event of the state happened
+StepChoice = Tuple[Any, str, float]
+Edge = Tuple[str, Any, str]
+
+
+class SimulationReport:
+    """Outcome of `MarkovSimulator.run`."""
+
+    def __init__(self, step: timedelta, steps: int) -> None:
+        """Start empty."""
+        self.step = step
+        self.steps = steps
+        self.arrivals = 0
+        #: Holders per state at the end of the simulation
+        self.occupancy = Counter()  # type: Counter
+        #: Holders per state averaged over all steps
+        self.mean_occupancy = {}  # type: Dict[str, float]
+        #: Transitions per ``(from_state, event, to_state)``, timeouts use `tuco.journal.TIMEOUT_EVENT` as event
+        self.edges = Counter()  # type: Counter
+        #: Holders per final state reached
+        self.finals = Counter()  # type: Counter
+        #: Holders that reached a final state by number of steps it took them
+        self._time_to_final = Counter()  # type: Counter
+
+    @property
+    def duration(self) -> timedelta:
+        """Simulated time."""
+        return self.step * self.steps
+
+    @property
+    def completed(self) -> int:
+        """Holders that reached a final state."""
+        return sum(self.finals.values())
+
+    @property
+    def timeouts(self) -> int:
+        """Timeouts fired."""
+        return sum(count for (_, event, _), count in self.edges.items() if event == TIMEOUT_EVENT)
+
+    def throughput(self, per: timedelta = timedelta(hours=1)) -> Dict[Edge, float]:
+        """Return the average number of transitions per edge in each period."""
+        periods = self.duration / per
+        return {edge: count / periods for edge, count in self.edges.items()}
+
+    def time_to_final(self, quantile: float) -> Optional[timedelta]:
+        """Return the time taken to reach a final state by the given fraction of completed holders."""
+        if not 0 <= quantile <= 1:
+            raise ValueError("Quantile must be between 0 and 1, got {!r}.".format(quantile))
+        if not self._time_to_final:
+            return None
+
+        wanted = max(1, math.ceil(quantile * self.completed))
+        seen = 0
+        for steps, count in sorted(self._time_to_final.items()):
+            seen += count
+            if seen >= wanted:
+                return self.step * steps
+        return None
+
+    def __repr__(self) -> str:
+        """Basic representation."""
+        return "<SimulationReport of {} with {} arrivals and {} completed>".format(
+            self.duration, self.arrivals, self.completed
+        )
+
+
+class MarkovSimulator:
+    """Run populations of holders through a state machine definition with virtual time.
+
+    Holders are not simulated one by one: the population is kept as counts grouped by state and entry step (only for
+    states with a timeout), and each step moves whole groups with binomial draws, so millions of holders cost about as
+    much as a few thousand. Each state also keeps a histogram of when its holders arrived, to measure how long they
+    took to reach a final state: holders leaving through events are drawn from it at random and holders timing out
+    take the earliest arrivals. Commands are not run, every event succeeds.
+
+    :param event_rates: ``{state_name: {event_name: rate}}`` where rate is how many times per hour a holder sitting
+        in the state triggers the event. Competing events of a state leave it with probabilities proportional to their
+        rates and timeouts fire once a holder stayed ``Timeout.timedelta`` in its state.
+    :param arrivals_per_hour: New holders entering the initial state, following a Poisson process.
+    :param step: Virtual time resolution, timeouts shorter than a step fire after one step.
+    """
+
+    #: Arrival histograms never have more buckets than this, long runs measure time to final in coarser steps
+    arrival_buckets = 1000
+
+    def __init__(
+        self,
+        fsm_class,
+        event_rates: Mapping[str, Mapping[Any, float]],
+        arrivals_per_hour: float = 0.0,
+        step: timedelta = timedelta(minutes=1),
+        seed: Optional[int] = None,
+    ) -> None:
+        """Precompute the per step probabilities of each state."""
+        self.fsm_class = fsm_class
+        self.arrivals_per_hour = arrivals_per_hour
+        self.step = step
+        self.random = random.Random(seed)
+
+        states = fsm_class.get_all_states() or {}
+        self._finals = set(fsm_class.get_all_finals())
+        self._timeouts = {
+            state_name: (max(1, math.ceil(timeout.timedelta / step)), timeout.target_state)
+            for state_name, timeout in fsm_class.get_all_timeouts()
+        }  # type: Dict[str, Tuple[int, str]]
+        self._choices = {}  # type: Dict[str, List[StepChoice]]
+        for state_name, rates in event_rates.items():
+            if state_name not in states:
+                raise TucoEventNotFoundError("State {!r} not found in {!r}".format(state_name, fsm_class))
+            self._choices[state_name] = self._step_choices(state_name, rates)
+
+    def run(self, duration: timedelta, initial: Optional[Mapping[str, int]] = None) -> SimulationReport:
+        """Simulate the given duration, optionally starting with holders already sitting in some states."""
+        steps = max(1, math.ceil(duration / self.step))
+        report = SimulationReport(self.step, steps)
+        resolution = max(1, math.ceil(steps / self.arrival_buckets))
+        # {state_name: {entry_step: holders}}
+        population = defaultdict(Counter)  # type: Dict[str, Counter]
+        # {state_name: {arrival_step // resolution: holders}}
+        arrivals = defaultdict(Counter)  # type: Dict[str, Counter]
+        for state_name, count in (initial or {}).items():
+            self._enter(population, arrivals, report, state_name, 0, Counter({0: count}), resolution)
+
+        arrivals_per_step = self.arrivals_per_hour * (self.step / timedelta(hours=1))
+        occupancy_sum = Counter()  # type: Counter
+        for now in range(steps):
+            # Target state, step they enter the target at and holders by arrival bucket
+            moves = []  # type: List[Tuple[str, int, Counter]]
+            for state_name, groups in population.items():
+                self._step_state(state_name, groups, arrivals[state_name], now, moves, report)
+
+            new_holders = self._poisson(arrivals_per_step)
+            if new_holders:
+                report.arrivals += new_holders
+                moves.append((self.fsm_class.initial_state, now, Counter({now // resolution: new_holders})))
+
+            for state_name, entry_step, buckets in moves:
+                self._enter(population, arrivals, report, state_name, entry_step, buckets, resolution)
+            for state_name, groups in population.items():
+                occupancy_sum[state_name] += sum(groups.values())
+
+        report.occupancy = +Counter({name: sum(groups.values()) for name, groups in population.items()})
+        report.mean_occupancy = {name: total / steps for name, total in occupancy_sum.items() if total}
+        return report
+
+    def _step_choices(self, state_name: str, rates: Mapping[Any, float]) -> List[StepChoice]:
+        """Turn hourly rates into chained probabilities of leaving a state through each event in one step."""
+        transitions = self.fsm_class._transitions.get(state_name, {})
+        for event_name in rates:
+            if event_name not in transitions:
+                raise TucoEventNotFoundError("Event {!r} not found on state {!r}".format(event_name, state_name))
+
+        total_rate = sum(rates.values())
+        if total_rate <= 0:
+            return []
+        leave = 1 - math.exp(-total_rate * (self.step / timedelta(hours=1)))
+        choices = []
+        remaining = 1.0
+        for event_name, rate in rates.items():
+            probability = leave * rate / total_rate
+            choices.append((event_name, transitions[event_name].target_state, min(1.0, probability / remaining)))
+            remaining -= probability
+        return choices
+
+    def _step_state(
+        self, state_name: str, groups: Counter, arrivals: Counter, now: int, moves: list, report: SimulationReport
+    ) -> None:
+        """Move the holders of a state that time out or trigger an event during a step."""
+        choices = self._choices.get(state_name, ())
+        timeout = self._timeouts.get(state_name)
+        # Holders are summed per target before drawing their arrivals, so the histogram is walked once per target.
+        leaving = Counter()  # type: Counter
+        for entry_step, count in list(groups.items()):
+            if timeout is not None and now - entry_step >= timeout[0]:
+                # Holders that entered first mostly arrived first, timeouts take the oldest arrivals.
+                buckets = self._take_oldest(arrivals, count)
+                moves.append((timeout[1], entry_step + timeout[0], buckets))
+                report.edges[state_name, TIMEOUT_EVENT, timeout[1]] += count
+                del groups[entry_step]
+                continue
+
+            remaining = count
+            for event_name, target_state, probability in choices:
+                moved = self._binomial(remaining, probability)
+                if moved:
+                    leaving[target_state, now + 1] += moved
+                    report.edges[state_name, event_name, target_state] += moved
+                    remaining -= moved
+            if remaining:
+                groups[entry_step] = remaining
+            else:
+                del groups[entry_step]
+
+        for (target_state, entry_step), count in leaving.items():
+            moves.append((target_state, entry_step, self._draw_arrivals(arrivals, count)))
+
+    def _draw_arrivals(self, arrivals: Counter, count: int) -> Counter:
+        """Take holders out of an arrival histogram, picking buckets in proportion to their size."""
+        drawn = Counter()  # type: Counter
+        total = sum(arrivals.values())
+        for bucket, holders in list(arrivals.items()):
+            if count <= 0:
+                break
+            # Never take more than the bucket has, nor leave more than the remaining buckets can give.
+            taken = min(holders, max(count - (total - holders), self._binomial(count, holders / total)))
+            total -= holders
+            if taken:
+                drawn[bucket] = taken
+                count -= taken
+                if taken == holders:
+                    del arrivals[bucket]
+                else:
+                    arrivals[bucket] = holders - taken
+        return drawn
+
+    @staticmethod
+    def _take_oldest(arrivals: Counter, count: int) -> Counter:
+        """Take holders out of an arrival histogram, starting from the earliest bucket."""
+        taken = Counter()  # type: Counter
+        for bucket in sorted(arrivals):
+            if count <= 0:
+                break
+            holders = arrivals[bucket]
+            if holders <= count:
+                del arrivals[bucket]
+                taken[bucket] = holders
+            else:
+                arrivals[bucket] = holders - count
+                taken[bucket] = count
+            count -= taken[bucket]
+        return taken
+
+    def _enter(
+        self,
+        population,
+        arrivals,
+        report: SimulationReport,
+        state_name: str,
+        now: int,
+        buckets: Counter,
+        resolution: int,
+    ) -> None:
+        """Put holders in a state, or count them as completed when it is final."""
+        if state_name in self._finals:
+            count = 0
+            for bucket, holders in buckets.items():
+                report._time_to_final[now - bucket * resolution] += holders
+                count += holders
+            report.finals[state_name] += count
+            return
+        # Only states with a timeout need to know when holders entered them, merging the rest keeps groups few.
+        entry_step = now if state_name in self._timeouts else 0
+        population[state_name][entry_step] += sum(buckets.values())
+        arrivals[state_name].update(buckets)
+
+    def _binomial(self, trials: int, probability: float) -> int:
+        """Draw how many of the trials succeed."""
+        if trials <= 0 or probability <= 0:
+            return 0
+        if probability >= 1:
+            return trials
+        binomialvariate = getattr(self.random, "binomialvariate", None)
+        if binomialvariate is not None:
+            return binomialvariate(trials, probability)
+        if trials < 64:
+            return sum(1 for _ in range(trials) if self.random.random() < probability)
+        mean = trials * probability
+        value = round(self.random.gauss(mean, math.sqrt(mean * (1 - probability))))
+        return min(trials, max(0, value))
+
+    def _poisson(self, mean: float) -> int:
+        """Draw a number of arrivals."""
+        if mean <= 0:
+            return 0
+        if mean > 64:
+            return max(0, round(self.random.gauss(mean, math.sqrt(mean))))
+        limit, product, count = math.exp(-mean), self.random.random(), 0
+        while product > limit:
+            product *= self.random.random()
+            count += 1
+        return count
@@ -0,0 +1,232 @@
+"""Columnar storage for large numbers of lightweight state holders."""
+import json
+import math
+import mmap
+import os
+import struct
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional  # noqa
+
+from tuco.exceptions import TucoInvalidStateHolderError
+from tuco.utils import to_timestamp
+
+__all__ = ("StateTable",)
+
+HEADER = struct.Struct("<8sQQ")
+MAGIC = b"TUCOSTT1"
+#: Bytes used by a row: id, state date timestamp and state code
+ROW_SIZE = 8 + 8 + 2
+
+
+class _RowProxy:
+    """Base class of generated row proxies, attributes are added per state machine class."""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: "StateTable", row: int) -> None:
+        """Point to a row of the table."""
+        self._table = table
+        self._row = row
+
+    def __copy__(self) -> SimpleNamespace:
+        """Return a detached snapshot so on change receives the state before the transition."""
+        table = self._table
+        return SimpleNamespace(
+            **{
+                table.fsm_class.id_field: table.get_id(self._row),
+                table.fsm_class.state_attribute: table.get_state(self._row),
+                table.fsm_class.date_attribute: table.get_date(self._row),
+            }
+        )
+
+    def __repr__(self) -> str:
+        """Basic representation."""
+        return "<StateTable row {} of {!r}>".format(self._row, self._table)
+
+
+class StateTable:
+    """Keep ids, state codes and state dates of many holders in parallel arrays.
+
+    Rows are exposed as small proxies which have the id, state and date attributes expected by ``fsm_class``, so
+    existing state machines can drive them unchanged. When ``path`` is given the arrays live in a memory mapped file
+    and state names are kept in ``path + '.states'``, otherwise they live in anonymous memory.
+    """
+
+    def __init__(self, fsm_class, path: Optional[str] = None, capacity: int = 1024) -> None:
+        """Create or open a table."""
+        self.fsm_class = fsm_class
+        self.path = path
+        self._file = None
+        self._index = None  # type: Optional[Dict[int, int]]
+
+        state_names = sorted(fsm_class.get_all_states() or {}) + [fsm_class.fatal_state]
+        if path is not None and os.path.exists(path):
+            with open(path + ".states") as f:
+                stored_names = json.load(f)
+            self._states = stored_names + [name for name in state_names if name not in stored_names]
+            self._file = open(path, "r+b")
+            self._map = mmap.mmap(self._file.fileno(), 0)
+            magic, self._capacity, self._length = HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise TucoInvalidStateHolderError("{!r} is not a state table.".format(path))
+        else:
+            self._states = [None] + state_names
+            self._capacity, self._length = capacity, 0
+            if path is None:
+                self._map = mmap.mmap(-1, self._size(capacity))
+            else:
+                self._file = open(path, "w+b")
+                self._file.truncate(self._size(capacity))
+                self._map = mmap.mmap(self._file.fileno(), 0)
+            HEADER.pack_into(self._map, 0, MAGIC, self._capacity, self._length)
+
+        if path is not None:
+            with open(path + ".states", "w") as f:
+                json.dump(self._states, f)
+        self._codes = {name: code for code, name in enumerate(self._states)}
+        self._row_class = type(
+            "{}Row".format(fsm_class.__name__),
+            (_RowProxy,),
+            {
+                "__slots__": (),
+                fsm_class.id_field: property(lambda row: row._table.get_id(row._row)),
+                fsm_class.state_attribute: property(
+                    lambda row: row._table.get_state(row._row), lambda row, value: row._table.set_state(row._row, value)
+                ),
+                fsm_class.date_attribute: property(
+                    lambda row: row._table.get_date(row._row), lambda row, value: row._table.set_date(row._row, value)
+                ),
+            },
+        )
+        self._bind_columns()
+
+    def __len__(self) -> int:
+        """Number of rows."""
+        return self._length
+
+    def __repr__(self) -> str:
+        """Basic representation."""
+        return "<StateTable of {} with {} rows>".format(self.fsm_class.__name__, self._length)
+
+    def append(self, holder_id: int, state: Optional[str] = None, date: Optional[datetime] = None) -> int:
+        """Add a row and return its index, the state machine sets the initial state when it wraps the row."""
+        if self._length == self._capacity:
+            self._grow(self._capacity * 2)
+        row = self._length
+        self._ids[row] = holder_id
+        self._state_codes[row] = self._codes[state]
+        self._dates[row] = math.nan if date is None else to_timestamp(date)
+        self._length += 1
+        HEADER.pack_into(self._map, 0, MAGIC, self._capacity, self._length)
+        if self._index is not None:
+            self._index[holder_id] = row
+        return row
+
+    def holder(self, row: int) -> _RowProxy:
+        """Return a proxy to be used as container object of the state machine."""
+        if not 0 <= row < self._length:
+            raise IndexError(row)
+        return self._row_class(self, row)
+
+    def fsm(self, row: int):
+        """Return a state machine driving a row."""
+        return self.fsm_class(self.holder(row))
+
+    def holders(self) -> Iterator[_RowProxy]:
+        """Iterate over proxies of all rows."""
+        for row in range(self._length):
+            yield self._row_class(self, row)
+
+    def find(self, holder_id: int) -> Optional[int]:
+        """Return the row of a holder id, the id index is built on first use."""
+        if self._index is None:
+            self._index = {row_id: row for row, row_id in enumerate(self._ids[: self._length])}
+        return self._index.get(holder_id)
+
+    def count_by_state(self) -> Dict[Optional[str], int]:
+        """Count rows per state."""
+        counts = [0] * len(self._states)
+        for code in self._state_codes[: self._length]:
+            counts[code] += 1
+        return {self._states[code]: count for code, count in enumerate(counts) if count}
+
+    def get_id(self, row: int) -> int:
+        """Return the holder id of a row."""
+        return self._ids[row]
+
+    def get_state(self, row: int) -> Optional[str]:
+        """Return the state name of a row."""
+        return self._states[self._state_codes[row]]
+
+    def set_state(self, row: int, state: Optional[str]) -> None:
+        """Change the state of a row."""
+        try:
+            self._state_codes[row] = self._codes[state]
+        except KeyError:
+            raise TucoInvalidStateHolderError("Unknown state {!r} for {!r}.".format(state, self)) from None
+
+    def get_date(self, row: int) -> Optional[datetime]:
+        """Return the state date of a row as an aware UTC date."""
+        timestamp = self._dates[row]
+        if math.isnan(timestamp):
+            return None
+        return datetime.fromtimestamp(timestamp, timezone.utc)
+
+    def set_date(self, row: int, date: Optional[datetime]) -> None:
+        """Change the state date of a row, naive dates are considered to be in UTC."""
+        self._dates[row] = math.nan if date is None else to_timestamp(date)
+
+    def flush(self) -> None:
+        """Write changes of a file backed table to disk."""
+        self._map.flush()
+
+    def close(self) -> None:
+        """Flush and unmap the table."""
+        self._release_columns()
+        if self._file is not None:
+            self._map.flush()
+        self._map.close()
+        if self._file is not None:
+            self._file.close()
+
+    @staticmethod
+    def _size(capacity: int) -> int:
+        """Bytes needed by a table with the given capacity."""
+        return HEADER.size + capacity * ROW_SIZE
+
+    def _bind_columns(self) -> None:
+        """Create typed views of each column inside the mapping."""
+        capacity = self._capacity
+        view = memoryview(self._map)
+        ids_start = HEADER.size
+        dates_start = ids_start + capacity * 8
+        codes_start = dates_start + capacity * 8
+        self._ids = view[ids_start:dates_start].cast("q")
+        self._dates = view[dates_start:codes_start].cast("d")
+        self._state_codes = view[codes_start : codes_start + capacity * 2].cast("H")
+        view.release()
+
+    def _release_columns(self) -> None:
+        """Release column views so the mapping can be closed."""
+        for column in (self._ids, self._dates, self._state_codes):
+            column.release()
+
+    def _grow(self, capacity: int) -> None:
+        """Move columns to a bigger mapping."""
+        length = self._length
+        ids, dates, codes = bytes(self._ids[:length]), bytes(self._dates[:length]), bytes(self._state_codes[:length])
+        self._release_columns()
+        self._map.close()
+        if self._file is None:
+            self._map = mmap.mmap(-1, self._size(capacity))
+        else:
+            self._file.truncate(self._size(capacity))
+            self._map = mmap.mmap(self._file.fileno(), 0)
+
+        self._capacity = capacity
+        self._bind_columns()
+        self._ids[:length] = memoryview(ids).cast("q")
+        self._dates[:length] = memoryview(dates).cast("d")
+        self._state_codes[:length] = memoryview(codes).cast("H")
+        HEADER.pack_into(self._map, 0, MAGIC, self._capacity, self._length)
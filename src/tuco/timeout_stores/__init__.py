@@ -0,0 +1,4 @@
+"""Timeout stores implementation."""
+__all__ = ("SQLiteTimeoutStore",)
+
+from .sqlite import SQLiteTimeoutStore
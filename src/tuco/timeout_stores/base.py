@@ -0,0 +1,82 @@
+"""Basic timeout store interface."""
+from datetime import datetime
+from typing import AbstractSet, Callable, Iterable, Iterator, List, Optional, Tuple  # noqa
+
+from tuco.exceptions import TucoAlreadyLockedError
+from tuco.utils import fully_qualified_name, to_timestamp
+
+DueTimeout = Tuple[object, str, datetime]
+#: Number of partitions and the partitions wanted, see `tuco.partitions.PartitionCoordinator`
+Partitions = Tuple[int, AbstractSet[int]]
+
+
+class BaseTimeoutStore:
+    """Keep one due date per holder whose current state has a timeout.
+
+    Assign an instance to ``FSM.timeout_store`` and it is updated on every state change.
+    """
+
+    def track(self, fsm) -> None:
+        """Store the due date of the fsm's current state timeout, or forget the holder when there is none."""
+        holder_id = fsm.holder_id
+        if holder_id is None:
+            return
+
+        fsm_class = fully_qualified_name(fsm.__class__)
+        timeout = fsm.current_state_instance.timeout if fsm.current_state in fsm._states else None
+        if timeout is None:
+            self.delete(fsm_class, holder_id)
+        else:
+            due_at = to_timestamp(fsm.current_state_date + timeout.timedelta)
+            self.upsert(fsm_class, holder_id, fsm.current_state, due_at)
+
+    def upsert(self, fsm_class: str, holder_id, state: str, due_at: float) -> None:
+        """Insert or replace the due date of a holder."""
+        raise NotImplementedError()
+
+    def delete(self, fsm_class: str, holder_id) -> None:
+        """Forget a holder."""
+        raise NotImplementedError()
+
+    def due(
+        self,
+        fsm_class,
+        now: Optional[datetime] = None,
+        chunk_size: int = 500,
+        partitions: Optional[Partitions] = None,
+    ) -> Iterator[List[DueTimeout]]:
+        """Yield chunks of ``(holder_id, state, due_date)`` due before now, ordered by due date.
+
+        Now defaults to the time of ``fsm_class.clock`` when it has one. With ``partitions``, stores able to filter
+        only yield holders whose `tuco.utils.holder_hash` modulo the number of partitions is one of the wanted ones.
+        """
+        raise NotImplementedError()
+
+    def process_due(
+        self,
+        fsm_class,
+        load_holders: Callable[[List[object]], Iterable[object]],
+        now: Optional[datetime] = None,
+        chunk_size: int = 500,
+        only: Optional[Callable[[object], bool]] = None,
+        partitions: Optional[Partitions] = None,
+    ) -> int:
+        """Lock every due holder and trigger its timeout.
+
+        :param load_holders: Receives a chunk of holder ids and returns the holders it could find.
+        :param only: Skip holder ids for which it returns False, such as `PartitionCoordinator.owns`.
+        :param partitions: Passed to `due` so stores can skip other partitions in their query.
+        :return: Number of timeouts triggered.
+        """
+        triggered = 0
+        for chunk in self.due(fsm_class, now, chunk_size, partitions):
+            holder_ids = [holder_id for holder_id, _, _ in chunk if only is None or only(holder_id)]
+            if not holder_ids:
+                continue
+            for holder in load_holders(holder_ids):
+                try:
+                    with fsm_class(holder) as fsm:
+                        triggered += fsm.trigger_timeout()
+                except TucoAlreadyLockedError:
+                    continue
+        return triggered
@@ -0,0 +1,92 @@
+"""SQLite timeout store module."""
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Tuple  # noqa
+
+from tuco.utils import fully_qualified_name, holder_hash, reopen_after_fork, to_timestamp
+
+from .base import BaseTimeoutStore
+
+
+class SQLiteTimeoutStore(BaseTimeoutStore):
+    """Timeout store kept in a SQLite table indexed by state machine and due date.
+
+    Due timeouts are read with index range scans, page by page, so only due rows are ever visited. The index also
+    carries the hash of holder ids, rows of partitions that are not wanted are skipped without reading them.
+    """
+
+    def __init__(self, path: str, table: str = "tuco_timeouts") -> None:
+        """Open the database and create the table if needed."""
+        self.path = path
+        self.table = table
+        self.reopen()
+        reopen_after_fork(self)
+        with self._lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} (fsm_class TEXT NOT NULL, holder_id NOT NULL, state TEXT NOT NULL, "
+                "due_at REAL NOT NULL, holder_hash INTEGER NOT NULL, PRIMARY KEY (fsm_class, holder_id))".format(table)
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS {0}_due ON {0} (fsm_class, due_at, holder_id, holder_hash)".format(table)
+            )
+
+    def reopen(self) -> None:
+        """Open a new connection, forked processes must not share the connection of their parent."""
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+
+    def upsert(self, fsm_class, holder_id, state, due_at) -> None:
+        """Insert or replace the due date of a holder."""
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO {} (fsm_class, holder_id, state, due_at, holder_hash) "
+                "VALUES (?, ?, ?, ?, ?)".format(self.table),
+                (fsm_class, holder_id, state, due_at, holder_hash(holder_id)),
+            )
+
+    def delete(self, fsm_class, holder_id) -> None:
+        """Forget a holder."""
+        with self._lock:
+            self.connection.execute(
+                "DELETE FROM {} WHERE fsm_class = ? AND holder_id = ?".format(self.table), (fsm_class, holder_id)
+            )
+
+    def due(self, fsm_class, now=None, chunk_size=500, partitions=None):
+        """Page through due rows using the (fsm_class, due_at, holder_id, holder_hash) index."""
+        name = fully_qualified_name(fsm_class)
+        if now is None and getattr(fsm_class, "clock", None) is not None:
+            now = fsm_class.clock.now()
+        until = time.time() if now is None else to_timestamp(now)
+        partition_filter, partition_parameters = "", ()  # type: Tuple[str, tuple]
+        if partitions is not None:
+            count, wanted = partitions
+            if not wanted:
+                return
+            partition_filter = "AND holder_hash % ? IN ({}) ".format(", ".join("?" * len(wanted)))
+            partition_parameters = (count,) + tuple(sorted(wanted))
+        query = (
+            "SELECT holder_id, state, due_at FROM {} WHERE fsm_class = ? AND due_at <= ? {}"
+            "AND (due_at > ? OR (due_at = ? AND holder_id > ?)) ORDER BY due_at, holder_id LIMIT ?".format(
+                self.table, partition_filter
+            )
+        )
+        first_query = (
+            "SELECT holder_id, state, due_at FROM {} WHERE fsm_class = ? AND due_at <= ? {}"
+            "ORDER BY due_at, holder_id LIMIT ?".format(self.table, partition_filter)
+        )
+
+        with self._lock:
+            rows = self.connection.execute(first_query, (name, until) + partition_parameters + (chunk_size,)).fetchall()
+        while rows:
+            yield [
+                (holder_id, state, datetime.fromtimestamp(due_at, timezone.utc)) for holder_id, state, due_at in rows
+            ]
+            if len(rows) < chunk_size:
+                return
+            last_id, _, last_due_at = rows[-1]
+            with self._lock:
+                rows = self.connection.execute(
+                    query, (name, until) + partition_parameters + (last_due_at, last_due_at, last_id, chunk_size)
+                ).fetchall()
@@ -0,0 +1,91 @@
+"""Helpers shared by state machine extensions."""
+import importlib
+import multiprocessing.util
+import os
+import weakref
+import zlib
+from datetime import datetime, timezone
+from typing import List  # noqa
+
+
+def fully_qualified_name(cls_or_instance) -> str:
+    """Return the dotted path of a class, or of the class of an instance."""
+    if not isinstance(cls_or_instance, type):
+        cls_or_instance = cls_or_instance.__class__
+    return "{}.{}".format(cls_or_instance.__module__, cls_or_instance.__qualname__)
+
+
+def holder_hash(holder_id) -> int:
+    """Hash a holder id the same way in every process, unlike the built-in hash of strings."""
+    return zlib.crc32(str(holder_id).encode())
+
+
+def reopen_after_fork(store) -> None:
+    """Hold the ``_lock`` of a store while the process forks and call its ``reopen`` in the child.
+
+    Parents never fork in the middle of a write and children never use the files or connections they inherited.
+    Stores with buffered files flush them in ``_before_fork``, called with the lock held, and stores with a ``close``
+    method are closed when processes started by `multiprocessing` exit, as those skip atexit handlers. Only a weak
+    reference to the store is kept.
+    """
+    if not hasattr(os, "register_at_fork"):  # Windows never forks.
+        return
+    reference = weakref.ref(store)
+
+    def before() -> None:
+        store = reference()
+        if store is not None:
+            store._lock.acquire()
+            before_fork = getattr(store, "_before_fork", None)
+            if before_fork is not None:
+                before_fork()
+
+    def after_in_parent() -> None:
+        store = reference()
+        if store is not None:
+            store._lock.release()
+
+    def after_in_child() -> None:
+        store = reference()
+        if store is not None:
+            store.reopen()
+
+    os.register_at_fork(before=before, after_in_parent=after_in_parent, after_in_child=after_in_child)
+    if hasattr(store, "close"):
+        multiprocessing.util.register_after_fork(store, _close_at_exit)
+
+
+def _close_at_exit(store) -> None:
+    """Close a store when the process started by `multiprocessing` exits."""
+    multiprocessing.util.Finalize(store, store.close, exitpriority=0)
+
+
+def to_timestamp(date: datetime) -> float:
+    """Convert a date to a UTC timestamp, naive dates are considered to be in UTC."""
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
+
+
+def to_naive_utc(date: datetime) -> datetime:
+    """Convert an aware date to a naive one in UTC, naive dates are considered to be in UTC already."""
+    if date.tzinfo is None:
+        return date
+    return date.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def import_by_name(name: str):
+    """Import an object from its fully qualified name."""
+    module_name, _, attribute = name.rpartition(".")
+    parts = []  # type: List[str]
+    while module_name:
+        try:
+            value = importlib.import_module(module_name)
+        except ImportError:
+            module_name, _, part = module_name.rpartition(".")
+            parts.insert(0, part)
+            continue
+        for part in parts + [attribute]:
+            value = getattr(value, part)
+        return value
+    raise ImportError("Could not import {!r}.".format(name))
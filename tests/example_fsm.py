@@ -1,5 +1,5 @@
 """Examples FSM for tests."""
-from datetime import timedelta
+from datetime import timedelta, timezone
 
 from tuco import FSM, properties
 
@@ -46,3 +46,34 @@ class ExampleCreditCardFSM(FSM):
 
     refunded = properties.FinalState()
     charged_back = properties.FinalState()
+
+
+def create_holder(holder_id):
+    """Create a holder with a specific id."""
+    holder = StateHolder()
+    holder.id = holder_id
+    return holder
+
+
+def create_fsm_class(store):
+    """Create a state machine tracking timeouts in the given store."""
+
+    class TimeoutFSM(FSM):
+        """Dumb class."""
+
+        timeout_store = store
+
+        new = properties.State(events=[properties.Event("Wait", "waiting")])
+        waiting = properties.State(
+            events=[properties.Event("Finish", "finished")],
+            timeout=properties.Timeout(timedelta(hours=1), "expired"),
+        )
+        finished = properties.FinalState()
+        expired = properties.FinalState()
+
+        @property
+        def current_state_date(self):
+            """Database always send time zone aware dates but not in tests."""
+            return getattr(self.container_object, self.date_attribute).replace(tzinfo=timezone.utc)
+
+    return TimeoutFSM
@@ -0,0 +1,162 @@
+"""Holder accessor tests."""
+from collections import namedtuple
+from types import MappingProxyType
+from unittest import mock
+
+import pytest
+
+from tests.example_fsm import ExampleCreditCardFSM
+from tuco import FSM, properties
+from tuco.accessors import DictAccessor, NamedTupleAccessor, SlotsAccessor, get_accessor
+from tuco.decorators import on_change
+from tuco.exceptions import TucoInvalidStateHolderError
+
+Row = namedtuple("Row", "id current_state current_state_date")
+
+
+class SlottedHolder:
+    """Holder without instance dict."""
+
+    __slots__ = ("id", "current_state", "current_state_date")
+
+    def __init__(self):
+        """Just initialize with None."""
+        self.id = 1
+        self.current_state = None
+        self.current_state_date = None
+
+
+class ChildSlottedHolder(SlottedHolder):
+    """Holder with inherited and private slots."""
+
+    __slots__ = ("__note",)
+
+
+class ChildHolder(SlottedHolder):
+    """Holder with inherited slots and an instance dict."""
+
+
+def test_accessor_resolution():
+    """Test that accessors are chosen from the holder type once."""
+    assert isinstance(get_accessor(dict), DictAccessor)
+    assert isinstance(get_accessor(Row), NamedTupleAccessor)
+    assert isinstance(get_accessor(SlottedHolder), SlotsAccessor)
+    assert get_accessor(Row) is get_accessor(Row)
+
+
+def test_accessor_resolved_once_per_class():
+    """Test that state machines resolve the accessor of their holder type once, read-only mappings are rejected."""
+
+    class TestFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+    with mock.patch("tuco.base.get_accessor", wraps=get_accessor) as resolve:
+        for _ in range(3):
+            TestFSM(SlottedHolder())
+        assert resolve.call_count == 1
+        TestFSM({"id": 1, "current_state": None, "current_state_date": None})
+        TestFSM(SlottedHolder())
+        assert resolve.call_count == 3
+    assert "_resolved_accessor" not in ExampleCreditCardFSM.__dict__
+
+    with pytest.raises(TucoInvalidStateHolderError):
+        TestFSM(MappingProxyType({"id": 1, "current_state": "new", "current_state_date": None}))
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_dict_holder(compiled):
+    """Test that dicts are driven without wrapping them."""
+
+    class DictFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        compile_fsm = compiled
+        holder_accessor = DictAccessor()
+
+    holder = {"id": 1, "current_state": None, "current_state_date": None}
+    fsm = DictFSM(holder)
+    assert fsm.trigger("Initialize")
+    assert holder["current_state"] == "authorisation_pending"
+    assert holder["current_state_date"] is not None
+    assert fsm.lock.hash_key == "fsm_DictFSM_pk_1"
+
+    with pytest.raises(TucoInvalidStateHolderError):
+        DictFSM({"id": 1})
+
+
+def test_namedtuple_holder():
+    """Test that immutable holders are replaced and on change receives both versions."""
+    changes = []
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        new = properties.State(events=[properties.Event("Start", "started")])
+        started = properties.FinalState()
+
+        @on_change
+        def remember(self, old_state, new_state):
+            """Store the states."""
+            changes.append((old_state.current_state, new_state.current_state))
+
+    original = Row(1, None, None)
+    fsm = TestFSM(original)
+    assert fsm.trigger("Start")
+    assert original.current_state is None
+    assert fsm.container_object.current_state == "started"
+    assert changes == [("new", "started")]
+
+
+def test_slotted_holder():
+    """Test that slotted holders work with generic and compiled state machines."""
+
+    class CompiledFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        compile_fsm = True
+
+    for fsm_class in (ExampleCreditCardFSM, CompiledFSM):
+        fsm = fsm_class(SlottedHolder())
+        assert fsm.trigger("Initialize")
+        assert fsm.container_object.current_state == "authorisation_pending"
+
+    with pytest.raises(TucoInvalidStateHolderError):
+        CompiledFSM({"id": 1, "current_state": None, "current_state_date": None})
+
+
+def test_apply_snapshot_changes():
+    """Test that changes made to a snapshot are copied back to mutable holders only."""
+    holder = SlottedHolder()
+    accessor = get_accessor(SlottedHolder)
+    snapshot = accessor.snapshot(holder)
+    snapshot.current_state = "paid"
+    assert holder.current_state is None
+    assert accessor.apply(holder, snapshot) is holder
+    assert holder.current_state == "paid"
+
+    holder = {"id": 1, "current_state": None}
+    accessor = get_accessor(dict)
+    snapshot = accessor.snapshot(holder)
+    snapshot["current_state"] = "paid"
+    assert accessor.apply(holder, snapshot) is holder
+    assert holder == {"id": 1, "current_state": "paid"}
+
+    row = Row(1, None, None)
+    assert get_accessor(Row).apply(row, get_accessor(Row).snapshot(row)) is row
+
+
+def test_apply_inherited_slots():
+    """Test that slots of base classes are applied, with or without an instance dict."""
+    for holder_class in (ChildSlottedHolder, ChildHolder):
+        holder = holder_class()
+        accessor = get_accessor(holder_class)
+        snapshot = accessor.command_snapshot(holder)
+        note = "_ChildSlottedHolder__note" if holder_class is ChildSlottedHolder else "note"
+        snapshot.current_state = "paid"
+        setattr(snapshot, note, "charged")
+        assert accessor.apply(holder, snapshot) is holder
+        assert holder.current_state == "paid"
+        assert getattr(holder, note) == "charged"
+
+    with pytest.raises(TypeError):
+        get_accessor(ChildHolder).apply(ChildHolder(), SlottedHolder())
@@ -0,0 +1,52 @@
+"""Actor dispatcher tests."""
+import threading
+
+import pytest
+
+from tests.example_fsm import ExampleCreditCardFSM, create_holder
+from tuco import FSM, properties
+from tuco.actors import ActorDispatcher
+from tuco.exceptions import TucoEventNotFoundError
+
+
+def test_events_run_in_order_per_holder():
+    """Test that events of a holder run in submission order and return trigger results."""
+    holders = {holder_id: create_holder(holder_id) for holder_id in range(20)}
+    for holder in holders.values():
+        ExampleCreditCardFSM(holder)
+
+    with ActorDispatcher(ExampleCreditCardFSM, workers=4, load_holder=holders.__getitem__) as dispatcher:
+        futures = [
+            dispatcher.submit(holder_id, event)
+            for holder_id in holders
+            for event in ("Initialize", "Authorize", "Capture")
+        ]
+        failed = dispatcher.submit(0, "Initialize")
+
+    assert all(future.result() is True for future in futures)
+    assert all(holder.current_state == "paid" for holder in holders.values())
+    with pytest.raises(TucoEventNotFoundError):
+        failed.result()
+
+
+def test_same_holder_same_worker():
+    """Test that a holder is always processed by the same worker thread."""
+    threads = {}
+
+    def remember_thread(holder):
+        """Store the worker running the command."""
+        threads.setdefault(holder.id, set()).add(threading.current_thread().name)
+        return True
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        new = properties.State(events=[properties.Event("Ping", "new", commands=[remember_thread])])
+
+    holders = [create_holder(holder_id) for holder_id in range(1, 9)]
+    with ActorDispatcher(TestFSM, workers=3) as dispatcher:
+        futures = [dispatcher.submit(holder, "Ping") for _ in range(5) for holder in holders]
+
+    assert all(future.result() for future in futures)
+    assert all(len(names) == 1 for names in threads.values())
+    assert len(set.union(*threads.values())) > 1
@@ -0,0 +1,73 @@
+"""Clock tests."""
+from datetime import datetime, timedelta, timezone
+
+from tests.example_fsm import StateHolder, create_holder
+from tuco import FSM, properties
+from tuco.clocks import SystemClock, VirtualClock
+from tuco.timeout_stores import SQLiteTimeoutStore
+
+
+def test_virtual_clock_fast_forwards_timeouts(tmpdir):
+    """Test that transitions are dated by the class clock and timeouts fire once it is advanced."""
+    clock = VirtualClock(datetime(2030, 1, 1))
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        timeout_store = SQLiteTimeoutStore(str(tmpdir.join("timeouts.db")))
+
+        new = properties.State(events=[properties.Event("Wait", "waiting")])
+        waiting = properties.State(timeout=properties.Timeout(timedelta(weeks=2), "expired"))
+        expired = properties.FinalState()
+
+    TestFSM.clock = clock
+    holders = {holder_id: create_holder(holder_id) for holder_id in range(1, 201)}
+    for holder in holders.values():
+        TestFSM(holder).trigger("Wait")
+    assert holders[1].current_state_date == datetime(2030, 1, 1)
+
+    def load_holders(holder_ids):
+        """Return holders from the in memory database."""
+        return [holders[holder_id] for holder_id in holder_ids]
+
+    clock.advance(timedelta(weeks=2) - timedelta(seconds=1))
+    assert TestFSM.timeout_store.process_due(TestFSM, load_holders) == 0
+    assert not TestFSM(holders[1]).trigger_timeout()
+
+    clock.advance(1)
+    assert TestFSM.timeout_store.process_due(TestFSM, load_holders, chunk_size=64) == 200
+    assert {holder.current_state for holder in holders.values()} == {"expired"}
+    assert holders[1].current_state_date == datetime(2030, 1, 15)
+
+
+def test_aware_dates_are_compared_in_utc():
+    """Test that aware holder dates are compared with the naive UTC time of the clock."""
+    clock = VirtualClock(datetime(2030, 1, 1, 12))
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        new = properties.State(events=[properties.Event("Wait", "waiting")])
+        waiting = properties.State(timeout=properties.Timeout(timedelta(hours=1), "expired"))
+        expired = properties.FinalState()
+
+    TestFSM.clock = clock
+    holder = StateHolder()
+    holder.current_state = "waiting"
+    holder.current_state_date = datetime(2030, 1, 1, 12, tzinfo=timezone(timedelta(hours=-3)))
+    assert not TestFSM(holder).trigger_timeout()
+    clock.advance(timedelta(hours=4))
+    assert TestFSM(holder).trigger_timeout()
+
+
+def test_clock_resolution_and_frozen_time():
+    """Test that coarse clocks reuse the time they read and that frozen clocks do not move."""
+    clock = SystemClock(resolution=60)
+    assert clock.now() is clock.now()
+    assert SystemClock().now() <= datetime.utcnow()
+
+    clock = VirtualClock()
+    with clock.frozen() as now:
+        clock.advance(10)
+        assert clock.now() == now
+    assert clock.now() == now + timedelta(seconds=10)
@@ -0,0 +1,144 @@
+"""Generated code tests."""
+from unittest import mock
+
+import pytest
+
+from tests.example_fsm import ExampleCreditCardFSM, StateHolder
+from tuco import FSM, properties
+from tuco.decorators import on_change
+from tuco.exceptions import TucoEventNotFoundError, TucoInvalidStateChangeError
+
+
+class CompiledCreditCardFSM(ExampleCreditCardFSM):
+    """Same machine with generated methods."""
+
+    compile_fsm = True
+
+
+def test_compiled_fsm_behaves_like_generic():
+    """Test that both versions take the same path and reject the same events."""
+    for fsm_class in (ExampleCreditCardFSM, CompiledCreditCardFSM):
+        fsm = fsm_class(StateHolder())
+        assert fsm.trigger("Initialize")
+        assert fsm.trigger("Authorize")
+        assert fsm.state_allowed("timeout_test")
+        assert not fsm.state_allowed("refunded")
+        assert fsm.trigger("Capture")
+        assert fsm.current_state == "paid"
+        assert fsm.container_object.current_state_date is not None
+
+        assert not fsm.event_allowed("Initialize")
+        with pytest.raises(TucoEventNotFoundError):
+            fsm.trigger("Initialize")
+        with pytest.raises(TucoInvalidStateChangeError):
+            fsm.current_state = "charged_back"
+
+
+def test_generated_source():
+    """Test that the source is exposed with attribute names baked in."""
+    assert ExampleCreditCardFSM.get_generated_source() is None
+
+    source = CompiledCreditCardFSM.get_generated_source()
+    assert "holder.current_state_date = self.current_time" in source
+    assert "_on_change_event" not in source
+
+
+def test_compiled_hooks_and_commands():
+    """Test that on change and commands still run through the generated code."""
+    changes = []
+    command = mock.Mock(return_value=False)
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        compile_fsm = True
+        state_attribute = "status"
+
+        new = properties.State(
+            events=[properties.Event("Start", "started"), properties.Event("Fail", "started", commands=[command])],
+            error=properties.Error("failed"),
+        )
+        started = properties.FinalState()
+        failed = properties.FinalState()
+
+        @on_change
+        def remember(self, old_state, new_state):
+            """Store the states."""
+            changes.append((old_state.status, new_state.status))
+
+    class Holder:
+        """Holder with a custom state attribute."""
+
+        id = 1
+        status = None
+        current_state_date = None
+
+    fsm = TestFSM(Holder())
+    assert "holder.status = new_state" in TestFSM.get_generated_source()
+    assert not fsm.trigger("Fail")
+    assert fsm.current_state == "failed"
+    assert changes == [("new", "failed")]
+
+    fsm = TestFSM(Holder())
+    assert fsm.trigger("Start")
+    assert changes[-1] == ("new", "started")
+
+
+def test_overridden_methods_are_kept():
+    """Test that methods defined by the class are not replaced, and that subclasses can opt out."""
+
+    class TestFSM(CompiledCreditCardFSM):
+        """Dumb class."""
+
+        def state_allowed(self, state_name):
+            """Allow everything."""
+            return True
+
+    class GenericFSM(CompiledCreditCardFSM):
+        """Dumb class."""
+
+        compile_fsm = False
+
+    fsm = TestFSM(StateHolder())
+    fsm.current_state = "refunded"
+    assert fsm.current_state == "refunded"
+    assert "def state_allowed" not in TestFSM.get_generated_source()
+
+    assert GenericFSM.trigger is FSM.trigger
+    assert GenericFSM.get_generated_source() is None
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_overridden_call_on_change_is_honored(compiled):
+    """Test that an overridden _call_on_change runs without an on change hook, compiled or not."""
+    changes = []
+
+    class TestFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        compile_fsm = compiled
+
+        def _call_on_change(self, old_state, new_state):
+            """Store the states."""
+            changes.append((old_state.current_state, new_state.current_state))
+
+    fsm = TestFSM(StateHolder())
+    assert fsm.trigger("Initialize")
+    assert fsm.trigger("Authorize")
+    assert changes == [("new", "authorisation_pending"), ("authorisation_pending", "capture_pending")]
+    assert ("_call_on_change(old_state, holder)" in (TestFSM.get_generated_source() or "")) is compiled
+
+
+def test_subclass_states_are_compiled():
+    """Test that states added by a subclass of a compiled machine are part of its generated tables."""
+
+    class DisputeFSM(CompiledCreditCardFSM):
+        """Dumb class."""
+
+        paid = properties.State(events=[properties.Event("Dispute", "disputed")])
+        disputed = properties.FinalState()
+
+    fsm = DisputeFSM(StateHolder())
+    for event_name in ("Initialize", "Authorize", "Capture", "Dispute"):
+        assert fsm.trigger(event_name)
+    assert not CompiledCreditCardFSM(StateHolder()).state_allowed("disputed")
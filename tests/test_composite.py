@@ -0,0 +1,197 @@
+"""Composite state machine tests."""
+import threading
+from collections import namedtuple
+from unittest import mock
+
+import pytest
+
+from tuco import FSM, properties
+from tuco.composite import CompositeFSM
+from tuco.decorators import on_change
+from tuco.exceptions import TucoAlreadyLockedError, TucoEventNotFoundError
+from tuco.locks import MemoryLock
+
+region_changes = []  # type: list
+
+
+class PaymentFSM(FSM):
+    """Payment region."""
+
+    state_attribute = "payment_state"
+    date_attribute = "payment_date"
+
+    new = properties.State(events=[properties.Event("Pay", "paid"), properties.Event("Cancel", "cancelled")])
+    paid = properties.FinalState()
+    cancelled = properties.FinalState()
+
+    @on_change
+    def remember(self, old_state, new_state):
+        """Store payment changes."""
+        region_changes.append((old_state.payment_state, new_state.payment_state))
+
+
+class FulfilmentFSM(FSM):
+    """Fulfilment region."""
+
+    state_attribute = "fulfilment_state"
+    date_attribute = "fulfilment_date"
+
+    new = properties.State(events=[properties.Event("Ship", "shipped"), properties.Event("Cancel", "cancelled")])
+    shipped = properties.FinalState()
+    cancelled = properties.FinalState()
+
+
+class Order:
+    """Holder of both regions."""
+
+    def __init__(self):
+        """Just initialize with None."""
+        self.id = 1
+        self.payment_state = self.payment_date = None
+        self.fulfilment_state = self.fulfilment_date = None
+
+
+def test_events_are_routed_to_regions():
+    """Test that events reach every region defining them with a single snapshot and on change."""
+    changes = []
+
+    class OrderFSM(CompositeFSM):
+        """Dumb class."""
+
+        regions = (PaymentFSM, FulfilmentFSM)
+
+        @on_change
+        def remember(self, old_state, new_state):
+            """Store combined changes."""
+            changes.append((old_state.payment_state, old_state.fulfilment_state, new_state.fulfilment_state))
+
+    del region_changes[:]
+    fsm = OrderFSM(Order())
+    assert fsm.current_states == {"PaymentFSM": "new", "FulfilmentFSM": "new"}
+
+    with mock.patch("copy.copy", wraps=__import__("copy").copy) as copy:
+        assert fsm.trigger("Cancel")
+    assert copy.call_count == 1
+    assert fsm.current_states == {"PaymentFSM": "cancelled", "FulfilmentFSM": "cancelled"}
+    assert changes == [("new", "new", "cancelled")]
+    assert region_changes == [("new", "cancelled")]
+
+    with pytest.raises(TucoEventNotFoundError):
+        fsm.trigger("Ship")
+
+
+def test_single_lock_and_immutable_holders():
+    """Test that the holder is locked once and that namedtuple holders are shared between regions."""
+
+    class OrderFSM(CompositeFSM):
+        """Dumb class."""
+
+        regions = (PaymentFSM, FulfilmentFSM)
+
+    Row = namedtuple("Row", "id payment_state payment_date fulfilment_state fulfilment_date")
+    fsm = OrderFSM(Row(2, None, None, None, None))
+    errors = []
+
+    def lock_again():
+        """Lock from another thread, the lock is reentrant for its owner."""
+        try:
+            with OrderFSM(fsm.container_object):
+                pass
+        except TucoAlreadyLockedError as e:
+            errors.append(e)
+
+    with fsm:
+        worker = threading.Thread(target=lock_again)
+        worker.start()
+        worker.join()
+        assert errors
+        assert fsm.trigger("Pay")
+        assert fsm.trigger("Ship")
+
+    assert fsm.container_object.payment_state == "paid"
+    assert fsm.container_object.fulfilment_state == "shipped"
+    assert fsm[PaymentFSM].container_object is fsm.container_object
+
+
+def test_composite_and_standalone_regions_exclude_each_other():
+    """Test that the composite takes one lock, shared with its regions used on their own through their lock name."""
+
+    class SharedPaymentFSM(PaymentFSM):
+        """Dumb class."""
+
+        lock_name = "Order"
+
+    class SharedFulfilmentFSM(FulfilmentFSM):
+        """Dumb class."""
+
+        lock_name = "Order"
+
+    class OrderFSM(CompositeFSM):
+        """Dumb class."""
+
+        regions = (SharedPaymentFSM, SharedFulfilmentFSM)
+
+    Row = namedtuple("Row", "id payment_state payment_date fulfilment_state fulfilment_date")
+    holder = Row(3, None, None, None, None)
+    errors = []
+
+    def lock_elsewhere(fsm_class):
+        """Lock from another thread."""
+        try:
+            with fsm_class(holder):
+                pass
+        except TucoAlreadyLockedError as e:
+            errors.append(e)
+
+    def run_elsewhere(fsm_class):
+        """Wait for a lock attempt from another thread."""
+        worker = threading.Thread(target=lock_elsewhere, args=(fsm_class,))
+        worker.start()
+        worker.join()
+
+    fsm = OrderFSM(holder)
+    with mock.patch.object(MemoryLock, "_acquire", autospec=True, side_effect=MemoryLock._acquire) as acquire:
+        with fsm:
+            with fsm[SharedPaymentFSM]:
+                assert fsm.trigger("Pay")
+            run_elsewhere(SharedFulfilmentFSM)
+    assert acquire.call_count == 1
+    assert fsm.lock.hash_key == "fsm_Order_pk_3"
+    assert len(errors) == 1
+
+    with SharedPaymentFSM(holder):
+        run_elsewhere(OrderFSM)
+    assert len(errors) == 2
+
+
+def test_regions_must_share_lock_names():
+    """Test that regions locked under different names are rejected, composites without one use their own name."""
+
+    class SharedPaymentFSM(PaymentFSM):
+        """Dumb class."""
+
+        lock_name = "Order"
+
+    with pytest.raises(RuntimeError):
+
+        class InvalidFSM(CompositeFSM):
+            """Dumb class."""
+
+            regions = (SharedPaymentFSM, FulfilmentFSM)
+
+    class OrderFSM(CompositeFSM):
+        """Dumb class."""
+
+        regions = (PaymentFSM, FulfilmentFSM)
+
+    assert OrderFSM(Order()).lock.hash_key == "fsm_OrderFSM_pk_1"
+
+
+def test_regions_need_their_own_state_attribute():
+    """Test that regions writing the same attribute are rejected."""
+    with pytest.raises(RuntimeError):
+
+        class BrokenFSM(CompositeFSM):
+            """Dumb class."""
+
+            regions = (PaymentFSM, PaymentFSM)
@@ -0,0 +1,120 @@
+"""Buffered dispatch tests."""
+import threading
+
+import pytest
+
+from tests.example_fsm import ExampleCreditCardFSM, StateHolder
+from tuco.decorators import on_change
+from tuco.dispatch import BatchDispatcher
+from tuco.exceptions import TucoBufferFullError, TucoDispatcherClosedError
+
+
+def test_on_change_dispatcher():
+    """Test that on change records are buffered and handed over in batches."""
+    batches = []
+    dispatcher = BatchDispatcher(batches.append, batch_size=2, flush_interval=60)
+
+    class TestFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        @on_change(dispatcher=dispatcher)
+        def log_changes(self, old_state, new_state):
+            """Return a record instead of saving it."""
+            return (old_state.current_state, new_state.current_state)
+
+    fsm = TestFSM(StateHolder())
+    fsm.trigger("Initialize")
+    fsm.trigger("Authorize")
+    fsm.trigger("Capture")
+    dispatcher.flush()
+
+    records = [record for batch in batches for record in batch]
+    assert records == [
+        ("new", "authorisation_pending"),
+        ("authorisation_pending", "capture_pending"),
+        ("capture_pending", "paid"),
+    ]
+    assert all(len(batch) <= 2 for batch in batches)
+    dispatcher.close()
+
+
+def test_flush_by_size():
+    """Test that the worker hands a full batch over without an explicit flush."""
+    handled = threading.Event()
+    batches = []
+
+    def handle_batch(batch):
+        """Store the batch and notify."""
+        batches.append(batch)
+        handled.set()
+
+    dispatcher = BatchDispatcher(handle_batch, batch_size=3, flush_interval=60)
+    for record in range(3):
+        dispatcher.put(record)
+
+    assert handled.wait(timeout=5)
+    assert batches == [[0, 1, 2]]
+    dispatcher.close()
+
+
+def test_backpressure():
+    """Test that a full buffer raises after waiting."""
+    release = threading.Event()
+    dispatcher = BatchDispatcher(lambda batch: release.wait(), batch_size=1, max_buffer=1, put_timeout=0.01)
+    dispatcher.put(1)  # Taken by the worker, which now blocks in the handler.
+    with pytest.raises(TucoBufferFullError):
+        for record in range(10):
+            dispatcher.put(record)
+
+    release.set()
+    dispatcher.close()
+
+
+def test_flush_keeps_order():
+    """Test that flushes racing the worker hand batches over in the order records were put."""
+    handled = []
+    dispatcher = BatchDispatcher(handled.extend, batch_size=7, flush_interval=0.0001)
+    for record in range(2000):
+        dispatcher.put(record)
+        if record % 50 == 0:
+            dispatcher.flush()
+    dispatcher.close()
+    assert handled == list(range(2000))
+
+
+def test_put_after_close():
+    """Test that records given to a closed dispatcher are refused instead of lost."""
+    dispatcher = BatchDispatcher(lambda batch: None)
+    dispatcher.put(1)
+    dispatcher.close()
+    with pytest.raises(TucoDispatcherClosedError):
+        dispatcher.put(2)
+
+
+def test_concurrent_put_and_close():
+    """Test that a record put while the dispatcher closes is handled, not left in the buffer."""
+    handled = []
+    dispatcher = BatchDispatcher(handled.extend, flush_interval=60)
+    entered, proceed = threading.Event(), threading.Event()
+    buffer_put = dispatcher._buffer.put
+
+    def slow_put(record, timeout=None):
+        """Let close run between the shutdown check and the enqueue."""
+        entered.set()
+        proceed.wait(5)
+        buffer_put(record, timeout=timeout)
+
+    dispatcher._buffer.put = slow_put
+    producer = threading.Thread(target=dispatcher.put, args=("late",))
+    producer.start()
+    assert entered.wait(5)
+    closer = threading.Thread(target=dispatcher.close)
+    closer.start()
+    closer.join(0.1)
+    proceed.set()
+    closer.join(5)
+    producer.join(5)
+
+    assert handled == ["late"]
+    with pytest.raises(TucoDispatcherClosedError):
+        dispatcher.put("refused")
@@ -0,0 +1,100 @@
+"""Guard tests."""
+from unittest import mock
+
+import pytest
+
+from tests.example_fsm import StateHolder
+from tuco import FSM, properties
+from tuco.exceptions import TucoEventNotAllowedError
+
+
+def create_fsm_class(guard, compiled=False):
+    """Create a state machine whose events share a guard."""
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        compile_fsm = compiled
+
+        new = properties.State(
+            events=[
+                properties.Event("Pay", "paid", commands=[mock.Mock(return_value=True)], guards=[guard]),
+                properties.Event("Refund", "refunded", guards=[guard]),
+                properties.Event("Cancel", "cancelled"),
+            ]
+        )
+        paid = properties.FinalState()
+        refunded = properties.FinalState()
+        cancelled = properties.FinalState()
+
+    return TestFSM
+
+
+def test_guards_filter_possible_events_once():
+    """Test that a guard shared by several events is evaluated once when listing events."""
+    guard = mock.Mock(return_value=False)
+    fsm = create_fsm_class(guard)(StateHolder())
+
+    assert [event.event_name for event in fsm.possible_events] == ["Cancel"]
+    assert guard.call_count == 1
+    assert not fsm.event_allowed("Pay")
+    assert fsm.event_allowed("Cancel")
+
+    guard.return_value = True
+    assert [event.event_name for event in fsm.possible_events] == ["Pay", "Refund", "Cancel"]
+
+
+@pytest.mark.parametrize("compile_fsm", [False, True])
+def test_guards_run_before_commands(compile_fsm):
+    """Test that a refusing guard stops the transition before any command runs."""
+    guard = mock.Mock(return_value=False)
+    fsm_class = create_fsm_class(guard, compile_fsm)
+    assert (fsm_class.get_generated_source() is not None) == compile_fsm
+    command = fsm_class.get_all_states()["new"].events[0].commands[0]
+    fsm = fsm_class(StateHolder())
+
+    for event_name in ("Pay", "Refund"):
+        with pytest.raises(TucoEventNotAllowedError):
+            fsm.trigger(event_name)
+    assert fsm.current_state == "new"
+    command.assert_not_called()
+
+    guard.return_value = True
+    assert fsm.trigger("Refund")
+    assert fsm.current_state == "refunded"
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_guards_are_evaluated_once_before_commands(compiled):
+    """Test that a command invalidating its own guard still commits and that other events' guards do not run."""
+    stock = {"units": 1}
+    expensive = mock.Mock(return_value=True)
+
+    def in_stock(holder):
+        """Check there is a unit left."""
+        return stock["units"] > 0
+
+    def reserve(holder):
+        """Reserve the last unit."""
+        stock["units"] -= 1
+        return True
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        compile_fsm = compiled
+
+        new = properties.State(
+            events=[
+                properties.Event("Reserve", "reserved", commands=[reserve], guards=[in_stock]),
+                properties.Event("Audit", "audited", guards=[expensive]),
+            ]
+        )
+        reserved = properties.FinalState()
+        audited = properties.FinalState()
+
+    fsm = TestFSM(StateHolder())
+    assert fsm.trigger("Reserve")
+    assert fsm.current_state == "reserved"
+    assert stock["units"] == 0
+    expensive.assert_not_called()
@@ -0,0 +1,73 @@
+"""Hierarchical state tests."""
+from unittest import mock
+
+import pytest
+
+from tests.example_fsm import StateHolder
+from tuco import FSM, properties
+
+
+def test_children_inherit_from_composite_states():
+    """Test that children get the events, error and on enter of their parents and can override them."""
+    enter_active = mock.Mock()
+    enter_paying = mock.Mock()
+
+    def fail(holder):
+        """Fail the command."""
+        return False
+
+    class OrderFSM(FSM):
+        """Dumb class."""
+
+        active = properties.CompositeState(
+            events=[properties.Event("Cancel", "cancelled")], error=properties.Error("failed"), on_enter=[enter_active]
+        )
+        paying = properties.CompositeState(
+            parent=active, events=[properties.Event("Refuse", "refused")], on_enter=[enter_paying]
+        )
+
+        new = properties.State(parent=active, events=[properties.Event("Pay", "capturing")])
+        capturing = properties.State(
+            parent=paying,
+            events=[properties.Event("Capture", "paid", commands=[fail]), properties.Event("Cancel", "refused")],
+        )
+        paid = properties.FinalState()
+        refused = properties.FinalState()
+        cancelled = properties.FinalState()
+        failed = properties.FinalState()
+
+    assert sorted(OrderFSM.get_all_states()) == ["cancelled", "capturing", "failed", "new", "paid", "refused"]
+    assert sorted(OrderFSM._transitions["capturing"]) == ["Cancel", "Capture", "Refuse"]
+    assert OrderFSM._transitions["capturing"]["Cancel"].target_state == "refused"
+
+    fsm = OrderFSM(StateHolder())
+    assert [event.event_name for event in fsm.possible_events] == ["Pay", "Cancel"]
+    assert enter_active.call_count == 1
+    assert fsm.trigger("Pay")
+    assert enter_active.call_count == 2
+    enter_paying.assert_called_once()
+
+    assert not fsm.trigger("Capture")
+    assert fsm.current_state == "failed"
+
+
+def test_composite_states_are_validated():
+    """Test that inherited events and timeouts are validated like the state's own ones."""
+    with pytest.raises(RuntimeError):
+
+        class BrokenFSM(FSM):
+            """Dumb class."""
+
+            active = properties.CompositeState(events=[properties.Event("Cancel", "missing")])
+            new = properties.State(parent=active)
+
+    with pytest.raises(RuntimeError):
+
+        class DuplicatedFSM(FSM):
+            """Dumb class."""
+
+            active = properties.CompositeState(
+                events=[properties.Event("Cancel", "cancelled"), properties.Event("Cancel", "cancelled")]
+            )
+            new = properties.State(parent=active)
+            cancelled = properties.FinalState()
@@ -0,0 +1,60 @@
+"""State machine inheritance tests."""
+import pytest
+
+from tests.example_fsm import ExampleCreditCardFSM, StateHolder
+from tuco import properties
+
+
+def test_subclass_states_do_not_leak():
+    """Test that added and overridden states only change the subclass."""
+    parent_states = dict(ExampleCreditCardFSM.get_all_states())
+
+    class DisputeFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        paid = properties.State(
+            events=[properties.Event("Refund", "refund_pending"), properties.Event("Dispute", "disputed")]
+        )
+        disputed = properties.FinalState()
+
+    assert ExampleCreditCardFSM.get_all_states() == parent_states
+    assert "disputed" not in ExampleCreditCardFSM._transitions
+    assert DisputeFSM.get_all_states()["paid"] is not parent_states["paid"]
+
+    fsm = DisputeFSM(StateHolder())
+    for event_name in ("Initialize", "Authorize", "Capture", "Dispute"):
+        assert fsm.trigger(event_name)
+    assert fsm.current_state == "disputed"
+
+
+def test_unchanged_tables_are_shared():
+    """Test that subclasses without states reuse the parent tables, and extensions reuse unchanged indexes."""
+
+    class SameFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+    class ExtendedFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        extra = properties.FinalState()
+
+    assert SameFSM._states is ExampleCreditCardFSM._states
+    assert SameFSM._transitions is ExampleCreditCardFSM._transitions
+    assert ExtendedFSM._transitions["paid"] is ExampleCreditCardFSM._transitions["paid"]
+
+
+def test_overrides_are_validated():
+    """Test that invalid overrides and initial state changes are rejected."""
+    with pytest.raises(RuntimeError):
+
+        class BrokenFSM(ExampleCreditCardFSM):
+            """Dumb class."""
+
+            paid = properties.State(events=[properties.Event("Refund", "unknown")])
+
+    with pytest.raises(RuntimeError):
+
+        class TimeoutFSM(ExampleCreditCardFSM):
+            """Dumb class."""
+
+            initial_state = "capture_pending"
@@ -0,0 +1,118 @@
+"""Transition journal tests."""
+import os
+from datetime import timedelta
+
+import pytest
+import pytz
+
+from tests.example_fsm import ExampleCreditCardFSM, create_holder
+from tuco.exceptions import TucoJournalError
+from tuco.journal import TIMEOUT_EVENT, JournalReader, TransitionJournal
+
+
+def test_journal_replay(tmpdir):
+    """Test writing transitions and rebuilding states and histories from them."""
+    directory = str(tmpdir.join("journal"))
+
+    class JournaledFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        journal = TransitionJournal(directory, segment_records=3)
+
+        @property
+        def current_state_date(self):
+            """Database always send time zone aware dates but not in tests."""
+            return getattr(self.container_object, self.date_attribute).replace(tzinfo=pytz.UTC)
+
+    first, second = JournaledFSM(create_holder(1)), JournaledFSM(create_holder(2))
+    first.run_events(["Initialize", "Authorize"])
+    second.trigger("Initialize")
+    second.trigger("Authorize")
+    first.container_object.current_state_date -= timedelta(days=8)
+    assert first.trigger_timeout()
+    JournaledFSM.journal.close()
+
+    assert len([name for name in os.listdir(directory) if name.endswith(".seg")]) == 3
+
+    reader = JournalReader(directory)
+    assert reader.replay(JournaledFSM) == {
+        ("tests.test_journal.test_journal_replay.<locals>.JournaledFSM", 1): "timeout_test",
+        ("tests.test_journal.test_journal_replay.<locals>.JournaledFSM", 2): "capture_pending",
+    }
+    assert reader.replay(ExampleCreditCardFSM) == {}
+
+    history = reader.history(JournaledFSM, 1)
+    assert [(record.from_state, record.to_state, record.event) for record in history] == [
+        (None, "new", None),
+        ("new", "authorisation_pending", "Initialize"),
+        ("authorisation_pending", "capture_pending", "Authorize"),
+        ("capture_pending", "timeout_test", TIMEOUT_EVENT),
+    ]
+    assert history[-1].timestamp == first.current_state_date
+    assert len(list(reader.records())) == 7
+
+
+def test_journal_reopen(tmpdir):
+    """Test appending to an existing journal and ignoring partially written records."""
+    directory = str(tmpdir.join("journal"))
+
+    class JournaledFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        journal = TransitionJournal(directory)
+
+    JournaledFSM(create_holder(1)).trigger("Initialize")
+    JournaledFSM.journal.close()
+
+    JournaledFSM.journal = TransitionJournal(directory)
+    JournaledFSM(create_holder(2))
+    JournaledFSM.journal.close()
+    with open(os.path.join(directory, "00000000.seg"), "ab") as f:
+        f.write(b"partial")
+
+    reader = JournalReader(directory)
+    assert sorted(reader.replay().values()) == ["authorisation_pending", "new"]
+
+    JournaledFSM.journal = TransitionJournal(directory)
+    holder = create_holder("not an integer")
+    with pytest.raises(TucoJournalError):
+        JournaledFSM(holder)
+    assert holder.current_state is None
+
+    holder = create_holder(3)
+    fsm = JournaledFSM(holder)
+    holder.id = "changed later"
+    assert fsm.trigger("Initialize")
+    assert holder.current_state == "authorisation_pending"
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_full_catalog_fails_before_the_holder_changes(tmpdir, monkeypatch, compiled):
+    """Test that codes are allocated before a transition so a full catalog leaves the holder untouched."""
+    directory = str(tmpdir.join("journal"))
+
+    class JournaledFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        compile_fsm = compiled
+        journal = TransitionJournal(directory)
+
+    holder = create_holder(2**40)
+    fsm = JournaledFSM(holder)
+    monkeypatch.setattr("tuco.journal.MAX_CODE", 1)
+    with pytest.raises(TucoJournalError):
+        fsm.trigger("Initialize")
+    assert holder.current_state == "new"
+
+    monkeypatch.undo()
+    assert fsm.trigger("Initialize")
+    JournaledFSM.journal.close()
+    assert [record.to_state for record in JournalReader(directory).history(JournaledFSM, 2**40)] == [
+        "new",
+        "authorisation_pending",
+    ]
+
+    holder = create_holder(2**63)
+    with pytest.raises(TucoJournalError):
+        JournaledFSM(holder)
+    assert holder.current_state is None
@@ -0,0 +1,233 @@
+"""Lock tests."""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from tests.example_fsm import ExampleCreditCardFSM, StateHolder
+from tuco import FSM, properties
+from tuco.exceptions import TucoAlreadyLockedError, TucoLockLostError
+from tuco.locks import MemoryLock, RedisLock
+from tuco.locks.watchdog import LeaseWatchdog
+
+
+def test_nested_locks_are_reentrant():
+    """Test that the owner can lock again and only the outermost unlock reaches the backend."""
+    holder = StateHolder()
+    hash_key = ExampleCreditCardFSM(holder).lock.hash_key
+    errors = []
+
+    def lock_elsewhere():
+        """Try to lock from another thread."""
+        try:
+            with ExampleCreditCardFSM(holder):
+                pass
+        except TucoAlreadyLockedError as e:
+            errors.append(e)
+
+    with ExampleCreditCardFSM(holder) as outer:
+        with ExampleCreditCardFSM(holder) as inner:
+            assert inner.lock.owned
+            inner.trigger("Initialize")
+        assert hash_key in MemoryLock.locks
+
+        worker = threading.Thread(target=lock_elsewhere)
+        worker.start()
+        worker.join()
+        assert len(errors) == 1
+        assert outer.lock.owned
+
+    assert hash_key not in MemoryLock.locks
+    assert not outer.lock.owned
+
+
+def test_asyncio_tasks_own_locks():
+    """Test that two tasks of the same thread do not share lock ownership."""
+    holder = StateHolder()
+    holder.id = 4321
+
+    async def hold(entered, release):
+        """Keep the holder locked until released."""
+        with ExampleCreditCardFSM(holder):
+            entered.set()
+            await release.wait()
+
+    async def main():
+        """Lock from a second task while the first one holds the lock."""
+        entered, release = asyncio.Event(), asyncio.Event()
+        task = asyncio.ensure_future(hold(entered, release))
+        await entered.wait()
+        try:
+            with pytest.raises(TucoAlreadyLockedError):
+                with ExampleCreditCardFSM(holder):
+                    pass
+        finally:
+            release.set()
+            await task
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_lost_lease_fails_transitions(compiled):
+    """Test that events with and without commands fail once the lease is lost, compiled or not."""
+    errors = []
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        compile_fsm = compiled
+
+        new = properties.State(
+            events=[
+                properties.Event("Start", "started"),
+                properties.Event("Check", "started", commands=[lambda holder: True]),
+            ]
+        )
+        started = properties.FinalState()
+
+        def _on_error_event(self, current_state, new_state, exception):
+            errors.append((current_state, new_state, exception))
+
+    holder = StateHolder()
+    with TestFSM(holder) as fsm:
+        fsm.lock.lease_lost = TucoLockLostError()
+        for event_name in ("Start", "Check"):
+            with pytest.raises(TucoLockLostError):
+                fsm.trigger(event_name)
+        assert holder.current_state == "new"
+    assert [error[:2] for error in errors] == [("new", "started"), ("new", "started")]
+
+
+def test_nested_locks_see_lost_lease():
+    """Test that nested acquisitions fail their transitions when the outermost lock lost its lease."""
+    holder = StateHolder()
+    with ExampleCreditCardFSM(holder) as outer:
+        with ExampleCreditCardFSM(holder) as inner:
+            outer.lock.lease_lost = TucoLockLostError()
+            with pytest.raises(TucoLockLostError):
+                inner.trigger("Initialize")
+        assert inner.lock.lease_lost is None
+    assert holder.current_state == "new"
+
+
+def test_redis_locking_auto_renew(dont_run_in_appveyor):
+    """Test that the watchdog keeps short leases alive and fails transitions whose lease was lost."""
+    assert dont_run_in_appveyor
+    import redis
+
+    os.environ.setdefault("REDIS_SERVER", "127.0.0.1")
+    connection = redis.StrictRedis(os.environ["REDIS_SERVER"])
+    watchdog = LeaseWatchdog()
+    lost = []
+
+    class ConfiguredRedisLock(RedisLock):
+        auto_renew = True
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(0.3, connection, *args, **kwargs)
+            self.watchdog = watchdog
+
+        def on_lease_lost(self, error):
+            lost.append(error)
+
+    def slow_command(holder):
+        """Outlive the lease a few times."""
+        time.sleep(1)
+        return True
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        lock_class = ConfiguredRedisLock
+
+        new = properties.State(events=[properties.Event("Start", "started", commands=[slow_command])])
+        started = properties.FinalState()
+
+    holder = StateHolder()
+    holder.id = 8765
+    try:
+        with TestFSM(holder) as fsm:
+            assert fsm.trigger("Start")
+            assert connection.pttl(fsm.lock.hash_key) > 0
+        assert not connection.exists(fsm.lock.hash_key)
+
+        holder.current_state = "new"
+        with TestFSM(holder) as fsm:
+            connection.delete(fsm.lock.hash_key)
+            with pytest.raises(TucoLockLostError):
+                fsm.trigger("Start")
+        assert holder.current_state == "new"
+        assert len(lost) == 1
+    finally:
+        watchdog.stop()
+
+
+def test_redis_locking_waits_for_release(dont_run_in_appveyor):
+    """Test that contended locks are handed over to waiters in arrival order, or fail after the wait timeout."""
+    assert dont_run_in_appveyor
+    import redis
+
+    os.environ.setdefault("REDIS_SERVER", "127.0.0.1")
+    connection = redis.StrictRedis(os.environ["REDIS_SERVER"])
+    order = []
+
+    class ConfiguredRedisLock(RedisLock):
+        wait_timeout = 2
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(5, connection, *args, **kwargs)
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        lock_class = ConfiguredRedisLock
+
+        new = properties.FinalState()
+
+    holder = StateHolder()
+    holder.id = 9876
+    entered = threading.Event()
+    release = threading.Event()
+
+    def hold_lock():
+        """Keep the holder locked until released."""
+        with TestFSM(holder):
+            entered.set()
+            release.wait(5)
+
+    def wait_for_lock(position):
+        """Queue up for the lock."""
+        with TestFSM(holder):
+            order.append(position)
+
+    holder_thread = threading.Thread(target=hold_lock)
+    holder_thread.start()
+    waiters = []
+    try:
+        assert entered.wait(5), "The lock was not taken, is Redis running?"
+        for position in range(3):
+            waiters.append(threading.Thread(target=wait_for_lock, args=(position,)))
+            waiters[-1].start()
+            time.sleep(0.05)  # Let it queue up
+    finally:
+        release.set()
+        for thread in [holder_thread] + waiters:
+            thread.join(5)
+    assert order == [0, 1, 2]
+    assert not connection.exists(TestFSM(holder).lock.hash_key)
+
+    def give_up():
+        """Wait less than the lock is held."""
+        with pytest.raises(TucoAlreadyLockedError):
+            wait_for_lock(3)
+        order.append("gave up")
+
+    ConfiguredRedisLock.wait_timeout = 0.1
+    with TestFSM(holder):
+        worker = threading.Thread(target=give_up)
+        worker.start()
+        worker.join(5)
+    assert order == [0, 1, 2, "gave up"]
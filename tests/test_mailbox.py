@@ -0,0 +1,170 @@
+"""Mailbox tests."""
+import threading
+
+from tests.example_fsm import StateHolder
+from tuco import FSM, properties
+from tuco.exceptions import TucoAlreadyLockedError
+from tuco.locks import MemoryLock
+from tuco.mailbox import Mailbox
+
+
+def test_contended_events_are_queued():
+    """Test that events for a locked holder run in the lock holder's thread before it unlocks."""
+    entered = threading.Event()
+    release = threading.Event()
+    threads = []
+
+    def remember_thread(holder):
+        """Store the thread running the command."""
+        threads.append(threading.current_thread().name)
+        return True
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        mailbox = Mailbox()
+
+        new = properties.State(events=[properties.Event("Start", "started", commands=[remember_thread])])
+        started = properties.State(events=[properties.Event("Finish", "finished", commands=[remember_thread])])
+        finished = properties.FinalState()
+
+    holder = StateHolder()
+
+    def hold_lock():
+        """Keep the holder locked until released."""
+        with TestFSM(holder) as fsm:
+            fsm.trigger("Start")
+            entered.set()
+            release.wait()
+
+    worker = threading.Thread(target=hold_lock, name="lock-holder")
+    worker.start()
+    entered.wait()
+
+    future = TestFSM(holder).submit("Finish")
+    assert not future.done()
+    release.set()
+    worker.join()
+
+    assert future.result(timeout=1) is True
+    assert holder.current_state == "finished"
+    assert threads == ["lock-holder", "lock-holder"]
+
+    future = TestFSM(StateHolder()).submit("Start")
+    assert future.result() is True
+    assert TestFSM(holder).lock.lock()
+    TestFSM(holder).lock.unlock()
+
+
+def test_lock_held_outside_mailbox():
+    """Test that a lock taken by another thread without the mailbox still fails fast."""
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        mailbox = Mailbox()
+
+        new = properties.State(events=[properties.Event("Start", "started")])
+        started = properties.FinalState()
+
+    holder = StateHolder()
+    fsm = TestFSM(holder)
+    errors = []
+
+    def submit():
+        """Submit from another thread, the lock is reentrant for its owner."""
+        try:
+            TestFSM(holder).submit("Start")
+        except TucoAlreadyLockedError as e:
+            errors.append(e)
+
+    fsm.lock.lock()
+    try:
+        worker = threading.Thread(target=submit)
+        worker.start()
+        worker.join()
+    finally:
+        fsm.lock.unlock()
+    assert len(errors) == 1
+
+
+def test_nested_acquisitions_keep_the_queue():
+    """Test that nested locks by the owner do not drop events queued by other threads."""
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        mailbox = Mailbox()
+
+        new = properties.State(events=[properties.Event("Start", "started")])
+        started = properties.State(events=[properties.Event("Finish", "finished")])
+        finished = properties.FinalState()
+
+    holder = StateHolder()
+    futures = []
+
+    def submit():
+        """Queue an event from another thread."""
+        futures.append(TestFSM(holder).submit("Finish"))
+
+    with TestFSM(holder):
+        worker = threading.Thread(target=submit)
+        worker.start()
+        worker.join()
+        with TestFSM(holder) as inner:
+            assert inner.submit("Start").result(timeout=1) is True
+        assert not futures[0].done()
+
+        worker = threading.Thread(target=submit)
+        worker.start()
+        worker.join()
+        assert len(futures) == 2
+
+    assert futures[0].result(timeout=1) is True
+    assert isinstance(futures[1].exception(timeout=1), Exception)
+    assert holder.current_state == "finished"
+    assert TestFSM(holder).lock.lock()
+    TestFSM(holder).lock.unlock()
+
+
+def test_slow_lock_does_not_stall_other_holders():
+    """Test that a holder whose backend lock is slow to come does not block events of other holders."""
+    entered, release = threading.Event(), threading.Event()
+
+    class SlowLock(MemoryLock):
+        """Memory lock slow to lock the first holder."""
+
+        def _acquire(self, hash_key):
+            """Wait for the test before locking the first holder."""
+            if hash_key.endswith("_pk_1"):
+                entered.set()
+                release.wait(5)
+            super()._acquire(hash_key)
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        mailbox = Mailbox()
+        lock_class = SlowLock
+
+        new = properties.State(events=[properties.Event("Start", "started")])
+        started = properties.State(events=[properties.Event("Finish", "finished")])
+        finished = properties.FinalState()
+
+    slow_holder, other_holder = StateHolder(), StateHolder()
+    slow_holder.id, other_holder.id = 1, 2
+    worker = threading.Thread(target=TestFSM(slow_holder).submit, args=("Start",))
+    worker.start()
+    try:
+        assert entered.wait(5)
+        assert TestFSM(other_holder).submit("Start").result(timeout=1) is True
+        queued = TestFSM(slow_holder).submit("Finish")
+        assert not queued.done()
+    finally:
+        release.set()
+        worker.join(5)
+
+    assert queued.result(timeout=1) is True
+    assert slow_holder.current_state == "finished"
+    assert TestFSM(slow_holder).lock.lock()
+    TestFSM(slow_holder).lock.unlock()
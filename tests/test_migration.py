@@ -0,0 +1,89 @@
+"""State migration tests."""
+import sqlite3
+from collections import namedtuple
+from unittest import mock
+
+import pytest
+
+from tests.example_fsm import ExampleCreditCardFSM, StateHolder
+from tuco.exceptions import TucoMigrationError
+from tuco.migration import StateMigration
+
+MAPPING = {"authorised": "capture_pending", "captured": "paid"}
+
+
+def test_mapping_is_validated():
+    """Test that targets must exist and cannot be migrated themselves."""
+    with pytest.raises(TucoMigrationError):
+        StateMigration(ExampleCreditCardFSM, {"authorised": "unknown"})
+    with pytest.raises(TucoMigrationError):
+        StateMigration(ExampleCreditCardFSM, {"authorised": "paid", "paid": "refunded"})
+
+
+def test_migrate_holders():
+    """Test that holders are migrated while streamed, including immutable ones."""
+    Row = namedtuple("Row", "id current_state current_state_date")
+    holder = StateHolder()
+    holder.current_state = "authorised"
+    holders = [holder, Row(2, "captured", None), Row(3, "new", None)]
+    reports = []
+
+    migration = StateMigration(ExampleCreditCardFSM, MAPPING, reset_date=True)
+    migrated = list(migration.migrate_holders(holders, chunk_size=2, progress=reports.append))
+
+    assert [item.current_state for item in migrated] == ["capture_pending", "paid", "new"]
+    assert migrated[0] is holder and holder.current_state_date is not None
+    assert migrated[2] is holders[2]
+    assert reports[-1].migrated == 2 and reports[-1].finished
+
+
+def test_migrate_table_resumes():
+    """Test that tables are migrated in committed chunks and that an interrupted migration resumes."""
+    connection = sqlite3.connect(":memory:")
+    # Without a declared type the id column has no affinity, so SQLite does not coerce a text id bound on resume:
+    # like Postgres, it would never match an integer id.
+    connection.execute("CREATE TABLE orders (id PRIMARY KEY, current_state TEXT, current_state_date TEXT)")
+    states = ["authorised", "captured", "new"]
+    connection.executemany(
+        "INSERT INTO orders VALUES (?, ?, NULL)", [(number, states[number % 3]) for number in range(1, 101)]
+    )
+    connection.commit()
+    migration = StateMigration(ExampleCreditCardFSM, MAPPING)
+
+    def interrupt(progress):
+        """Stop after the second chunk."""
+        if progress.migrated >= 20:
+            raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        migration.migrate_table(connection, "orders", chunk_size=10, progress=interrupt)
+    assert connection.execute("SELECT COUNT(*) FROM orders WHERE current_state = 'paid'").fetchone()[0] > 0
+
+    progress = migration.migrate_table(connection, "orders", chunk_size=10)
+    assert progress.finished
+    assert progress.migrated == 67
+    counts = dict(connection.execute("SELECT current_state, COUNT(*) FROM orders GROUP BY current_state"))
+    assert counts == {"capture_pending": 33, "paid": 34, "new": 33}
+    assert migration.migrate_table(connection, "orders").migrated == 67
+
+
+def test_migrate_table_checkpoint_types():
+    """Test that text ids are checkpointed as text and that ids of unsupported types fail before any update."""
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE orders (id PRIMARY KEY, current_state TEXT, current_state_date TEXT)")
+    connection.executemany("INSERT INTO orders VALUES (?, 'captured', NULL)", [("a",), ("b",), ("c",)])
+    connection.commit()
+    migration = StateMigration(ExampleCreditCardFSM, MAPPING)
+
+    with pytest.raises(KeyboardInterrupt):
+        migration.migrate_table(connection, "orders", chunk_size=1, progress=mock.Mock(side_effect=KeyboardInterrupt))
+    assert connection.execute("SELECT last_id FROM tuco_migrations").fetchone()[0] == "str:a"
+    progress = migration.migrate_table(connection, "orders", chunk_size=1)
+    assert progress.finished and progress.migrated == 3
+    assert dict(connection.execute("SELECT id, current_state FROM orders")) == {"a": "paid", "b": "paid", "c": "paid"}
+
+    connection.execute("INSERT INTO orders VALUES (1.5, 'captured', NULL)")
+    connection.commit()
+    with pytest.raises(TucoMigrationError):
+        StateMigration(ExampleCreditCardFSM, MAPPING, name="floats").migrate_table(connection, "orders", chunk_size=1)
+    assert connection.execute("SELECT current_state FROM orders WHERE id = 1.5").fetchone()[0] == "captured"
@@ -0,0 +1,174 @@
+"""Outbox tests."""
+import time
+from unittest import mock
+
+import pytest
+
+from tests.example_fsm import StateHolder
+from tuco import FSM, properties
+from tuco.outbox import MemoryOutbox, OutboxWorker, SQLiteOutbox
+
+sent_emails = []  # type: list
+
+
+def send_email(holder, template="default"):
+    """Importable command so it can be pickled."""
+    sent_emails.append((holder.id, holder.current_state, template))
+
+
+def test_deferred_commands():
+    """Test that deferred commands are recorded instead of executed inline."""
+    email = mock.Mock()
+    welcome = mock.Mock()
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        outbox = MemoryOutbox()
+
+        new = properties.State(
+            events=[properties.Event("Pay", "paid", commands=[properties.Deferred(email)])],
+            on_enter=[properties.Deferred(welcome)],
+        )
+        paid = properties.FinalState()
+
+    outbox = TestFSM.outbox
+    fsm = TestFSM(StateHolder())
+    assert fsm.trigger("Pay", "receipt")
+    assert fsm.current_state == "paid"
+    assert email.call_count == 0
+    assert welcome.call_count == 0
+    assert len(outbox) == 2
+
+    assert outbox.run_pending() == 2
+    welcome.assert_called_once_with(fsm.container_object)
+    email.assert_called_once_with(fsm.container_object, "receipt")
+    assert len(outbox) == 0
+
+
+def test_deferred_commands_discarded_on_failure():
+    """Test that deferred commands of a failed event are not recorded."""
+    email = mock.Mock()
+    error_email = mock.Mock()
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        outbox = MemoryOutbox()
+
+        new = properties.State(
+            events=[properties.Event("Pay", "paid", commands=[properties.Deferred(email), lambda holder: False])],
+            error=properties.Error("failed", commands=[properties.Deferred(error_email)]),
+        )
+        paid = properties.FinalState()
+        failed = properties.FinalState()
+
+    fsm = TestFSM(StateHolder())
+    assert fsm.trigger("Pay") is False
+    assert fsm.current_state == "failed"
+    assert TestFSM.outbox.run_pending() == 1
+    assert email.call_count == 0
+    error_email.assert_called_once_with(fsm.container_object)
+
+
+def test_deferred_without_outbox():
+    """Test that deferred commands run inline when there is no outbox."""
+    email = mock.Mock()
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        new = properties.State(events=[properties.Event("Pay", "paid", commands=[properties.Deferred(email)])])
+        paid = properties.FinalState()
+
+    fsm = TestFSM(StateHolder())
+    assert fsm.trigger("Pay")
+    email.assert_called_once_with(fsm.container_object)
+
+
+def test_retries():
+    """Test that failing entries are retried and then kept aside."""
+    command = mock.Mock(side_effect=[RuntimeError, None])
+    outbox = MemoryOutbox(max_attempts=2, retry_delay=0)
+    outbox.record(StateHolder(), [(command, (), {})])
+
+    assert outbox.run_pending() == 1
+    assert command.call_count == 2
+    assert len(outbox) == 0
+
+    outbox.record(StateHolder(), [(mock.Mock(side_effect=RuntimeError), (), {})])
+    assert outbox.run_pending() == 0
+    assert len(outbox) == 0
+    assert len(outbox.failed) == 1
+
+
+def test_sqlite_outbox(tmpdir):
+    """Test that entries survive in SQLite and are leased while running."""
+    path = str(tmpdir.join("outbox.db"))
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        outbox = SQLiteOutbox(path)
+
+        new = properties.State(
+            events=[properties.Event("Pay", "paid", commands=[properties.Deferred(send_email)])]
+        )
+        paid = properties.FinalState()
+
+    del sent_emails[:]
+    fsm = TestFSM(StateHolder())
+    assert fsm.trigger("Pay", template="receipt")
+
+    reopened = SQLiteOutbox(path, lease_time=60)
+    assert len(reopened) == 1
+    entries = reopened.claim(10)
+    assert len(entries) == 1
+    assert reopened.claim(10) == []
+
+    reopened.execute(entries[0])
+    assert sent_emails == [(1234, "paid", "receipt")]
+    assert len(reopened) == 0
+
+
+def test_outbox_worker():
+    """Test executing entries from a thread pool."""
+    outbox = MemoryOutbox()
+    command = mock.Mock()
+    outbox.record(StateHolder(), [(command, (), {}), (command, (), {})])
+
+    with OutboxWorker(outbox, workers=2, poll_interval=0.01):
+        deadline = time.time() + 5
+        while command.call_count < 2 and time.time() < deadline:
+            time.sleep(0.01)
+
+    assert command.call_count == 2
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_failed_record_keeps_state(compiled):
+    """Test that a failed outbox write restores the state and does not leak into the next transition."""
+    email = mock.Mock()
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        compile_fsm = compiled
+        outbox = MemoryOutbox()
+
+        new = properties.State(events=[properties.Event("Pay", "paid", commands=[properties.Deferred(email)])])
+        paid = properties.FinalState()
+
+    holder = StateHolder()
+    fsm = TestFSM(holder)
+    previous_date = holder.current_state_date
+    with mock.patch.object(TestFSM.outbox, "record", side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            fsm.trigger("Pay", "first")
+    assert fsm.current_state == "new"
+    assert holder.current_state_date == previous_date
+    assert fsm._deferred_commands == []
+
+    assert fsm.trigger("Pay", "second")
+    assert TestFSM.outbox.run_pending() == 1
+    email.assert_called_once_with(holder, "second")
@@ -0,0 +1,60 @@
+"""Partition coordinator tests."""
+from datetime import timedelta
+
+from tests.example_fsm import create_fsm_class, create_holder
+from tuco.partitions import PartitionCoordinator, SQLiteLeaseStore
+from tuco.timeout_stores import SQLiteTimeoutStore
+
+
+def test_partitions_are_shared_between_workers(tmpdir):
+    """Test that live workers lease disjoint partitions covering them all and rebalance when others join or leave."""
+    store = SQLiteLeaseStore(str(tmpdir.join("leases.db")))
+    fsm_class = create_fsm_class(None)
+    first = PartitionCoordinator(fsm_class, store, partitions=16, worker_id="first")
+    second = PartitionCoordinator(fsm_class, store, partitions=16, worker_id="second")
+
+    assert first.rebalance() == frozenset(range(16))
+    # Partitions of the newcomer are still leased by the first worker until it rebalances.
+    assert second.rebalance() == frozenset()
+    first.rebalance()
+    second.rebalance()
+    assert first.owned | second.owned == frozenset(range(16))
+    assert not first.owned & second.owned
+    assert first.owned and second.owned
+    assert store.owners(first.group, 16) == {
+        partition: worker.worker_id for worker in (first, second) for partition in worker.owned
+    }
+
+    moved = first.owned
+    first.leave()
+    assert second.rebalance() == frozenset(range(16))
+    assert moved <= second.owned
+
+
+def test_process_due_only_for_owned_holders(tmpdir):
+    """Test that every due timeout is triggered once by the worker owning the holder."""
+    timeout_store = SQLiteTimeoutStore(str(tmpdir.join("timeouts.db")))
+    lease_store = SQLiteLeaseStore(str(tmpdir.join("leases.db")))
+    fsm_class = create_fsm_class(timeout_store)
+    holders = {holder_id: create_holder(holder_id) for holder_id in range(1, 41)}
+    for holder in holders.values():
+        fsm = fsm_class(holder)
+        fsm.trigger("Wait")
+        holder.current_state_date -= timedelta(hours=2)
+        timeout_store.track(fsm)
+
+    workers = [PartitionCoordinator(fsm_class, lease_store, partitions=8, worker_id=str(n)) for n in range(3)]
+    for worker in workers + workers:
+        worker.rebalance()
+    loaded = []
+
+    def load_holders(holder_ids):
+        """Return holders from the in memory database."""
+        loaded.extend(holder_ids)
+        return [holders[holder_id] for holder_id in holder_ids]
+
+    triggered = [worker.process_due(timeout_store, load_holders, chunk_size=7) for worker in workers]
+    assert sum(triggered) == 40
+    assert all(triggered)
+    assert sorted(loaded) == sorted(holders)
+    assert list(timeout_store.due(fsm_class)) == []
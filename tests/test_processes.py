@@ -0,0 +1,99 @@
+"""Process runner tests."""
+import os
+import pickle
+from datetime import datetime, timedelta, timezone
+
+from tests.example_fsm import StateHolder, create_fsm_class, create_holder
+from tuco import FSM, properties
+from tuco.journal import JournalReader, TransitionJournal
+from tuco.processes import ProcessRunner
+from tuco.replay import TraceRecorder, TraceReplayer
+from tuco.timeout_stores import SQLiteTimeoutStore
+
+
+def render_invoice(holder):
+    """Fail for odd ids, remember the process the command ran in."""
+    holder.rendered_by = os.getpid()
+    return holder.id % 2 == 0
+
+
+class InvoiceFSM(FSM):
+    """Dumb class."""
+
+    new = properties.State(
+        events=[properties.Event("Render", "rendered", commands=[render_invoice], error=properties.Error("failed"))]
+    )
+    rendered = properties.FinalState()
+    failed = properties.FinalState()
+
+
+def test_classes_and_events_pickle_by_reference():
+    """Test that state machine classes and their events are pickled by reference, even local ones."""
+    event = InvoiceFSM.get_all_states()["new"].events[0]
+    assert pickle.loads(pickle.dumps(event)) is event
+    assert pickle.loads(pickle.dumps(InvoiceFSM)) is InvoiceFSM
+
+    class LocalFSM(InvoiceFSM):
+        """Dumb class."""
+
+    assert pickle.loads(pickle.dumps(LocalFSM)) is LocalFSM
+
+
+def test_process_runner_applies_outcomes():
+    """Test that transitions run in worker processes and their outcomes are applied to the holders."""
+    holders = []
+    for holder_id in range(1, 8):
+        holders.append(StateHolder())
+        holders[-1].id = holder_id
+
+    with ProcessRunner(InvoiceFSM, workers=2, chunk_size=3) as runner:
+        outcomes = runner.run(holders, "Render")
+
+    assert [outcome.holder for outcome in outcomes] == holders
+    assert [outcome.result for outcome in outcomes] == [holder_id % 2 == 0 for holder_id in range(1, 8)]
+    assert [holder.current_state for holder in holders] == ["failed", "rendered"] * 3 + ["failed"]
+    assert all(holder.current_state_date is not None for holder in holders)
+    assert not any(hasattr(holder, "rendered_by") for holder in holders)
+
+    with ProcessRunner(InvoiceFSM, workers=1) as runner:
+        [outcome] = runner.run([holders[0]], "Render")
+    assert outcome.error is not None
+    assert holders[0].current_state == "failed"
+
+
+def test_forked_workers_reopen_stores(tmpdir):
+    """Test that forked workers write through their own connections and files, buffered records are not repeated."""
+    store = SQLiteTimeoutStore(str(tmpdir.join("timeouts.db")))
+    transition_journal = TransitionJournal(str(tmpdir.join("journal")))
+    trace_recorder = TraceRecorder(str(tmpdir.join("trace.gz")))
+
+    class JournaledFSM(create_fsm_class(store)):
+        """Dumb class."""
+
+        journal = transition_journal
+        recorder = trace_recorder
+
+    JournaledFSM(create_holder(0)).trigger("Wait")
+    holders = [create_holder(holder_id) for holder_id in range(1, 6)]
+    with ProcessRunner(JournaledFSM, workers=2, chunk_size=2) as runner:
+        outcomes = runner.run(holders, "Wait")
+    transition_journal.flush()
+    trace_recorder.close()
+
+    assert [outcome.error for outcome in outcomes] == [None] * 5
+    later = datetime.now(timezone.utc) + timedelta(hours=2)
+    assert sorted(holder_id for chunk in store.due(JournaledFSM, later) for holder_id, _, _ in chunk) == list(range(6))
+
+    directory = str(tmpdir.join("journal"))
+    assert [record.holder_id for record in JournalReader(directory).records()] == [0, 0]
+    worker_ids = []
+    for name in os.listdir(directory):
+        if os.path.isdir(os.path.join(directory, name)):
+            worker_ids += [record.holder_id for record in JournalReader(os.path.join(directory, name)).records()]
+    assert sorted(worker_ids) == [1, 1, 2, 2, 3, 3, 4, 4, 5, 5]
+
+    assert [record["holder"] for record in TraceReplayer(str(tmpdir.join("trace.gz"))).records()] == [0]
+    worker_ids = []
+    for path in tmpdir.listdir("trace-*.gz"):
+        worker_ids += [record["holder"] for record in TraceReplayer(str(path)).records()]
+    assert sorted(worker_ids) == [1, 2, 3, 4, 5]
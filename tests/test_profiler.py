@@ -0,0 +1,51 @@
+"""Slow transition profiler tests."""
+import pstats
+import time
+
+from tests.example_fsm import StateHolder
+from tuco import FSM, properties
+from tuco.profiler import SlowTransitionProfiler
+
+
+def slow_command(holder):
+    """Take long enough to be captured."""
+    time.sleep(0.05)
+    return True
+
+
+def test_slow_sampled_transitions_are_captured(tmpdir):
+    """Test that sampled transitions over the threshold are kept in a bounded ring of captures."""
+    directory = str(tmpdir.join("captures"))
+    profiler = SlowTransitionProfiler(directory, threshold=0.02, sample_rate=1, max_captures=2)
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        new = properties.State(
+            events=[properties.Event("Slow", "slow", commands=[slow_command]), properties.Event("Fast", "fast")]
+        )
+        slow = properties.FinalState()
+        fast = properties.FinalState()
+
+    TestFSM.profiler = profiler
+    TestFSM(StateHolder()).trigger("Fast")
+    assert profiler.captures() == []
+
+    for holder_id in range(3):
+        holder = StateHolder()
+        holder.id = holder_id
+        assert TestFSM(holder).trigger("Slow")
+
+    captures = profiler.captures()
+    assert [capture["sequence"] for capture in captures] == [1, 2]
+    assert captures[-1]["holder"] == 2
+    assert (captures[-1]["event"], captures[-1]["from"], captures[-1]["to"]) == ("Slow", "new", "slow")
+    assert captures[-1]["phases"]["commands"] >= 0.05
+    assert pstats.Stats(captures[-1]["profile"]).total_tt > 0
+    assert profiler.slow_calls == 3
+
+    profiler = SlowTransitionProfiler(directory, threshold=0.02, sample_rate=0, max_captures=2)
+    TestFSM.profiler = profiler
+    TestFSM(StateHolder()).trigger("Slow")
+    assert profiler.slow_calls == 1
+    assert [capture["sequence"] for capture in profiler.captures()] == [1, 2]
@@ -0,0 +1,88 @@
+"""Record and replay tests."""
+import os
+from datetime import timedelta
+
+import pytest
+import pytz
+
+from tests.example_fsm import ExampleCreditCardFSM, StateHolder
+from tuco import properties
+from tuco.exceptions import TucoEventNotFoundError
+from tuco.replay import TraceRecorder, TraceReplayer
+from tuco.utils import fully_qualified_name
+
+
+def fail(holder):
+    """Command that does not succeed."""
+    return False
+
+
+class RecordedFSM(ExampleCreditCardFSM):
+    """Machine whose authorization fails."""
+
+    compile_fsm = True
+
+    authorisation_pending = properties.State(
+        events=[properties.Event("Authorize", "capture_pending", commands=[fail])],
+        error=properties.Error("state_error"),
+    )
+
+
+def test_record_and_replay(tmpdir):
+    """Test that recorded traffic replays without divergences and that definition changes are caught."""
+    path = os.path.join(str(tmpdir), "trace.jsonl.gz")
+    with TraceRecorder(path) as recorder:
+        RecordedFSM.recorder = recorder
+        try:
+            for holder_id in range(1, 6):
+                holder = StateHolder()
+                holder.id = holder_id
+                fsm = RecordedFSM(holder)
+                assert fsm.trigger("Initialize", holder_id, amount=10)
+                assert not fsm.trigger("Authorize")
+                with pytest.raises(TucoEventNotFoundError):
+                    fsm.trigger("Capture")
+        finally:
+            RecordedFSM.recorder = None
+
+    replayer = TraceReplayer(path, {fully_qualified_name(RecordedFSM): RecordedFSM})
+    records = list(replayer.records())
+    assert len(records) == 15
+    assert [record["outcome"] for record in records[:3]] == ["ok", "failed", "error"]
+    assert records[0]["args"] and records[1]["args"] is None
+    assert records[1]["to"] == "state_error"
+
+    report = replayer.replay()
+    assert report.calls == 15
+    assert not report.divergences
+    assert report.latency(0.99) is not None
+
+    class ChangedFSM(RecordedFSM):
+        """Authorization now ends in another state."""
+
+        authorisation_pending = properties.State(
+            events=[properties.Event("Authorize", "capture_pending", commands=[fail])],
+            error=properties.Error("event_error"),
+        )
+
+    report = TraceReplayer(path, {fully_qualified_name(RecordedFSM): ChangedFSM}).replay()
+    assert len(report.divergences) == 5
+    assert {divergence["replayed_to"] for divergence in report.divergences} == {"event_error"}
+
+
+def test_replay_timeouts(tmpdir):
+    """Test that fired timeouts are recorded and replayed as due."""
+    path = os.path.join(str(tmpdir), "trace.jsonl.gz")
+    holder = StateHolder()
+    fsm = ExampleCreditCardFSM(holder)
+    fsm.trigger("Initialize")
+    fsm.trigger("Authorize")
+    holder.current_state_date = (holder.current_state_date - timedelta(days=8)).replace(tzinfo=pytz.UTC)
+
+    with TraceRecorder(path) as recorder:
+        fsm.recorder = recorder
+        assert fsm.trigger_timeout()
+
+    report = TraceReplayer(path).replay(speed=1.0)
+    assert report.calls == 1
+    assert not report.divergences
@@ -0,0 +1,54 @@
+"""Simulation tests."""
+from datetime import timedelta
+
+import pytest
+
+from tests.example_fsm import ExampleCreditCardFSM
+from tuco import FSM, properties
+from tuco.exceptions import TucoEventNotFoundError
+from tuco.simulation import MarkovSimulator
+
+
+class ReminderFSM(FSM):
+    """Holders time out unless they answer."""
+
+    new = properties.State(events=[properties.Event("Send", "waiting")])
+    waiting = properties.State(
+        events=[properties.Event("Answer", "answered")], timeout=properties.Timeout(timedelta(minutes=10), "expired")
+    )
+    answered = properties.FinalState()
+    expired = properties.FinalState()
+
+
+def test_timeouts_follow_virtual_time():
+    """Test that holders nobody answers expire exactly after the timeout."""
+    report = MarkovSimulator(ReminderFSM, {}, seed=1).run(timedelta(minutes=30), initial={"waiting": 1000})
+
+    assert report.finals == {"expired": 1000}
+    assert report.timeouts == 1000
+    assert report.time_to_final(0.5) == timedelta(minutes=10)
+    assert report.time_to_final(1) == timedelta(minutes=10)
+    assert not report.occupancy
+
+
+def test_competing_events_and_arrivals():
+    """Test that events and timeouts share the population according to rates."""
+    simulator = MarkovSimulator(
+        ReminderFSM, {"new": {"Send": 600}, "waiting": {"Answer": 6}}, arrivals_per_hour=6000, seed=42
+    )
+    report = simulator.run(timedelta(hours=2))
+
+    assert 11000 < report.arrivals < 13000
+    answered, expired = report.finals["answered"], report.finals["expired"]
+    # One answer per 10 minutes on average, so about 63% answer before the 10 minutes timeout.
+    assert 0.55 < answered / (answered + expired) < 0.72
+    assert report.edges["waiting", "Answer", "answered"] == answered
+    assert report.throughput()["new", "Send", "waiting"] == pytest.approx(report.edges["new", "Send", "waiting"] / 2)
+    assert report.mean_occupancy["waiting"] > report.mean_occupancy["new"]
+    assert report.time_to_final(0.9) <= timedelta(minutes=12)
+
+
+def test_unknown_events_are_rejected():
+    """Test that rates must match the state machine definition."""
+    with pytest.raises(TucoEventNotFoundError):
+        MarkovSimulator(ExampleCreditCardFSM, {"new": {"Capture": 1}})
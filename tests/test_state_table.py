@@ -0,0 +1,84 @@
+"""State table tests."""
+from datetime import timedelta
+from unittest import mock
+
+from tests.example_fsm import ExampleCreditCardFSM
+from tuco import properties
+from tuco.decorators import on_change
+from tuco.state_table import StateTable
+
+
+def test_drive_rows():
+    """Test that unchanged state machines drive table rows."""
+    command = mock.Mock()
+
+    class TestFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        @on_change
+        def hacky_change_call(self, *args, **kwargs):
+            """Hacky way to check on change calls."""
+            command(self, *args, **kwargs)
+
+    table = StateTable(TestFSM, capacity=2)
+    for holder_id in range(1, 11):
+        table.append(holder_id)
+    assert len(table) == 10
+
+    fsms = [table.fsm(row) for row in range(len(table))]
+    assert table.count_by_state() == {"new": 10}
+    for fsm in fsms[:4]:
+        assert fsm.trigger("Initialize")
+    assert fsms[0].trigger("Authorize")
+
+    assert table.count_by_state() == {"new": 6, "authorisation_pending": 3, "capture_pending": 1}
+    (_, old_state, new_state) = command.call_args[0]  # pylint: disable=unsubscriptable-object
+    assert old_state.current_state == "authorisation_pending"
+    assert new_state.current_state == "capture_pending"
+    assert table.holder(table.find(1)).current_state == "capture_pending"
+
+    holder = table.holder(0)
+    holder.current_state_date -= timedelta(days=8)
+    assert table.fsm(0).trigger_timeout()
+    assert holder.current_state == "timeout_test"
+
+
+def test_deadline_commands_receive_the_row():
+    """Test that commands with a deadline change rows directly, their copies cannot be applied back."""
+
+    def authorize(holder):
+        """Check that the row itself is received."""
+        return holder.current_state == "authorisation_pending"
+
+    class TestFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        authorisation_pending = properties.State(
+            events=[properties.Event("Authorize", "capture_pending", commands=[authorize], deadline=5)]
+        )
+
+    table = StateTable(TestFSM)
+    table.append(1, "authorisation_pending")
+    assert table.fsm(0).trigger("Authorize")
+    assert table.get_state(0) == "capture_pending"
+
+
+def test_persistence(tmpdir):
+    """Test that a file backed table keeps its rows."""
+    path = str(tmpdir.join("orders.table"))
+    table = StateTable(ExampleCreditCardFSM, path, capacity=4)
+    for holder_id in range(100, 110):
+        table.append(holder_id)
+        table.fsm(len(table) - 1).trigger("Initialize")
+    date = table.holder(3).current_state_date
+    table.close()
+
+    table = StateTable(ExampleCreditCardFSM, path)
+    assert len(table) == 10
+    assert table.count_by_state() == {"authorisation_pending": 10}
+    assert table.holder(3).id == 103
+    assert table.holder(3).current_state_date == date
+    table.fsm(3).trigger("Authorize")
+    table.close()
+
+    assert StateTable(ExampleCreditCardFSM, path).holder(3).current_state == "capture_pending"
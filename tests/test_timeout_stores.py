@@ -0,0 +1,60 @@
+"""Timeout store tests."""
+from datetime import datetime, timedelta
+
+import pytz
+
+from tests.example_fsm import create_fsm_class, create_holder
+from tuco.timeout_stores import SQLiteTimeoutStore
+from tuco.utils import holder_hash
+
+
+def test_tracking(tmpdir):
+    """Test that due dates are upserted and deleted on transitions."""
+    store = SQLiteTimeoutStore(str(tmpdir.join("timeouts.db")))
+    fsm_class = create_fsm_class(store)
+    later = datetime.utcnow().replace(tzinfo=pytz.UTC) + timedelta(hours=2)
+
+    fsm = fsm_class(create_holder(1))
+    assert list(store.due(fsm_class, later)) == []
+
+    fsm.trigger("Wait")
+    [[(holder_id, state, due_at)]] = list(store.due(fsm_class, later))
+    assert (holder_id, state) == (1, "waiting")
+    assert due_at == fsm.current_state_date + timedelta(hours=1)
+    assert list(store.due(fsm_class)) == []
+
+    fsm.trigger("Finish")
+    assert list(store.due(fsm_class, later)) == []
+
+
+def test_process_due(tmpdir):
+    """Test streaming due timeouts in chunks and triggering them."""
+    store = SQLiteTimeoutStore(str(tmpdir.join("timeouts.db")))
+    fsm_class = create_fsm_class(store)
+    holders = {holder_id: create_holder(holder_id) for holder_id in range(1, 8)}
+    for holder in holders.values():
+        fsm_class(holder).trigger("Wait")
+    for holder_id in (1, 2, 3, 4, 5):
+        holders[holder_id].current_state_date -= timedelta(hours=2)
+        store.track(fsm_class(holders[holder_id]))
+
+    chunks = list(store.due(fsm_class, chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert sorted(holder_id for chunk in chunks for holder_id, _, _ in chunk) == [1, 2, 3, 4, 5]
+
+    even = [holder_id for holder_id in range(1, 6) if holder_hash(holder_id) % 2 == 0]
+    chunks = list(store.due(fsm_class, chunk_size=1, partitions=(2, {0})))
+    assert sorted(holder_id for chunk in chunks for holder_id, _, _ in chunk) == even
+    assert list(store.due(fsm_class, partitions=(2, set()))) == []
+
+    loaded = []
+
+    def load_holders(holder_ids):
+        """Return holders from the in memory database."""
+        loaded.append(holder_ids)
+        return [holders[holder_id] for holder_id in holder_ids]
+
+    assert store.process_due(fsm_class, load_holders, chunk_size=2) == 5
+    assert [len(holder_ids) for holder_ids in loaded] == [2, 2, 1]
+    assert [holders[holder_id].current_state for holder_id in sorted(holders)] == ["expired"] * 5 + ["waiting"] * 2
+    assert list(store.due(fsm_class)) == []
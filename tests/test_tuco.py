@@ -11,7 +11,12 @@ import pytz
 from tests.example_fsm import ExampleCreditCardFSM, StateHolder
 from tuco import FSM, properties
 from tuco.decorators import on_change, on_error
-from tuco.exceptions import TucoAlreadyLockedError, TucoEventNotFoundError, TucoInvalidStateChangeError
+from tuco.exceptions import (
+    TucoAlreadyLockedError,
+    TucoCommandTimeoutError,
+    TucoEventNotFoundError,
+    TucoInvalidStateChangeError,
+)
 from tuco.locks import RedisLock
 
 
@@ -445,3 +450,234 @@ def test_fatal_error():
     assert fsm.current_state == "new"
     fsm.current_state = fsm.fatal_state
     assert fsm.current_state == fsm.fatal_state
+
+
+def test_run_events():
+    """Test running a sequence of events with a single coalesced on change call."""
+    command = mock.Mock()
+    capture = mock.Mock(return_value=True)
+
+    class TestFSM(ExampleCreditCardFSM):
+        """Dumb class."""
+
+        @on_change
+        def hacky_change_call(self, *args, **kwargs):
+            """Hacky way to check on change calls."""
+            command(self, *args, **kwargs)
+
+    fsm = TestFSM(StateHolder())
+    assert fsm.run_events(["Initialize", "Authorize"])
+    assert fsm.current_state == "capture_pending"
+    assert command.call_count == 1
+    (_, old_state, new_state) = command.call_args[0]  # pylint: disable=unsubscriptable-object
+    assert old_state.current_state == "new"
+    assert new_state.current_state == "capture_pending"
+
+    command.reset_mock()
+    with pytest.raises(TucoEventNotFoundError):
+        fsm.run_events(["Capture", "Initialize"])
+    assert fsm.current_state == "capture_pending"
+    assert command.call_count == 0
+
+    fsm = TestFSM(StateHolder())
+    assert fsm.run_events(["Initialize", "Authorize"], on_change_per_step=True)
+    assert command.call_count == 2
+
+    class CommandFSM(FSM):
+        """Dumb class."""
+
+        new = properties.State(events=[properties.Event("Start", "started")])
+        started = properties.State(events=[properties.Event("Capture", "paid", commands=[capture])])
+        paid = properties.FinalState()
+
+    fsm = CommandFSM(StateHolder())
+    assert fsm.run_events(["Start", ("Capture", (10,), {"currency": "EUR"})])
+    capture.assert_called_once_with(fsm.container_object, 10, currency="EUR")
+
+
+def test_run_events_stops_on_failure():
+    """Test that a failing step routes to its error and stops the sequence."""
+    command = mock.Mock()
+    never_called = mock.Mock()
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        @on_change
+        def hacky_change_call(self, *args, **kwargs):
+            """Hacky way to check on change calls."""
+            command(self, *args, **kwargs)
+
+        new = properties.State(events=[properties.Event("Start", "started")])
+        started = properties.State(
+            events=[properties.Event("Fail", "finished", commands=[lambda holder: False])],
+            error=properties.Error("failed"),
+        )
+        finished = properties.State(events=[properties.Event("Close", "closed", commands=[never_called])])
+        failed = properties.FinalState()
+        closed = properties.FinalState()
+
+    fsm = TestFSM(StateHolder())
+    assert fsm.run_events(["Start", "Fail", "Close"]) is False
+    assert fsm.current_state == "failed"
+    assert never_called.call_count == 0
+    assert command.call_count == 1
+    (_, old_state, new_state) = command.call_args[0]  # pylint: disable=unsubscriptable-object
+    assert old_state.current_state == "new"
+    assert new_state.current_state == "failed"
+
+
+def test_command_deadline():
+    """Test that a command running past its event deadline is routed to the error state."""
+    command = mock.Mock()
+    release = threading.Event()
+    after_hang = mock.Mock()
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        @on_error
+        def hacky_error_call(self, *args, **kwargs):
+            """Hacky way to check on error calls."""
+            command(self, *args, **kwargs)
+
+        new = properties.State(
+            events=[
+                properties.Event(
+                    "Pay",
+                    "paid",
+                    commands=[lambda holder: release.wait(), after_hang],
+                    error=properties.Error("payment_error"),
+                    deadline=0.05,
+                ),
+                properties.Event("Fail", "paid", commands=[mock.Mock(side_effect=NotADirectoryError)], deadline=1),
+            ]
+        )
+        paid = properties.FinalState()
+        payment_error = properties.FinalState()
+
+    fsm = TestFSM(StateHolder())
+    with pytest.raises(NotADirectoryError):
+        fsm.trigger("Fail")
+    assert fsm.current_state == "new"
+
+    command.reset_mock()
+    assert fsm.trigger("Pay") is False
+    release.set()
+    assert fsm.current_state == "payment_error"
+    assert after_hang.call_count == 0
+    (_, old_state, new_state, exception) = command.call_args[0]  # pylint: disable=unsubscriptable-object
+    assert old_state == "new"
+    assert new_state == "paid"
+    assert isinstance(exception, TucoCommandTimeoutError)
+
+
+def test_late_command_cannot_change_holder():
+    """Test that a command finishing after its deadline cannot touch the holder routed to the error state."""
+    release, finished = threading.Event(), threading.Event()
+
+    def late_command(holder):
+        """Change the holder once the deadline passed."""
+        release.wait()
+        holder.current_state = "paid"
+        holder.note = "charged"
+        finished.set()
+        return True
+
+    def quick_command(holder):
+        """Change the holder in time."""
+        holder.note = "quick"
+        return True
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        new = properties.State(
+            events=[
+                properties.Event(
+                    "Pay", "paid", commands=[late_command], error=properties.Error("payment_error"), deadline=0.05
+                ),
+                properties.Event("Note", "paid", commands=[quick_command], deadline=1),
+            ]
+        )
+        paid = properties.FinalState()
+        payment_error = properties.FinalState()
+
+    holder = StateHolder()
+    fsm = TestFSM(holder)
+    assert fsm.trigger("Pay") is False
+    release.set()
+    assert finished.wait(5)
+    assert holder.current_state == "payment_error"
+    assert not hasattr(holder, "note")
+
+    holder = StateHolder()
+    fsm = TestFSM(holder)
+    assert fsm.trigger("Note")
+    assert fsm.container_object is holder
+    assert holder.note == "quick"
+    assert holder.current_state == "paid"
+
+
+def test_hung_commands_keep_threads_of_their_class_only():
+    """Test that commands past their deadline only keep threads of their own state machine class."""
+    release = threading.Event()
+
+    class HangingFSM(FSM):
+        """Dumb class."""
+
+        command_workers = 1
+
+        new = properties.State(
+            events=[properties.Event("Pay", "paid", commands=[lambda holder: release.wait()], deadline=0.05)],
+            error=properties.Error("payment_error"),
+        )
+        paid = properties.FinalState()
+        payment_error = properties.FinalState()
+
+    class QuickFSM(HangingFSM):
+        """Dumb class."""
+
+        new = properties.State(
+            events=[properties.Event("Pay", "paid", commands=[lambda holder: True], deadline=1)],
+            error=properties.Error("payment_error"),
+        )
+
+    try:
+        assert HangingFSM(StateHolder()).trigger("Pay") is False
+        assert HangingFSM(StateHolder()).trigger("Pay") is False
+        assert QuickFSM(StateHolder()).trigger("Pay")
+    finally:
+        release.set()
+
+
+def test_timeout_deadline():
+    """Test that timeout commands running past their deadline go to the state error."""
+    release = threading.Event()
+
+    class TestFSM(FSM):
+        """Dumb class."""
+
+        initial_state = "new"
+
+        new = properties.State(events=[properties.Event("Wait", "waiting")])
+        waiting = properties.State(
+            timeout=properties.Timeout(
+                timedelta(days=1), "expired", commands=[lambda holder: release.wait()], deadline=0.05
+            ),
+            error=properties.Error("stuck"),
+        )
+        expired = properties.FinalState()
+        stuck = properties.FinalState()
+
+        @property
+        def current_state_date(self):
+            """Database always send time zone aware dates but not in tests."""
+            return getattr(self.container_object, self.date_attribute).replace(tzinfo=pytz.UTC)
+
+    fsm = TestFSM(StateHolder())
+    fsm.trigger("Wait")
+    fsm.container_object.current_state_date -= timedelta(days=2)
+    assert fsm.trigger_timeout() is False
+    release.set()
+    assert fsm.current_state == "stuck"